@@ -0,0 +1,77 @@
+"""
+Import time of the worker, measured with python -X importtime in fresh interpreters.
+
+Reports the total time to import the module (main by default, what a worker loads before it accepts
+traffic), the modules with the highest own import time and the top-level packages with the highest
+cumulative one. Every run is a new process, the best of --repeat runs is kept to leave out a cold disk cache.
+Exits with status 1 when the total exceeds --budget, so a new eager import of a heavy package fails the check.
+
+Usage:
+    python benchmarks/imports.py --budget 4.0
+    python benchmarks/imports.py --module tools.weather.agent --top 30
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+
+def measure(module: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Returns:
+        The (module, depth, own microseconds, cumulative microseconds) of every import, in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR, env={**os.environ, "PYTHONPATH": SRC_DIR}, capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(own), int(cumulative)))
+    return imports
+
+
+def get_package_times(imports: List[Tuple[str, int, int, int]]) -> Dict[str, int]:
+    packages: Dict[str, int] = defaultdict(int)
+    for name, _, own, _ in imports:
+        packages[name.split(".")[0]] += own
+    return packages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import")
+    parser.add_argument("--top", type=int, default=15, help="Modules and packages to list")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs, the fastest one is reported")
+    parser.add_argument("--budget", type=float, help="Fail above this total import time (s)")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    imports = min(runs, key=lambda run: sum(own for _, _, own, _ in run))
+    total = sum(own for _, _, own, _ in imports) / 1e6
+
+    print(f"import {args.module}: {total:.3f} s, {len(imports)} modules (best of {args.repeat})")
+    print(f"\n{'own ms':>8} {'cumulative ms':>14}  module")
+    for name, _, own, cumulative in sorted(imports, key=lambda i: i[2], reverse=True)[:args.top]:
+        print(f"{own / 1000:8.1f} {cumulative / 1000:14.1f}  {name}")
+    print(f"\n{'ms':>8} {'share':>6}  package")
+    for package, own in sorted(get_package_times(imports).items(), key=lambda p: p[1], reverse=True)[:args.top]:
+        print(f"{own / 1000:8.1f} {own / 1e4 / total:5.1f}%  {package}")
+
+    if args.budget is not None and total > args.budget:
+        print(f"\nFAIL: import time {total:.3f} s > budget {args.budget:.3f} s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
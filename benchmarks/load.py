@@ -0,0 +1,385 @@
+"""
+Offline load test of a worker: N concurrent simulated users chatting with a fake streaming model.
+
+Every user opens a session like main.start_chat, then sends turns through the same path as main.handle_message
+(get_question_from_message_async and process_user_task). The first turn of every user attaches a synthetic
+upload, cycling over the MIME_MAP formats. The fake model streams its answers token by token with the given
+first-token latency and rate, so no network or AWS credentials are needed.
+
+Reports turn throughput, p50/p99 time to first token and turn time, UI updates sent, event loop lag and peak RSS.
+Exits with status 1 when a --max-* threshold is exceeded, so it can gate releases.
+
+Usage:
+    python benchmarks/load.py --users 50 --turns 3 --max-p99-ttft 2.5
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import itertools
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+# Everything the benchmark writes goes to a temporary directory removed when it ends: the document store, the
+# uploads, and the .chainlit config and .files directory chainlit creates in its app root on import
+WORK_DIR = tempfile.TemporaryDirectory(prefix="load-")
+os.environ.setdefault("DOCUMENT_STORE_DIR", os.path.join(WORK_DIR.name, "store"))
+os.environ.setdefault("CHAINLIT_APP_ROOT", WORK_DIR.name)
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import chainlit  # noqa: E402
+from strands.models import Model  # noqa: E402
+from strands.types.exceptions import ModelThrottledException  # noqa: E402
+
+import modules.cl  # noqa: E402
+from modules.cl import LoggingHooks, get_agent, get_orchestrator_tools, process_user_task  # noqa: E402
+from modules.ingestion import get_question_from_message_async  # noqa: E402
+from modules.prompts import MAIN_SYSTEM_PROMPT  # noqa: E402
+from modules.ratelimit import rate_limiter  # noqa: E402
+from modules.retrieval import BM25Index  # noqa: E402
+from modules.tokens import estimate_messages_tokens  # noqa: E402
+from modules.warmup import warm_up  # noqa: E402
+from settings import MIME_MAP  # noqa: E402
+
+WORDS = ("revenue margin region quarter growth forecast customer contract supplier inventory report "
+         "analysis budget cost sales target market product service team result").split()
+
+
+class FakeStreamingModel(Model):
+    """
+    Streams a text answer with a first-token latency and a token rate, reporting the usage Bedrock would.
+
+    A throttle_ratio of the requests are throttled and a slow_start_ratio of them start ten times slower.
+    """
+
+    def __init__(
+            self,
+            ttft: float,
+            tokens_per_second: float,
+            answer_tokens: int,
+            throttle_ratio: float = 0.0,
+            slow_start_ratio: float = 0.0,
+            seed: int = 0,
+    ):
+        self.config = {"model_id": "fake"}
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.throttle_ratio = throttle_ratio
+        self.slow_start_ratio = slow_start_ratio
+        self.rng = random.Random(seed)
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        input_tokens = estimate_messages_tokens(messages)
+        if self.rng.random() < self.throttle_ratio:
+            raise ModelThrottledException("Too many requests, please wait before trying again.")
+        # Jittered latencies, the first token also grows with the size of the request like a real prefill
+        ttft = self.ttft * (10 if self.rng.random() < self.slow_start_ratio else 1)
+        await asyncio.sleep(ttft * self.rng.uniform(0.7, 1.3) + input_tokens / 1_000_000)
+        yield {"messageStart": {"role": "assistant"}}
+        delay = 1 / self.tokens_per_second
+        for i in range(self.answer_tokens):
+            yield {"contentBlockDelta": {"delta": {"text": f"{self.rng.choice(WORDS)} "}}}
+            if i % 8 == 7:
+                await asyncio.sleep(delay * 8 * self.rng.uniform(0.5, 1.5))
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {
+            "usage": {"inputTokens": input_tokens, "outputTokens": self.answer_tokens,
+                      "totalTokens": input_tokens + self.answer_tokens},
+            "metrics": {"latencyMs": 0}}}
+
+
+@dataclass
+class SessionStats:
+    turn_started: float = 0.0
+    first_tokens: List[float] = field(default_factory=list)
+    turn_times: List[float] = field(default_factory=list)
+    updates: int = 0
+    first_token: Optional[float] = None
+
+
+session_var: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("session")
+stats_var: contextvars.ContextVar[SessionStats] = contextvars.ContextVar("stats")
+
+
+class FakeUserSession:
+    def get(self, key: str, default: Any = None) -> Any:
+        return session_var.get().get(key, default)
+
+    def set(self, key: str, value: Any) -> None:
+        session_var.get()[key] = value
+
+
+class FakeMessage:
+    def __init__(self, content: str = "", **kwargs: Any):
+        self.content = content
+
+    async def send(self) -> "FakeMessage":
+        return self
+
+    async def update(self) -> None:
+        pass
+
+    async def stream_token(self, token: str) -> None:
+        stats = stats_var.get()
+        stats.updates += 1
+        if stats.first_token is None and not token.startswith("_Estimated input"):
+            stats.first_token = time.perf_counter()
+        self.content += token
+
+
+class FakeStep(FakeMessage):
+    def __init__(self, name: str = "", type: str = "", **kwargs: Any):
+        super().__init__()
+        self.name = name
+        self.input = ""
+        self.output = ""
+
+    async def stream_token(self, token: str) -> None:
+        stats_var.get().updates += 1
+
+
+@dataclass
+class Upload:
+    type: str
+    mime: str
+    path: str
+    name: str
+
+
+def make_zip(files: Dict[str, str]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+
+def make_document(fmt: str, size: int, rng: random.Random) -> bytes:
+    """
+    Builds a synthetic upload of about size bytes of text in the given Bedrock format.
+    """
+    def sentence() -> str:
+        return " ".join(rng.choice(WORDS) for _ in range(12)).capitalize() + "."
+
+    paragraphs = []
+    while sum(len(p) for p in paragraphs) < size:
+        paragraphs.append(" ".join(sentence() for _ in range(5)))
+    rows = [(rng.choice(WORDS), rng.randint(1, 10_000), round(rng.uniform(0, 100), 2)) for _ in range(size // 24)]
+
+    if fmt in ("txt", "md"):
+        return "\n\n".join(f"# Section {i}\n\n{p}" if fmt == "md" and i % 10 == 0 else p
+                           for i, p in enumerate(paragraphs)).encode()
+    if fmt == "csv":
+        return ("name,units,share\n" + "\n".join(f"{a},{b},{c}" for a, b, c in rows)).encode()
+    if fmt == "html":
+        body = "".join(f"<p>{p}</p>" for p in paragraphs)
+        return f"<html><head><title>Report</title></head><body>{body}</body></html>".encode()
+    if fmt == "docx":
+        w = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+        body = "".join(f"<w:p><w:r><w:t>{p}</w:t></w:r></w:p>" for p in paragraphs)
+        return make_zip({"word/document.xml": f'<w:document xmlns:w="{w}"><w:body>{body}</w:body></w:document>'})
+    if fmt == "xlsx":
+        main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+        rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+        sheet = "".join(
+            f'<row r="{i + 1}"><c t="inlineStr"><is><t>{a}</t></is></c><c><v>{b}</v></c><c><v>{c}</v></c></row>'
+            for i, (a, b, c) in enumerate(rows))
+        return make_zip({
+            "xl/workbook.xml": (f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>'
+                                f'<sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+            "xl/_rels/workbook.xml.rels": (
+                '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'),
+            "xl/worksheets/sheet1.xml": f'<worksheet xmlns="{main}"><sheetData>{sheet}</sheetData></worksheet>',
+        })
+    if fmt == "pdf":
+        pages = "".join(f"{i + 3} 0 obj << /Type /Page /Parent 2 0 R >> stream\n{p}\nendstream endobj\n"
+                        for i, p in enumerate(paragraphs[::4]))
+        return f"%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n2 0 obj << /Type /Pages >> endobj\n{pages}%%EOF".encode()
+    # doc and xls are sent raw, their content does not matter
+    return rng.randbytes(size)
+
+
+@dataclass
+class UserMessage:
+    content: str
+    elements: List[Upload]
+
+
+def make_upload(fmt: str, size: int, rng: random.Random, upload_root: Path) -> Upload:
+    mime = next(mime for mime, value in MIME_MAP.items() if value == fmt)
+    file = Path(tempfile.mkdtemp(dir=upload_root)) / f"upload.{fmt}"
+    file.write_bytes(make_document(fmt, size, rng))
+    return Upload(type="file", mime=mime, path=str(file), name=f"upload_{fmt}.{fmt}")
+
+
+async def monitor_loop(lags: List[float], rss: List[int], stop: asyncio.Event, interval: float = 0.01):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(loop.time() - expected, 0.0))
+        rss.append(get_rss())
+
+
+def get_rss() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def simulate_user(user: int, args: argparse.Namespace, upload: Upload) -> SessionStats:
+    session_var.set({"id": f"session-{user}"})
+    stats = SessionStats()
+    stats_var.set(stats)
+    rng = random.Random(user)
+
+    # Same session setup as main.start_chat
+    chainlit.user_session.set("agent", get_agent(
+        system_prompt=MAIN_SYSTEM_PROMPT, hooks=[LoggingHooks()], tools=get_orchestrator_tools()))
+    chainlit.user_session.set("document_index", BM25Index())
+
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    for turn in range(args.turns):
+        message = UserMessage(content=f"Question {turn} about the document", elements=[upload] if turn == 0 else [])
+
+        stats.turn_started, stats.first_token = time.perf_counter(), None
+        # Same path as main.handle_message
+        await process_user_task(question=await get_question_from_message_async(message), debug=False)
+        ended = time.perf_counter()
+
+        stats.turn_times.append(ended - stats.turn_started)
+        if stats.first_token is not None:
+            stats.first_tokens.append(stats.first_token - stats.turn_started)
+        await asyncio.sleep(rng.uniform(0, args.think_time))
+    return stats
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1] if len(values) > 1 else values[0]
+
+
+async def run(args: argparse.Namespace) -> int:
+    formats = args.formats.split(",") if args.formats else sorted(set(MIME_MAP.values()))
+    chainlit.user_session = FakeUserSession()
+    chainlit.Message = FakeMessage
+    chainlit.Step = FakeStep
+    # Every agent gets its own model, seeded apart so their requests are not all throttled alike
+    seeds = itertools.count()
+    modules.cl.get_bedrock_model = lambda **kwargs: FakeStreamingModel(
+        ttft=args.ttft, tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens,
+        throttle_ratio=args.throttle_ratio, slow_start_ratio=args.slow_start_ratio, seed=next(seeds))
+
+    # Uploads are generated before the clock starts, they are not part of the load of the worker
+    upload_root = Path(WORK_DIR.name) / "uploads"
+    upload_root.mkdir()
+    uploads = [make_upload(formats[user % len(formats)], args.document_kb * 1024, random.Random(user), upload_root)
+               for user in range(args.users)]
+    if args.warm_up:
+        with contextlib.redirect_stdout(io.StringIO()):
+            warm_up()
+    lags, rss = [], []
+    stop = asyncio.Event()
+    baseline_rss = get_rss()
+    monitor = asyncio.create_task(monitor_loop(lags, rss, stop))
+
+    started = time.perf_counter()
+    # The agents print their streams to stdout with the default strands callback handler
+    with contextlib.redirect_stdout(io.StringIO()):
+        sessions = await asyncio.gather(*(simulate_user(user, args, uploads[user]) for user in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await monitor
+    shutil.rmtree(upload_root, ignore_errors=True)
+
+    turns = sum(len(s.turn_times) for s in sessions)
+    first_tokens = [t for s in sessions for t in s.first_tokens]
+    turn_times = [t for s in sessions for t in s.turn_times]
+    peak_rss = max(rss, default=baseline_rss)
+    results = {
+        "p99_ttft": percentile(first_tokens, 99),
+        "p99_loop_lag": percentile(lags, 99),
+        "rss_per_session": (peak_rss - baseline_rss) / args.users,
+    }
+
+    print(f"users {args.users}, turns {turns}, formats {','.join(formats)}, {args.document_kb} KB uploads")
+    print(f"{'throughput':<22} {turns / elapsed:10.2f} turns/s, {turns * args.answer_tokens / elapsed:,.0f} tokens/s")
+    print(f"{'time to first token':<22} p50 {percentile(first_tokens, 50):7.3f}s  p99 {results['p99_ttft']:7.3f}s")
+    print(f"{'turn time':<22} p50 {percentile(turn_times, 50):7.3f}s  p99 {percentile(turn_times, 99):7.3f}s")
+    print(f"{'UI updates':<22} {sum(s.updates for s in sessions) / turns:10.1f} per turn "
+          f"for {args.answer_tokens} tokens")
+    print(f"{'event loop lag':<22} p50 {percentile(lags, 50) * 1000:7.1f}ms p99 {results['p99_loop_lag'] * 1000:7.1f}ms "
+          f"max {max(lags, default=0) * 1000:.1f}ms")
+    print(f"{'RSS':<22} peak {peak_rss / 2 ** 20:7.1f} MB, {results['rss_per_session'] / 2 ** 20:.2f} MB per session "
+          f"(max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB)")
+
+    limiter = rate_limiter.stats()
+    print(f"{'rate limiter':<22} {limiter['rate']:10.2f} requests/s, {limiter['throttles']} throttles, "
+          f"{limiter['waits']} waits, {limiter['hedge_wins']}/{limiter['hedges']} hedges won")
+
+    failures = [f"{name} {value:.3f} > {limit}" for name, value, limit in (
+        ("p99 time to first token", results["p99_ttft"], args.max_p99_ttft),
+        ("p99 event loop lag", results["p99_loop_lag"], args.max_p99_loop_lag),
+        ("RSS per session MB", results["rss_per_session"] / 2 ** 20, args.max_rss_per_session_mb),
+    ) if limit is not None and value > limit]
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=20, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=3, help="Turns per user, the first one with an upload")
+    parser.add_argument("--formats", default="", help="Comma separated upload formats, all of MIME_MAP by default")
+    parser.add_argument("--document-kb", type=int, default=200, help="Size of the synthetic uploads")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Model first token latency in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="Model output token rate")
+    parser.add_argument("--answer-tokens", type=int, default=200, help="Tokens of every answer")
+    parser.add_argument("--throttle-ratio", type=float, default=0.0, help="Ratio of throttled model requests")
+    parser.add_argument("--slow-start-ratio", type=float, default=0.0,
+                        help="Ratio of model requests with a ten times slower first token")
+    parser.add_argument("--ramp-up", type=float, default=1.0, help="Seconds over which the users start")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Maximum pause between turns")
+    parser.add_argument("--warm-up", action="store_true", help="Warm the worker up before the clock starts")
+    parser.add_argument("--max-p99-ttft", type=float, help="Fail above this p99 time to first token (s)")
+    parser.add_argument("--max-p99-loop-lag", type=float, help="Fail above this p99 event loop lag (s)")
+    parser.add_argument("--max-rss-per-session-mb", type=float, help="Fail above this RSS growth per session")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    try:
+        sys.exit(asyncio.run(run(args)))
+    finally:
+        WORK_DIR.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Benchmark of the session retrieval index: build time and query latency on large documents.
+
+Usage:
+    python benchmarks/retrieval.py
+"""
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.retrieval import BM25Index, get_passages  # noqa: E402
+
+WORDS_PER_PAGE = 500
+QUERIES = 200
+
+
+def make_document(pages: int, vocabulary: list[str], rng: random.Random) -> str:
+    return "\n\n".join(
+        f"Page {page}. " + " ".join(rng.choices(vocabulary, k=WORDS_PER_PAGE)) for page in range(pages))
+
+
+def main():
+    rng = random.Random(42)
+    vocabulary = [f"term{i}" for i in range(5000)]
+
+    print(f"{'pages':>6} {'MB':>6} {'passages':>9} {'build s':>8} {'query p50 ms':>13} {'query p99 ms':>13}")
+    for pages in (100, 250, 500, 1000):
+        text = make_document(pages, vocabulary, rng)
+
+        started = time.perf_counter()
+        index = BM25Index()
+        index.add("document", get_passages(text, "txt"))
+        build_time = time.perf_counter() - started
+
+        latencies = []
+        for _ in range(QUERIES):
+            query = " ".join(rng.choices(vocabulary, k=4))
+            started = time.perf_counter()
+            index.search(query, top_k=5)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        latencies.sort()
+        print(f"{pages:>6} {len(text) / 1024 / 1024:>6.1f} {len(index):>9} {build_time:>8.3f} "
+              f"{statistics.median(latencies):>13.3f} {latencies[int(len(latencies) * 0.99) - 1]:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
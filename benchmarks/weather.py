@@ -0,0 +1,65 @@
+"""
+Benchmark of the Open-Meteo response parser over long date ranges.
+
+Compares the previous per-hour parser (list.index lookups and six pydantic readings per hour) with the
+columnar MeteoSeries, with and without building its pydantic view.
+
+Usage:
+    python benchmarks/weather.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.weather.models import (  # noqa: E402
+    METEO_VARIABLES, MeteoData, MeteoSeries)
+
+
+def make_hourly(days: int) -> dict:
+    rng = random.Random(42)
+    start = datetime(2024, 1, 1)
+    hours = days * 24
+    return {
+        "time": [(start + timedelta(hours=h)).isoformat(timespec='minutes') for h in range(hours)],
+        "temperature_2m": [round(rng.uniform(-5, 35), 1) for _ in range(hours)],
+        "relative_humidity_2m": [rng.randint(20, 100) for _ in range(hours)],
+        "apparent_temperature": [round(rng.uniform(-8, 38), 1) for _ in range(hours)],
+        "precipitation": [round(rng.uniform(0, 5), 1) for _ in range(hours)],
+        "evapotranspiration": [round(rng.uniform(0, 0.5), 2) for _ in range(hours)],
+        "surface_pressure": [round(rng.uniform(990, 1030), 1) for _ in range(hours)],
+    }
+
+
+def legacy_parse(hourly: dict) -> MeteoData:
+    meteo = MeteoData(**{field: [] for field in METEO_VARIABLES})
+    for iso in hourly['time']:
+        time = datetime.fromisoformat(iso)
+        for field, (variable, reading) in METEO_VARIABLES.items():
+            getattr(meteo, field).append(reading(time=time, value=hourly[variable][hourly['time'].index(iso)]))
+    return meteo
+
+
+def measure(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    print(f"{'days':>5} {'hours':>6} {'legacy s':>9} {'columnar s':>11} {'+ pydantic s':>13} {'csv s':>7}")
+    for days in (7, 31, 365, 730):
+        hourly = make_hourly(days)
+        legacy = measure(legacy_parse, hourly) if days <= 365 else float("nan")
+        columnar = measure(MeteoSeries.from_open_meteo, hourly)
+        series = MeteoSeries.from_open_meteo(hourly)
+        pydantic = measure(lambda: series.meteo_data)
+        csv = measure(series.to_csv)
+        print(f"{days:>5} {days * 24:>6} {legacy:>9.3f} {columnar:>11.4f} {pydantic:>13.3f} {csv:>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 from chainlit.utils import mount_chainlit
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import PlainTextResponse, RedirectResponse
+
+from modules.admission import admission_scheduler
+from modules.answer_cache import answer_cache
+from modules.cache import document_cache
+from modules.cancellation import cancellation_stats
+from modules.metrics import registry
+from modules.prompt_cache import prompt_cache_stats
+from modules.ratelimit import rate_limiter
+from modules.replay import get_cassette
+from modules.store import document_store
+from modules.warmup import warm_up
+from settings import APP_ID, MODEL_BACKEND, ModelBackend, WARMUP
+from tools.weather.cache import weather_cache
+
 
-from settings import APP_ID
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The lifespan of the mounted Chainlit app does not run, so its on_app_startup neither
+    if WARMUP:
+        await asyncio.to_thread(warm_up)
+    yield
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+registry.add_stats("admission", admission_scheduler.stats)
+registry.add_stats("answer_cache", answer_cache.stats)
+registry.add_stats("cancellation", cancellation_stats.stats)
+registry.add_stats("document_cache", document_cache.stats)
+registry.add_stats("document_store", document_store.stats)
+registry.add_stats("prompt_cache", prompt_cache_stats.stats)
+registry.add_stats("rate_limiter", rate_limiter.stats)
+registry.add_stats("weather_cache", weather_cache.stats)
+if MODEL_BACKEND != ModelBackend.BEDROCK:
+    registry.add_stats("recordings", get_cassette().stats)
 
 @app.get("/")
 async def root():
     return RedirectResponse(url=f"/{APP_ID}")
 
-mount_chainlit(app=app, target="main.py", path=f"/{APP_ID}")
\ No newline at end of file
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+mount_chainlit(app=app, target="main.py", path=f"/{APP_ID}")
@@ -4,12 +4,17 @@ from typing import Dict, Optional
 
 import chainlit as cl
 
-from modules.cl import (
-    auth_callback, get_agent, get_orchestrator_tools, LoggingHooks, get_question_from_message, process_user_task)
+from modules.cancellation import cancel_and_wait
+from modules.cl import auth_callback, get_agent, get_orchestrator_tools, LoggingHooks, process_user_task
+from modules.ingestion import get_question_from_message_async, SessionLimitError
 from modules.prompts import MAIN_SYSTEM_PROMPT
+from modules.retrieval import BM25Index
+from modules.store import document_store
+from modules.subagents import close_session_pools
+from modules.warmup import warm_up
 from settings import (
     ENVIRONMENT, SECRET,
-    JWT_ALGORITHM, FAKE_USER, DEBUG)
+    JWT_ALGORITHM, FAKE_USER, DEBUG, WARMUP, CANCELLATION_TIMEOUT)
 
 logging.basicConfig(
     format='%(asctime)s [%(levelname)s] %(message)s',
@@ -19,6 +24,12 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@cl.on_app_startup
+async def on_app_startup():
+    if WARMUP:
+        await asyncio.to_thread(warm_up)
+
+
 @cl.header_auth_callback
 def header_auth_callback(headers: Dict) -> Optional[cl.User]:
     if ENVIRONMENT == 'local' and FAKE_USER:
@@ -43,25 +54,35 @@ async def start_chat():
         tools=get_orchestrator_tools()
     )
     cl.user_session.set("agent", agent)
-    cl.user_session.set("message_history", [])
+    cl.user_session.set("document_index", BM25Index())
 
 
 @cl.on_chat_end
 async def on_chat_end():
-    current_task = cl.user_session.get("current_task")
-    if current_task and not current_task.done():
-        current_task.cancel()
+    # The turn unwinds (model streams, tools and sub-agents closed) before the pools close what is left
+    await cancel_and_wait(cl.user_session.get("current_task"), timeout=CANCELLATION_TIMEOUT)
+    await cancel_and_wait(cl.user_session.get("task"), timeout=CANCELLATION_TIMEOUT)
+
+    await close_session_pools()
+    for document in (cl.user_session.get("pdf_documents") or {}).values():
+        document.close()
+    document_store.unpin(cl.user_session.get("id"))
+
+
+async def answer_message(message: cl.Message):
+    try:
+        question = await get_question_from_message_async(message)
+    except SessionLimitError as e:
+        await cl.Message(content=f"⚠️ **Error:** {e}").send()
+        return
 
-    task = cl.user_session.get("task")
-    if task and not task.done():
-        task.cancel()
+    await process_user_task(question=question, debug=DEBUG)
 
 
 @cl.on_message
 async def handle_message(message: cl.Message):
-    task = asyncio.create_task(process_user_task(
-        question=get_question_from_message(message),
-        debug=DEBUG))
+    # The ingestion of the attachments is part of the task, so a stop or the end of the chat cancels it too
+    task = asyncio.create_task(answer_message(message))
     cl.user_session.set("task", task)
     try:
         await task
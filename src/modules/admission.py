@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from modules.metrics import admission_wait_seconds
+from settings import ADMISSION_MAX_STREAMS, ADMISSION_MAX_IN_FLIGHT_BYTES
+
+logger = logging.getLogger(__name__)
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+@dataclass(eq=False)
+class Ticket:
+    user: str
+    size: int
+    admitted: bool = False
+    moved: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class AdmissionScheduler:
+    """
+    Worker-wide admission of the turns that stream from the model, shared by every session.
+
+    At most max_streams turns stream at once, with at most max_bytes of request payload in flight. A turn
+    holds its slot for its whole answer, its tools and sub-agents included, except map-reduce turns whose
+    sub-agents stream in parallel and are admitted one by one. The others wait in one queue per
+    user, admitted round robin between the users: a user sending many large requests only delays their own.
+    A request bigger than max_bytes is still admitted, but only when nothing else is streaming.
+
+    Waiting turns are told their position in the queue whenever it changes.
+    """
+
+    def __init__(self, max_streams: int, max_bytes: int):
+        self.max_streams = max_streams
+        self.max_bytes = max_bytes
+        self.active = 0
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self._queues: Dict[str, Deque[Ticket]] = {}
+        # Admission sequence of the last request of the users with requests waiting or streaming
+        self._served: Dict[str, int] = {}
+        self._streaming: Dict[str, int] = {}
+        self._sequence = 0
+
+    def get_users(self) -> List[str]:
+        # Users never served come first, in order of arrival, then the least recently served
+        return sorted(self._queues, key=lambda user: self._served.get(user, -1))
+
+    def get_order(self) -> List[Ticket]:
+        """
+        Returns:
+            The waiting tickets in the order they will be admitted: one per user at a time, in turn
+        """
+        queues = [list(self._queues[user]) for user in self.get_users()]
+        order = []
+        for rank in range(max((len(queue) for queue in queues), default=0)):
+            order += [queue[rank] for queue in queues if rank < len(queue)]
+        return order
+
+    def _fits(self, ticket: Ticket) -> bool:
+        if self.active >= self.max_streams:
+            return False
+        return self.active == 0 or self.in_flight + ticket.size <= self.max_bytes
+
+    def _dispatch(self) -> None:
+        admitted = []
+        while self._queues:
+            user = self.get_users()[0]
+            queue = self._queues[user]
+            ticket = queue[0]
+            if not self._fits(ticket):
+                break
+            queue.popleft()
+            if not queue:
+                del self._queues[user]
+            # The user goes to the back of the round
+            self._served[user] = self._sequence
+            self._sequence += 1
+            self._streaming[user] = self._streaming.get(user, 0) + 1
+            self.active += 1
+            self.in_flight += ticket.size
+            ticket.admitted = True
+            admitted.append(ticket)
+        self._moved()
+        for ticket in admitted:
+            ticket.moved.set()
+
+    def _moved(self) -> None:
+        # Wakes the waiting tickets up to check their position
+        for queue in self._queues.values():
+            for ticket in queue:
+                ticket.moved.set()
+
+    def _release(self, ticket: Ticket) -> None:
+        self.active -= 1
+        self.in_flight -= ticket.size
+        self._streaming[ticket.user] -= 1
+        if not self._streaming[ticket.user]:
+            del self._streaming[ticket.user]
+        self._forget(ticket.user)
+        self._dispatch()
+
+    def _remove(self, ticket: Ticket) -> None:
+        queue = self._queues.get(ticket.user)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self._queues[ticket.user]
+            self._forget(ticket.user)
+
+    def _forget(self, user: str) -> None:
+        # Users back after their requests are all answered are served first again
+        if user not in self._queues and user not in self._streaming:
+            self._served.pop(user, None)
+
+    @asynccontextmanager
+    async def admit(self, user: str, size: int, on_position: Optional[PositionCallback] = None):
+        """
+        Waits for a slot to stream a request of size bytes for the user, then holds it until the block exits.
+
+        Args:
+            on_position: Called with the position of the request in the queue, every time it changes
+        """
+        ticket = Ticket(user=user, size=min(size, self.max_bytes))
+        started = time.perf_counter()
+        self._queues.setdefault(user, deque()).append(ticket)
+        self._dispatch()
+
+        if not ticket.admitted:
+            self.queued += 1
+            logger.info(f"Queued a request of {user} ({self.active} streams, {self.in_flight} bytes in flight)")
+        try:
+            position = 0
+            while not ticket.admitted:
+                ticket.moved.clear()
+                new_position = self.get_order().index(ticket) + 1
+                if on_position and new_position != position:
+                    try:
+                        await on_position(new_position)
+                    except Exception as e:
+                        logger.warning(f"Error reporting the queue position of {user}: {e}")
+                position = new_position
+                await ticket.moved.wait()
+        except BaseException:
+            if ticket.admitted:
+                self._release(ticket)
+            else:
+                self._remove(ticket)
+                self._dispatch()
+            raise
+
+        self.admitted += 1
+        admission_wait_seconds.observe(time.perf_counter() - started)
+        try:
+            yield
+        finally:
+            self._release(ticket)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "max_streams": self.max_streams,
+            "in_flight_bytes": self.in_flight,
+            "max_bytes": self.max_bytes,
+            "waiting": sum(len(queue) for queue in self._queues.values()),
+            "admitted": self.admitted,
+            "queued": self.queued,
+        }
+
+
+admission_scheduler = AdmissionScheduler(max_streams=ADMISSION_MAX_STREAMS, max_bytes=ADMISSION_MAX_IN_FLIGHT_BYTES)
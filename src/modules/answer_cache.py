@@ -0,0 +1,169 @@
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from modules.store import DocumentRef
+from settings import ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+REPLAY_CHUNK_CHARS = 200
+
+
+@dataclass
+class CachedAnswer:
+    message: Dict[str, Any]
+    size: int
+    created_at: float
+
+
+def normalize_question(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().rstrip("?!.").strip().casefold()
+
+
+def get_document_key(document: Dict[str, Any]) -> str:
+    source = document["source"]["bytes"]
+    # Stored documents are named after the digest of the upload and how it was processed
+    if isinstance(source, DocumentRef):
+        return source.path.name
+    return f"{hashlib.sha256(source).hexdigest()}.{document['format']}"
+
+
+def get_system_prompt_text(system_prompt: Any) -> str:
+    if isinstance(system_prompt, list):
+        return "".join(block.get("text", "") for block in system_prompt)
+    return system_prompt or ""
+
+
+def get_answer_key(question: Any, model_id: str, system_prompt: Any) -> Optional[str]:
+    """
+    Returns:
+        The key of the answer to a question about documents, None for a question without documents
+    """
+    if isinstance(question, str) or not any("document" in block for block in question):
+        return None
+    key = {
+        "documents": [get_document_key(block["document"]) for block in question if "document" in block],
+        "text": [normalize_question(block["text"]) for block in question if "text" in block],
+        "model": model_id,
+        "system": hashlib.sha256(get_system_prompt_text(system_prompt).encode()).hexdigest(),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def is_cacheable(messages: List[Dict[str, Any]]) -> bool:
+    """
+    Whether the answer of a turn only depends on its question: a single model message, without tool calls
+    whose results (time, weather, code) could change.
+    """
+    return len(messages) == 1 and all("text" in block for block in messages[0]["content"])
+
+
+class AnswerCache:
+    """
+    Answers to the first question of conversations about the same documents, with TTL and size-bounded LRU
+    eviction, shared by every session of the worker.
+
+    Users often ask the same canned question (the default summary) about the same shared files: the
+    answer is then replayed without calling the model. Entries are keyed by the digests of the documents,
+    the normalized question, the model and the system prompt.
+    """
+
+    def __init__(self, ttl: float, max_bytes: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.bytes_saved = 0
+        self._size = 0
+        self._entries: OrderedDict[str, CachedAnswer] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def get(self, key: str, request_bytes: int) -> Optional[CachedAnswer]:
+        """
+        Returns:
+            The answer, None if not cached or expired. A hit counts request_bytes as not sent to the model
+        """
+        with self._lock:
+            answer = self._entries.get(key)
+            if answer is not None and self.clock() - answer.created_at > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                answer = None
+            if answer is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += request_bytes
+            return answer
+
+    def put(self, key: str, message: Dict[str, Any]) -> None:
+        size = len(json.dumps(message).encode())
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._remove(key)
+            # A copy, since the message stays in the history of its session
+            self._entries[key] = CachedAnswer(
+                message=copy.deepcopy(message), size=size, created_at=self.clock())
+            self._size += size
+            self.stores += 1
+            while self._size > self.max_bytes:
+                evicted, _ = next(iter(self._entries.items()))
+                self._remove(evicted)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        answer = self._entries.pop(key, None)
+        if answer is not None:
+            self._size -= answer.size
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "bytes_saved": self.bytes_saved,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+answer_cache = AnswerCache(ttl=ANSWER_CACHE_TTL, max_bytes=ANSWER_CACHE_MAX_BYTES)
+
+
+async def replay_answer(answer: CachedAnswer) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streams a cached answer as the events of an agent stream: its text, then its message.
+    """
+    text = "".join(block["text"] for block in answer.message["content"])
+    for start in range(0, len(text), REPLAY_CHUNK_CHARS):
+        yield {"data": text[start:start + REPLAY_CHUNK_CHARS]}
+    yield {"message": copy.deepcopy(answer.message)}
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import threading
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from strands.models import BedrockModel
+
+from modules.cancellation import cancellation_stats
+from modules.ratelimit import discard_result
+from modules.store import DocumentRef
+from settings import BEDROCK_MAX_POOL_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_session: Optional[boto3.Session] = None
+_models: Dict[Tuple, BedrockModel] = {}
+# The stream call read by the current thread, for the botocore handler of its response
+_thread_calls = threading.local()
+
+
+class StreamCancelledError(Exception):
+    """
+    Stops the thread reading a stream whose request was cancelled.
+    """
+
+
+def close_response_stream(response_stream: Any) -> bool:
+    """
+    Closes the connection of a botocore event stream, interrupting the read blocked on it in another thread.
+
+    Returns:
+        Whether the connection was still open
+    """
+    raw = response_stream._raw_stream
+    if raw.closed:
+        return False
+    try:
+        # Wakes the reading thread up right away, closing the socket alone would leave it blocked until the timeout
+        raw.shutdown()
+    except (AttributeError, ValueError, RuntimeError, OSError):
+        pass
+    response_stream.close()
+    return True
+
+
+class StreamCall:
+    """
+    A converse_stream request read by a thread, cancelled from the event loop when its stream is closed.
+    """
+
+    def __init__(self):
+        self.cancelled = False
+        self.response_stream: Any = None
+        self._lock = threading.Lock()
+
+    def attach(self, response_stream: Any) -> None:
+        with self._lock:
+            self.response_stream = response_stream
+            cancelled = self.cancelled
+        if cancelled:
+            # Cancelled while the request was being sent
+            close_response_stream(response_stream)
+
+    def cancel(self) -> bool:
+        """
+        Returns:
+            Whether an open HTTP connection was closed
+        """
+        with self._lock:
+            self.cancelled = True
+            response_stream = self.response_stream
+        return close_response_stream(response_stream) if response_stream is not None else False
+
+
+def attach_response_stream(parsed: Any = None, **kwargs: Any) -> None:
+    """
+    botocore after-call handler of ConverseStream giving the response stream to the call of the thread.
+    """
+    call: Optional[StreamCall] = getattr(_thread_calls, "call", None)
+    if call is not None and parsed and "stream" in parsed:
+        call.attach(parsed["stream"])
+
+
+class DocumentStoreBedrockModel(BedrockModel):
+    """
+    BedrockModel that reads the documents referenced by the messages (DocumentRef) when it builds a request.
+
+    It builds on private methods of the pinned strands-agents version (_format_request_message_content,
+    _stream), checked by test_private_api_contract.
+    """
+
+    def _format_request_message_content(self, content: Any) -> dict[str, Any]:
+        if "document" in content and isinstance(content["document"].get("source", {}).get("bytes"), DocumentRef):
+            document = content["document"]
+            content = {**content, "document": {**document, "source": {"bytes": document["source"]["bytes"].read()}}}
+        return super()._format_request_message_content(content)
+
+    async def stream(
+            self,
+            messages: Any,
+            tool_specs: Optional[list] = None,
+            system_prompt: Optional[str] = None,
+            *,
+            tool_choice: Any = None,
+            system_prompt_content: Optional[list] = None,
+            **kwargs: Any,
+    ) -> AsyncGenerator[Any, None]:
+        """
+        BedrockModel.stream, except that a stream closed before its end (a cancelled turn) closes the HTTP
+        connection of its request right away, instead of its thread reading the answer until its end.
+        """
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        call = StreamCall()
+
+        def callback(event: Any = None) -> None:
+            if call.cancelled:
+                raise StreamCancelledError()
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+        if system_prompt and system_prompt_content is None:
+            system_prompt_content = [{"text": system_prompt}]
+
+        task = asyncio.create_task(asyncio.to_thread(
+            self._stream_call, call, callback, messages, tool_specs, system_prompt_content, tool_choice))
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                yield event
+            await task
+        finally:
+            if not task.done():
+                closed = call.cancel()
+                task.add_done_callback(discard_result)
+                cancellation_stats.record(model_streams=1, connections=int(closed))
+                logger.debug(f"Cancelled a {self.config.get('model_id')} stream (connection closed: {closed})")
+
+    def _stream_call(self, call: StreamCall, callback: Callable, *args: Any) -> None:
+        _thread_calls.call = call
+        try:
+            self._stream(callback, *args)
+        finally:
+            _thread_calls.call = None
+
+
+def get_boto_session() -> boto3.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.Session()
+        return _session
+
+
+def get_bedrock_model(
+        model_id: str,
+        temperature: float,
+        read_timeout: int,
+        connect_timeout: int,
+        max_pool_connections: int = BEDROCK_MAX_POOL_CONNECTIONS,
+) -> BedrockModel:
+    """
+    Returns the process-wide BedrockModel for this configuration, creating it on first use.
+
+    Models only hold their configuration and a thread-safe bedrock-runtime client, so one instance is shared by
+    every agent and sub-agent of every session: credentials are resolved once and the client keeps its
+    connection pool (max_pool_connections) warm between requests.
+
+    botocore sends each request once: RateLimitedModel retries the throttled ones through the shared limiter, and
+    the transient errors with a backoff.
+    """
+    key = (model_id, temperature, read_timeout, connect_timeout, max_pool_connections)
+    with _lock:
+        model = _models.get(key)
+    if model is not None:
+        return model
+
+    session = get_boto_session()
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            model = DocumentStoreBedrockModel(
+                model_id=model_id,
+                temperature=temperature,
+                boto_session=session,
+                boto_client_config=Config(
+                    read_timeout=read_timeout,
+                    connect_timeout=connect_timeout,
+                    retries={'total_max_attempts': 1},
+                    max_pool_connections=max_pool_connections,
+                )
+            )
+            model.client.meta.events.register("after-call.bedrock-runtime.ConverseStream", attach_response_stream)
+            _models[key] = model
+            logger.info(f"Created Bedrock model {model_id} (pool of {max_pool_connections} connections)")
+        return model
+
+
+def clear_bedrock_models() -> None:
+    with _lock:
+        _models.clear()
@@ -0,0 +1,98 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple, Union
+
+from modules.store import DocumentRef
+from settings import DOCUMENT_CACHE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+def get_file_digest(file: Path) -> str:
+    with file.open('rb') as f:
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+
+
+@dataclass
+class CachedDocument:
+    digest: str
+    format: str
+    source: Union[bytes, DocumentRef]
+    size: int
+    block_format: Optional[str] = None
+    metadata: Dict[str, Any] = field(default_factory=dict)
+    created_at: float = field(default_factory=time.time)
+
+
+class DocumentCache:
+    """
+    Content-addressed store of processed documents with size-bounded LRU eviction.
+
+    Entries are keyed by (sha256 of the uploaded bytes, bedrock format), so the same file uploaded again,
+    in this or any other session, is served without being read or processed a second time.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size = 0
+        self._entries: OrderedDict[Tuple[str, str], CachedDocument] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest: str, fmt: str) -> Optional[CachedDocument]:
+        with self._lock:
+            document = self._entries.get((digest, fmt))
+            if document is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((digest, fmt))
+            self.hits += 1
+            return document
+
+    def put(self, document: CachedDocument) -> None:
+        if document.size > self.max_bytes:
+            logger.debug(f"[DocumentCache] {document.digest} ({document.size} bytes) exceeds the cache size, not stored")
+            return
+
+        key = (document.digest, document.format)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._size -= previous.size
+            self._entries[key] = document
+            self._size += document.size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= evicted.size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+document_cache = DocumentCache(max_bytes=DOCUMENT_CACHE_MAX_BYTES)
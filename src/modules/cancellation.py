@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Reclaimed:
+    """
+    Capacity given back by a cancelled turn: what was still running when it was cancelled.
+    """
+    model_streams: int = 0
+    connections: int = 0
+    tool_calls: int = 0
+    resources: int = 0
+
+    def summary(self) -> str:
+        return (f"{self.model_streams} model streams, {self.connections} HTTP connections closed, "
+                f"{self.tool_calls} tool calls cancelled, {self.resources} sub-agent resources released")
+
+
+# Set for every turn: the tasks and threads the turn starts copy the context, and so count in the same turn
+_reclaimed: ContextVar[Optional[Reclaimed]] = ContextVar("reclaimed", default=None)
+
+
+class CancellationStats:
+    """
+    Cancelled turns (stop button and disconnects) and the capacity they reclaimed, over every session of the worker.
+    """
+
+    def __init__(self):
+        self.turns = 0
+        self.reclaimed = Reclaimed()
+        self._lock = threading.Lock()
+
+    def record(self, **counts: int) -> None:
+        """
+        Records what a cancellation closed, both in the worker totals and in the turn being cancelled.
+        """
+        turn = _reclaimed.get()
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self.reclaimed, name, getattr(self.reclaimed, name) + count)
+                if turn is not None:
+                    setattr(turn, name, getattr(turn, name) + count)
+
+    def record_turn(self) -> None:
+        with self._lock:
+            self.turns += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                **{field.name: getattr(self.reclaimed, field.name) for field in fields(Reclaimed)},
+            }
+
+
+cancellation_stats = CancellationStats()
+
+
+def start_turn() -> Reclaimed:
+    """
+    Returns:
+        What the cancellation of the current turn will reclaim, filled in while the cancellation unwinds
+    """
+    reclaimed = Reclaimed()
+    _reclaimed.set(reclaimed)
+    return reclaimed
+
+
+async def cancel_and_wait(task: Optional[asyncio.Task], timeout: float) -> None:
+    """
+    Cancels the task and waits for it to unwind, for at most timeout seconds.
+    """
+    if task is None or task.done():
+        return
+    task.cancel()
+    done, _ = await asyncio.wait([task], timeout=timeout)
+    if not done:
+        logger.warning(f"Task {task.get_name()} still running {timeout}s after its cancellation")
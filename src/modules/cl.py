@@ -1,34 +1,71 @@
+import asyncio
 import logging
+import multiprocessing
 import re
 import shutil
-from functools import wraps
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import aclosing, nullcontext
+from functools import partial, wraps
 from pathlib import Path
-from typing import Any, List, Callable
+from typing import Any, Dict, List, Callable, Optional, Tuple
 
 import chainlit as cl
 import jwt
-from botocore.config import Config
 from botocore.exceptions import ClientError
 from strands import Agent
-from strands.agent import SlidingWindowConversationManager
 from strands.hooks import (
     HookProvider, HookRegistry, BeforeToolCallEvent, AfterToolCallEvent)
-from strands.models import BedrockModel
 from strands.types.exceptions import ContextWindowOverflowException
-from strands_tools import calculator, current_time, think
 
-from settings import Models, MIME_MAP
+from modules.admission import admission_scheduler
+from modules.answer_cache import answer_cache, get_answer_key, is_cacheable, replay_answer
+from modules.bedrock import get_bedrock_model
+from modules.cache import CachedDocument, document_cache, get_file_digest
+from modules.cancellation import cancellation_stats, start_turn
+from modules.conversation import DocumentConversationManager
+from modules.executor import BoundedToolExecutor
+from modules.extractors import get_extractor
+from modules.mapreduce import get_question_text, is_splittable, map_reduce
+from modules.metrics import (
+    request_blocks, request_bytes, time_to_first_token_seconds, turn_seconds, stream_tokens_per_second,
+    tool_seconds, input_tokens, output_tokens)
+from modules.prompt_cache import MAX_CACHE_POINTS, PromptCacheHooks, get_system_prompt_blocks
+from modules.ratelimit import RateLimitedModel
+from modules.replay import RecordingModel, ReplayModel, get_backend_hooks, get_cassette
+from modules.store import DocumentRef, document_store
+from modules.streaming import TokenBuffer
+from modules.pdf import PDF_PREVIEW_SUFFIX, build_pdf_preview
+from modules.tables import TABLE_FORMATS, build_table_database
+from modules.tokens import estimate_agent_request
+from settings import (
+    Models, ModelBackend, MODEL_BACKEND, MODEL_PROMPT_CACHING, MIME_MAP, EXTRACTION_MODES, EXTRACTION_MAX_WORKERS,
+    ExtractionMode, TOOL_MAX_CONCURRENCY, TABLE_SAMPLE_ROWS, PDF_PREVIEW_MIN_PAGES, PDF_PREVIEW_PAGES,
+    MODEL_THROTTLE_MAX_ATTEMPTS)
 
 logger = logging.getLogger(__name__)
 
+extraction_executor = ProcessPoolExecutor(
+    max_workers=EXTRACTION_MAX_WORKERS,
+    mp_context=multiprocessing.get_context('spawn')) if EXTRACTION_MAX_WORKERS else None
+
+
+DEFAULT_QUESTION = "Write a summary of the document"
+# Store suffix of the descriptions of the tables of spreadsheets: their databases are stored next to them
+TABLE_DESCRIPTION_SUFFIX = ".tables.md"
+
 
 def get_question_from_message(message: cl.Message):
     content_blocks = None
     if message.elements:
         content_blocks = get_content_blocks_from_message(message)
 
+    return build_question(message, content_blocks)
+
+
+def build_question(message: cl.Message, content_blocks: Optional[List[dict]]):
     if content_blocks:
-        content_blocks.append({"text": message.content or "Write a summary of the document"})
+        content_blocks.append({"text": message.content or DEFAULT_QUESTION})
         question = content_blocks
     else:
         question = message.content
@@ -36,26 +73,171 @@ def get_question_from_message(message: cl.Message):
     return question
 
 
-def get_content_blocks_from_message(message: cl.Message):
-    docs = [f for f in message.elements if f.type == "file" and f.mime in MIME_MAP]
-    content_blocks = []
+def get_documents_from_message(message: cl.Message) -> List[Any]:
+    return [f for f in message.elements if f.type == "file" and f.mime in MIME_MAP]
 
-    for doc in docs:
-        file = Path(doc.path)
-        file_bytes = file.read_bytes()
 
-        content_blocks.append({
-            "document": {
-                "name": sanitize_filename(doc.name),
-                "format": MIME_MAP[doc.mime],
-                "source": {"bytes": file_bytes}
-            }
-        })
-    else:
+def get_content_blocks_from_message(message: cl.Message, owner: Optional[str] = None):
+    docs = get_documents_from_message(message)
+    content_blocks = [get_content_block_from_document(doc, owner) for doc in docs]
+
+    if docs:
         shutil.rmtree(Path(docs[0].path).parent)
     return content_blocks
 
 
+def get_content_block_from_document(doc: Any, owner: Optional[str] = None) -> dict:
+    """
+    Args:
+        owner: Session whose conversation references the document, pinning its files in the store
+    """
+    file = Path(doc.path)
+    fmt = MIME_MAP[doc.mime]
+    digest = get_file_digest(file)
+
+    document = document_cache.get(digest, fmt)
+    if document is None or not pin_document(document, owner):
+        file_bytes = file.read_bytes()
+        metadata = {"name": doc.name, "mime": doc.mime, "original_size": len(file_bytes)}
+        tables, preview = None, None
+        if EXTRACTION_MODES.get(fmt) == ExtractionMode.TABLE:
+            tables = extract_tables(fmt, file_bytes, sanitize_filename(doc.name))
+        elif fmt == "pdf" and PDF_PREVIEW_MIN_PAGES:
+            preview = extract_pdf_preview(file_bytes, sanitize_filename(doc.name))
+        if tables:
+            # The model gets the description of the tables, query_tables their rows
+            database, description = tables
+            metadata["tables"] = document_store.put(digest, f"{fmt}.sqlite", database)
+            source, block_format = description.encode(), "md"
+            stored = document_store.put(digest, f"{fmt}{TABLE_DESCRIPTION_SUFFIX}", source)
+        elif preview:
+            # The model gets the first pages, read_pages the others from the whole document
+            metadata["pages"] = document_store.put(digest, fmt, file_bytes)
+            source, block_format = preview, fmt
+            stored = document_store.put(digest, f"{fmt}{PDF_PREVIEW_SUFFIX}", source)
+        else:
+            source, block_format = extract_document(fmt, file_bytes)
+            stored = document_store.put(digest, fmt, source)
+        document = CachedDocument(
+            digest=digest,
+            format=fmt,
+            source=stored,
+            size=len(source),
+            block_format=block_format,
+            metadata=metadata)
+        document_cache.put(document)
+        pin_document(document, owner)
+    else:
+        logger.debug(f"Document cache hit for {doc.name} ({digest})")
+
+    return {
+        "document": {
+            "name": sanitize_filename(doc.name),
+            "format": document.block_format or document.format,
+            "source": {"bytes": document.source}
+        }
+    }
+
+
+def pin_document(document: CachedDocument, owner: Optional[str]) -> bool:
+    """
+    Pins the files of a cached document for the session of owner, if any.
+
+    Returns:
+        Whether the document store still has every file of the cached document
+    """
+    refs = [document.source, *(document.metadata[key] for key in ("tables", "pages") if key in document.metadata)]
+    if owner is None:
+        return all(ref.exists() for ref in refs)
+    return document_store.pin(owner, refs)
+
+
+def extract_tables(fmt: str, data: bytes, name: str) -> Optional[Tuple[bytes, str]]:
+    """
+    Loads the sheets of a spreadsheet in a SQLite database, in the extraction pool.
+
+    Returns:
+        The database and the description of its tables, None if the format has no tables or loading them failed
+    """
+    if fmt not in TABLE_FORMATS:
+        return None
+    try:
+        if extraction_executor:
+            return extraction_executor.submit(build_table_database, fmt, data, name, TABLE_SAMPLE_ROWS).result()
+        return build_table_database(fmt, data, name, TABLE_SAMPLE_ROWS)
+    except Exception as e:
+        logger.warning(f"Loading the tables of {fmt} document {name} failed, sending its text: {e}")
+        return None
+
+
+def get_table_database(source: Any) -> Optional[DocumentRef]:
+    """
+    Returns:
+        The database of the tables described by a document source, stored next to the description
+    """
+    if not isinstance(source, DocumentRef) or not source.path.name.endswith(TABLE_DESCRIPTION_SUFFIX):
+        return None
+    digest, fmt = source.path.name.removesuffix(TABLE_DESCRIPTION_SUFFIX).split(".", 1)
+    return document_store.get(digest, f"{fmt}.sqlite")
+
+
+def extract_pdf_preview(data: bytes, name: str) -> Optional[bytes]:
+    """
+    Cuts the first pages of a long PDF, in the extraction pool.
+
+    Returns:
+        The PDF of the first pages, None if the document is short enough to be sent whole or cannot be cut
+    """
+    try:
+        if extraction_executor:
+            return extraction_executor.submit(
+                build_pdf_preview, data, PDF_PREVIEW_MIN_PAGES, PDF_PREVIEW_PAGES).result()
+        return build_pdf_preview(data, PDF_PREVIEW_MIN_PAGES, PDF_PREVIEW_PAGES)
+    except Exception as e:
+        logger.info(f"Cutting a preview of PDF document {name} failed, sending it whole: {e}")
+        return None
+
+
+def get_pdf_source(source: Any) -> Optional[DocumentRef]:
+    """
+    Returns:
+        The whole PDF of a document source holding its preview, stored next to the preview
+    """
+    if not isinstance(source, DocumentRef) or not source.path.name.endswith(PDF_PREVIEW_SUFFIX):
+        return None
+    digest, fmt = source.path.name.removesuffix(PDF_PREVIEW_SUFFIX).split(".", 1)
+    return document_store.get(digest, fmt)
+
+
+def extract_document(fmt: str, data: bytes) -> Tuple[bytes, str]:
+    """
+    Replaces the uploaded bytes with compact text when the format has an extractor and is in extracted mode.
+
+    Returns:
+        The bytes to send and their Bedrock document format. Falls back to the raw upload if extraction fails.
+    """
+    extractor = get_extractor(fmt)
+    if extractor is None or EXTRACTION_MODES.get(fmt, ExtractionMode.RAW) == ExtractionMode.RAW:
+        return data, fmt
+
+    func, output_format = extractor
+    try:
+        if extraction_executor:
+            text = extraction_executor.submit(func, data).result()
+        else:
+            text = func(data)
+    except Exception as e:
+        logger.warning(f"Extraction of {fmt} document failed, sending the raw file: {e}")
+        return data, fmt
+
+    if not text:
+        return data, fmt
+
+    extracted = text.encode()
+    logger.debug(f"Extracted {fmt} document: {len(data)} -> {len(extracted)} bytes")
+    return extracted, output_format
+
+
 def sanitize_filename(name: str) -> str:
     # Replace underscores and dots with spaces
     name = name.replace('_', ' ').replace('.', ' ')
@@ -66,43 +248,62 @@ def sanitize_filename(name: str) -> str:
     return name.strip()
 
 
+async def discard_token(token: str) -> None:
+    pass
+
+
+def get_step_key(tool_use_id: str) -> str:
+    return f"step_{tool_use_id}"
+
+
 def stream_to_step(tool_name: str):
     """
     Decorator to capture streaming output from async generator tools and send to Chainlit Step.
 
-    Follows Chainlit's official pattern for streaming LLM outputs.
+    Follows Chainlit's official pattern for streaming LLM outputs, with the tokens coalesced by a TokenBuffer.
+    The tool is declared with @tool(context=True): the tool use id of its tool_context finds the Step of the
+    call, so parallel calls of the tool each stream to their own Step.
 
     Args:
-        tool_name: Name of the tool (used to find the corresponding Step)
+        tool_name: Name of the tool (for the logs)
     """
 
     def decorator(func: Callable):
         @wraps(func)
         async def wrapper(*args, **kwargs):
-            # Get the Step for this tool if it exists
-            step: cl.Step = cl.user_session.get(f"step_{tool_name}")
+            # Get the Step for this call if it exists
+            tool_context = kwargs.get("tool_context")
+            step: Optional[cl.Step] = None
+            if tool_context:
+                step = cl.user_session.get(get_step_key(tool_context.tool_use["toolUseId"]))
+            else:
+                logger.debug(f"No tool context for {tool_name}, its output is not streamed to a step")
 
-            accumulated_content = ""
+            accumulated_content = []
 
             # Call the original async generator function
-            async for event in func(*args, **kwargs):
-                # Extract delta.text if available (similar to OpenAI's delta.content pattern)
-                if isinstance(event, dict) and 'delta' in event:
-                    delta = event['delta']
-                    if isinstance(delta, dict) and 'text' in delta:
-                        text_content = delta['text']
-
-                        # Stream the output of the step (following Chainlit's official pattern)
-                        if text_content and step:
-                            await step.stream_token(text_content)
-                            accumulated_content += text_content
-
-                # Always yield the original event for the agent to consume
-                yield event
+            async with TokenBuffer(step.stream_token if step else discard_token) as buffer:
+                async for event in func(*args, **kwargs):
+                    # Extract delta.text if available (similar to OpenAI's delta.content pattern)
+                    if isinstance(event, dict) and 'delta' in event:
+                        delta = event['delta']
+                        if isinstance(delta, dict) and 'text' in delta:
+                            text_content = delta['text']
+
+                            # Stream the output of the step (following Chainlit's official pattern)
+                            if text_content and step:
+                                await buffer.write(text_content)
+                                accumulated_content.append(text_content)
+                    elif isinstance(event, dict) and 'message' in event:
+                        # End of a sub-agent message, its tools may run next
+                        await buffer.flush()
+
+                    # Always yield the original event for the agent to consume
+                    yield event
 
             # Update the Step with final content
             if step:
-                step.output = accumulated_content if accumulated_content else "✓ Completed"
+                step.output = "".join(accumulated_content) if accumulated_content else "✓ Completed"
                 await step.update()
 
         return wrapper
@@ -111,6 +312,9 @@ def stream_to_step(tool_name: str):
 
 
 class LoggingHooks(HookProvider):
+    def __init__(self):
+        self._started: Dict[str, float] = {}
+
     def register_hooks(self, registry: HookRegistry) -> None:
         registry.add_callback(BeforeToolCallEvent, self.before_tool)
         registry.add_callback(AfterToolCallEvent, self.after_tool)
@@ -121,14 +325,21 @@ class LoggingHooks(HookProvider):
             type="tool",
         )
         await step.send()
-        cl.user_session.set(f"step_{event.tool_use['name']}", step)
+        cl.user_session.set(get_step_key(event.tool_use['toolUseId']), step)
+        self._started[event.tool_use['toolUseId']] = time.perf_counter()
         logger.debug(f"Request started for {event.tool_use['name']}")
 
     async def after_tool(self, event: AfterToolCallEvent) -> None:
-        step: cl.Step = cl.user_session.get(f"step_{event.tool_use['name']}")
+        step: cl.Step = cl.user_session.get(get_step_key(event.tool_use['toolUseId']))
         if step:
             # Keep the step visible with final content instead of removing it
             await step.update()
+            cl.user_session.set(get_step_key(event.tool_use['toolUseId']), None)
+        started = self._started.pop(event.tool_use['toolUseId'], None)
+        if started is not None:
+            duration = time.perf_counter() - started
+            tool_seconds.observe(duration, tool=event.tool_use['name'])
+            logger.info(f"Tool {event.tool_use['name']} completed in {duration:.3f}s")
         logger.debug(f"Request completed for {event.tool_use['name']}")
 
 
@@ -151,18 +362,52 @@ def auth_callback(headers: dict, secret, jwt_algorithm) -> Any:
 
 
 def get_orchestrator_tools() -> List[Any]:
+    # Imported on first use (or by the warm-up): the calculator loads sympy
+    from strands_tools import calculator, current_time, think
+    from tools.documents.tools import query_tables, read_pages, search_documents
     from tools.weather.agent import weather_assistant
 
     tools = [
         current_time,
         calculator,
         think,
-        weather_assistant
+        weather_assistant,
+        search_documents,
+        query_tables,
+        read_pages
     ]
 
     return tools
 
 
+def get_model(
+        model_id: str,
+        temperature: float,
+        read_timeout: int,
+        connect_timeout: int,
+        max_attempts: int,
+        backend: ModelBackend = MODEL_BACKEND,
+) -> Any:
+    """
+    Returns the model of the backend: Bedrock, Bedrock recorded to the cassette, or the cassette replayed.
+
+    Bedrock requests go through the rate limiter shared by every agent of the worker, which retries the
+    throttled ones up to max_attempts times.
+    """
+    if backend == ModelBackend.REPLAY:
+        return ReplayModel(get_cassette(), model_id=model_id)
+
+    model = get_bedrock_model(
+        model_id=model_id,
+        temperature=temperature,
+        read_timeout=read_timeout,
+        connect_timeout=connect_timeout,
+    )
+    if backend == ModelBackend.RECORD:
+        model = RecordingModel(model, get_cassette())
+    return RateLimitedModel(model, max_attempts=max_attempts)
+
+
 def get_agent(
         system_prompt: str,
         model: str = Models.CLAUDE_45,
@@ -171,52 +416,204 @@ def get_agent(
         temperature: float = 0.3,
         llm_read_timeout: int = 300,
         llm_connect_timeout: int = 60,
-        llm_max_attempts: int = 10,
+        llm_max_attempts: int = MODEL_THROTTLE_MAX_ATTEMPTS,
         maximum_messages_to_keep: int = 30,
         should_truncate_results: bool = True,
+        prompt_caching: Optional[bool] = None,
+        backend: ModelBackend = MODEL_BACKEND,
+        max_tool_concurrency: int = TOOL_MAX_CONCURRENCY,
 ):
+    """
+    With prompt caching (MODEL_PROMPT_CACHING of the model by default) the system prompt ends with a cache
+    checkpoint, which also covers the tool specs sent before it, and PromptCacheHooks places the remaining
+    checkpoints after the documents and at the end of the conversation before every model call.
+
+    The record and replay backends (MODEL_BACKEND by default) also record or replay the results of the tools
+    that need the network, so recorded conversations replay offline.
+
+    The tool calls of one model response run in parallel, at most max_tool_concurrency at once.
+    """
+    if prompt_caching is None:
+        prompt_caching = MODEL_PROMPT_CACHING.get(model, False)
+    if prompt_caching:
+        hooks = [*hooks, PromptCacheHooks(max_points=MAX_CACHE_POINTS - 1)]
+    if backend != ModelBackend.BEDROCK:
+        hooks = [*hooks, *get_backend_hooks(backend, get_cassette())]
+
     return Agent(
-        system_prompt=system_prompt,
-        model=BedrockModel(
+        system_prompt=get_system_prompt_blocks(system_prompt) if prompt_caching else system_prompt,
+        model=get_model(
             model_id=model,
             temperature=temperature,
-            boto_client_config=Config(
-                read_timeout=llm_read_timeout,
-                connect_timeout=llm_connect_timeout,
-                retries={'max_attempts': llm_max_attempts}
-            )
+            read_timeout=llm_read_timeout,
+            connect_timeout=llm_connect_timeout,
+            max_attempts=llm_max_attempts,
+            backend=backend
         ),
-        conversation_manager=SlidingWindowConversationManager(
+        conversation_manager=DocumentConversationManager(
             window_size=maximum_messages_to_keep,
             should_truncate_results=should_truncate_results,
         ),
         tools=tools,
-        hooks=hooks
+        hooks=hooks,
+        tool_executor=BoundedToolExecutor(max_concurrency=max_tool_concurrency)
     )
 
 
+async def get_progress_step() -> Callable:
+    step = cl.Step(name="map_reduce", type="tool")
+    step.input = "The document is larger than the context window, reading it in parts"
+    await step.send()
+
+    async def on_progress(done: int, total: int):
+        step.output = f"Read {done} of {total} parts"
+        await step.update()
+
+    return on_progress
+
+
+def get_request_size(question: Any) -> Tuple[int, int]:
+    """
+    Returns:
+        The bytes and the number of content blocks of a question
+    """
+    if isinstance(question, str):
+        return len(question.encode()), 1
+    size = sum(len(block["document"]["source"]["bytes"]) if "document" in block else len(block.get("text", "").encode())
+               for block in question)
+    return size, len(question)
+
+
+def get_user_key() -> str:
+    user = cl.user_session.get("user")
+    return user.identifier if user else cl.user_session.get("id")
+
+
+class QueueStatus:
+    """
+    Shows the position of a queued turn at the end of its message, until the turn is admitted.
+    """
+
+    def __init__(self, msg: cl.Message):
+        self.msg = msg
+        self.content: Optional[str] = None
+
+    async def show(self, position: int) -> None:
+        if self.content is None:
+            self.content = self.msg.content
+        self.msg.content = f"{self.content}_⏳ Many questions are being answered, yours is number {position} in line_"
+        await self.msg.update()
+
+    async def clear(self) -> None:
+        if self.content is not None:
+            self.msg.content = self.content
+            self.content = None
+            await self.msg.update()
+
+
+def record_turn_metrics(started: float, first_token: Optional[float], usage: Dict[str, int], agent: Any) -> None:
+    ended = time.perf_counter()
+    turn_seconds.observe(ended - started)
+    if first_token is not None:
+        time_to_first_token_seconds.observe(first_token - started)
+    if not usage:
+        return
+
+    final = agent.event_loop_metrics.accumulated_usage
+    delta = {key: final.get(key, 0) - usage.get(key, 0)
+             for key in ("inputTokens", "outputTokens", "cacheReadInputTokens", "cacheWriteInputTokens")}
+    input_tokens.observe(delta["inputTokens"] + delta["cacheReadInputTokens"] + delta["cacheWriteInputTokens"])
+    output_tokens.observe(delta["outputTokens"])
+    if first_token is not None and ended > first_token and delta["outputTokens"]:
+        stream_tokens_per_second.observe(delta["outputTokens"] / (ended - first_token))
+
+
+def get_too_large_error(question: Any) -> str:
+    if isinstance(question, str):
+        return "The message is too long for the model to process. Please try a shorter message."
+    return "The file is too large for the model to process. Please try a smaller file."
+
+
 async def process_user_task(question: Any, debug: bool):
+    started = time.perf_counter()
+    reclaimed = start_turn()
     agent = cl.user_session.get("agent")
-    message_history = cl.user_session.get("message_history")
-    message_history.append({"role": "user", "content": question})
     msg = cl.Message(content="")
     await msg.send()
 
+    estimate = estimate_agent_request(agent, question)
+    logger.info(f"Token estimate: {estimate.summary()}")
+    if not isinstance(question, str):
+        await msg.stream_token(f"_Estimated input: {estimate.summary()}_\n\n")
+    # The history is shrunk by the conversation manager: only a question that cannot fit by itself is refused,
+    # or split over map-reduce sub-agents when its documents are text
+    oversized = not estimate.fits_without_history
+    if oversized and not is_splittable(question):
+        await msg.stream_token(f"⚠️ **Error:** {get_too_large_error(question)}")
+        await msg.update()
+        return
+
+    size, blocks = get_request_size(question)
+    request_bytes.observe(size)
+    request_blocks.observe(blocks)
+
     final_question = question
     if debug and isinstance(question, str):
         extra = (f"If there is any error in any tool during agent execution, "
                  f"explain the error so I can fix it.")
         final_question = f"{question}\n{extra}"
+    # Only the answers to the first question of a conversation are cached: the later ones depend on the history
+    answer_key = None
+    if answer_cache.enabled and not oversized and not agent.messages:
+        answer_key = get_answer_key(question, agent.model.get_config().get("model_id"), agent.system_prompt)
+    cached = answer_cache.get(answer_key, request_bytes=size) if answer_key else None
+    # The tokens of map-reduce turns are spent by its sub-agents, only the main agent usage is recorded
+    usage = {} if oversized or cached else dict(agent.event_loop_metrics.accumulated_usage)
+    first_token = None
+    messages = []
+    queue_status = QueueStatus(msg)
     try:
-        async for event in agent.stream_async(final_question):
-            if "data" in event:
-                await msg.stream_token(str(event["data"]))
-            elif "message" in event:
-                await msg.stream_token("\n")
-                message_history.append(event["message"])
+        # Waits for a free model stream of the worker, showing the position in the queue meanwhile. Map-reduce
+        # streams from many sub-agents at once: each of them waits for its own stream instead
+        async with nullcontext() if cached or oversized else admission_scheduler.admit(
+                get_user_key(), size, on_position=queue_status.show):
+            await queue_status.clear()
+            if cached:
+                logger.info("Answer cache hit, replaying the answer without calling the model")
+                events = replay_answer(cached)
+            elif oversized:
+                events = map_reduce(question=question, agent_factory=get_agent, on_progress=await get_progress_step(),
+                                    admit=partial(admission_scheduler.admit, get_user_key()))
+            else:
+                events = agent.stream_async(final_question)
+
+            async with TokenBuffer(msg.stream_token) as buffer, aclosing(events):
+                async for event in events:
+                    if "data" in event:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        await buffer.write(str(event["data"]))
+                    elif "message" in event:
+                        # End of a model message: flush before its tools start their steps
+                        await buffer.write("\n")
+                        await buffer.flush()
+                        messages.append(event["message"])
+                        if oversized:
+                            # Keep the answer in the conversation without the documents that did not fit in it
+                            agent.messages.extend([
+                                {"role": "user", "content": [{"text": get_question_text(question)}]},
+                                event["message"]])
+                        elif cached:
+                            agent.messages.extend([{"role": "user", "content": question}, event["message"]])
+        if answer_key and not cached and is_cacheable(messages):
+            answer_cache.put(answer_key, messages[0])
+    except asyncio.CancelledError:
+        # Stop button or disconnect: the nested streams and tools are closed by now
+        cancellation_stats.record_turn()
+        logger.info(f"Turn cancelled after {time.perf_counter() - started:.2f}s, reclaimed {reclaimed.summary()}")
+        raise
     except ContextWindowOverflowException:
-        await msg.stream_token(
-            "\n\n⚠️ **Error:** The file is too large for the model to process. Please try a smaller file.")
+        await msg.stream_token(f"\n\n⚠️ **Error:** {get_too_large_error(question)}")
     except ClientError as e:
         if e.response['Error']['Code'] == 'ValidationException':
             await msg.stream_token(f"\n\n⚠️ **Error:** Validation error from Bedrock: {e}")
@@ -225,4 +622,5 @@ async def process_user_task(question: Any, debug: bool):
     except Exception as e:
         await msg.stream_token(f"\n\n⚠️ **Error:** An unexpected error occurred: {e}")
 
+    record_turn_metrics(started, first_token, usage, agent)
     await msg.update()
@@ -0,0 +1,154 @@
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from strands.agent import SlidingWindowConversationManager
+
+from modules.mapreduce import TEXT_FORMATS
+from modules.pdf import PDF_PREVIEW_SUFFIX
+from modules.store import DocumentRef, read_source
+from settings import DocumentHistoryPolicy, DOCUMENT_HISTORY_POLICY, DOCUMENT_HISTORY_KEEP, DOCUMENT_OUTLINE_CHARS
+
+logger = logging.getLogger(__name__)
+
+HEADING_PATTERN = re.compile(r'^#{1,6} .+$', re.MULTILINE)
+
+
+def get_document_outline(text: str, fmt: str, max_chars: int = DOCUMENT_OUTLINE_CHARS) -> str:
+    """
+    Builds a short local outline of a text document: its headings, the header and size of a table,
+    or its first lines.
+    """
+    if fmt == "csv":
+        lines = text.splitlines()
+        outline = f"Columns: {lines[0]}\nRows: {len(lines) - 1}" if lines else ""
+    elif headings := HEADING_PATTERN.findall(text):
+        outline = "\n".join(headings)
+    else:
+        outline = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+    if len(outline) > max_chars:
+        outline = outline[:max_chars].rsplit("\n", 1)[0] + "\n..."
+    return outline
+
+
+def is_pdf_preview(source: Any) -> bool:
+    return isinstance(source, DocumentRef) and source.path.name.endswith(PDF_PREVIEW_SUFFIX)
+
+
+def get_document_digest(document: Dict[str, Any], policy: DocumentHistoryPolicy, read_by_tool: bool = False) -> str:
+    """
+    Returns the text that replaces a document already answered on in the conversation, or the pages of a
+    document read by a tool (read_by_tool).
+    """
+    name, fmt = document["name"], document["format"]
+    source = document["source"]["bytes"]
+    action = "read with the read_pages tool" if read_by_tool else "attached"
+    digest = f"[Document \"{name}\" ({fmt}, {len(source) / 1024:,.0f} KB) was {action} earlier in the conversation."
+    if fmt in TEXT_FORMATS:
+        digest += " Its full content is no longer included: use the search_documents tool to read its passages."
+    elif read_by_tool or is_pdf_preview(source):
+        digest += " Its full content is no longer included: use the read_pages tool to read its pages."
+    else:
+        digest += " Its full content is no longer included: ask the user to attach it again if it is needed."
+
+    if policy == DocumentHistoryPolicy.OUTLINE and fmt in TEXT_FORMATS:
+        text = bytes(read_source(source)).decode("utf-8", errors="replace")
+        if outline := get_document_outline(text, fmt):
+            digest += f"\nOutline:\n{outline}"
+    return digest + "]"
+
+
+def replace_documents(
+        content: List[Dict[str, Any]], policy: DocumentHistoryPolicy, read_by_tool: bool = False,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Returns:
+        A copy of the content with its documents replaced with their digest, and the number of replaced documents
+    """
+    replaced = 0
+    compacted = []
+    for block in content:
+        if "document" in block:
+            compacted.append({"text": get_document_digest(block["document"], policy, read_by_tool)})
+            replaced += 1
+        else:
+            compacted.append(block)
+    return compacted, replaced
+
+
+def has_tool_documents(block: Dict[str, Any]) -> bool:
+    return any("document" in item for item in block.get("toolResult", {}).get("content", []))
+
+
+def compact_documents(messages: List[Dict[str, Any]], policy: DocumentHistoryPolicy, keep: int) -> int:
+    """
+    Replaces the documents of the user messages already answered by the assistant with their digest,
+    except for the keep most recent messages with documents.
+
+    The documents of tool results (the pages read by read_pages) are replaced once answered whatever keep:
+    the tool reads them again when needed.
+
+    Returns:
+        The number of replaced documents
+    """
+    if policy == DocumentHistoryPolicy.VERBATIM:
+        return 0
+
+    with_documents = [i for i, message in enumerate(messages)
+                      if message["role"] == "user" and any("document" in block for block in message["content"])]
+    last_answer = max((i for i, message in enumerate(messages) if message["role"] == "assistant"), default=-1)
+    kept = set(with_documents[-keep:]) if keep > 0 else set()
+
+    replaced = 0
+    for i, message in enumerate(messages[:last_answer]):
+        if message["role"] != "user":
+            continue
+        content, count = message["content"], 0
+        if i in with_documents and i not in kept:
+            content, count = replace_documents(content, policy)
+        blocks = []
+        for block in content:
+            if has_tool_documents(block):
+                result, tool_count = replace_documents(block["toolResult"]["content"], policy, read_by_tool=True)
+                block = {"toolResult": {**block["toolResult"], "content": result}}
+                count += tool_count
+            blocks.append(block)
+        if count:
+            messages[i] = {**message, "content": blocks}
+            replaced += count
+    return replaced
+
+
+class DocumentConversationManager(SlidingWindowConversationManager):
+    """
+    Sliding window that stops resending documents on every turn.
+
+    Once answered on, the documents of older messages are replaced with a digest according to the policy:
+    a retrieval handle (handle), the handle and a local outline (outline) or nothing at all (verbatim).
+    The keep most recent messages with documents always keep them verbatim, unless the context overflows.
+    """
+
+    def __init__(
+            self,
+            window_size: int = 40,
+            should_truncate_results: bool = True,
+            policy: DocumentHistoryPolicy = DOCUMENT_HISTORY_POLICY,
+            keep: int = DOCUMENT_HISTORY_KEEP,
+    ):
+        super().__init__(window_size=window_size, should_truncate_results=should_truncate_results)
+        self.policy = policy
+        self.keep = keep
+
+    def apply_management(self, agent: Any, **kwargs: Any) -> None:
+        replaced = compact_documents(agent.messages, self.policy, self.keep)
+        if replaced:
+            logger.info(f"Replaced {replaced} documents of the conversation with their digest ({self.policy})")
+        super().apply_management(agent, **kwargs)
+
+    def reduce_context(self, agent: Any, e: Optional[Exception] = None, **kwargs: Any) -> None:
+        # Dropping the answered documents, even the most recent ones, frees more context than trimming messages
+        policy = DocumentHistoryPolicy.HANDLE if self.policy == DocumentHistoryPolicy.VERBATIM else self.policy
+        if compact_documents(agent.messages, policy, keep=0):
+            return
+        super().reduce_context(agent, e, **kwargs)
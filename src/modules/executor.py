@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, Optional, Set
+
+from strands.tools.executors import ConcurrentToolExecutor
+from strands.tools.executors._executor import ToolExecutor
+
+from modules.cancellation import cancellation_stats
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedToolExecutor(ConcurrentToolExecutor):
+    """
+    Runs the independent tool calls of a model response in parallel, at most max_concurrency at once.
+
+    The calls above the limit start as the running ones complete, in the order the model asked for them.
+    A turn calling several tools then takes about as long as its slowest tool rather than their sum.
+
+    When the turn is cancelled, the calls still running are cancelled and waited for before the cancellation
+    goes on, so their streams, sub-agents and interpreter sessions are closed rather than left running.
+
+    strands has no public hook for this: _execute and _task override private methods of the pinned
+    strands-agents version, checked by test_private_api_contract.
+    """
+
+    def __init__(self, max_concurrency: int):
+        super().__init__()
+        self.max_concurrency = max_concurrency
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _execute(self, *args: Any, **kwargs: Any) -> AsyncGenerator[Any, None]:
+        # One per response, in the event loop of the response: an agent streams one request at a time,
+        # but not always from the same loop
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._tasks = set()
+        try:
+            async for event in super()._execute(*args, **kwargs):
+                yield event
+        finally:
+            running = [task for task in self._tasks if not task.done()]
+            for task in running:
+                task.cancel()
+            if running:
+                cancellation_stats.record(tool_calls=len(running))
+                await asyncio.gather(*running, return_exceptions=True)
+
+    async def _task(
+            self,
+            agent: Any,
+            tool_use: Any,
+            tool_results: Any,
+            cycle_trace: Any,
+            cycle_span: Any,
+            invocation_state: Any,
+            task_id: int,
+            task_queue: asyncio.Queue,
+            task_event: asyncio.Event,
+            stop_event: object,
+            structured_output_context: Any,
+    ) -> None:
+        self._tasks.add(asyncio.current_task())
+        try:
+            if self._semaphore.locked():
+                logger.debug(f"Tool {tool_use['name']} waits for one of the {self.max_concurrency} running tools")
+            async with self._semaphore:
+                events = ToolExecutor._stream_with_trace(
+                    agent, tool_use, tool_results, cycle_trace, cycle_span, invocation_state,
+                    structured_output_context)
+                async with aclosing(events):
+                    async for event in events:
+                        task_queue.put_nowait((task_id, event))
+                        # Backpressure: the next event waits for this one to be consumed. A cancellation
+                        # received meanwhile closes the tool stream through aclosing
+                        await task_event.wait()
+                        task_event.clear()
+        finally:
+            task_queue.put_nowait((task_id, stop_event))
@@ -0,0 +1,242 @@
+import csv
+import io
+import logging
+import re
+import zipfile
+from html.parser import HTMLParser
+from typing import Callable, Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+logger = logging.getLogger(__name__)
+
+# Extractors turn the raw bytes of an upload into compact text. They run in a process pool, so they must be
+# module level functions of a module importable without side effects.
+Extractor = Callable[[bytes], str]
+
+EXTRACTORS: Dict[str, Tuple[Extractor, str]] = {}
+
+XLSX_NS = {
+    "main": "http://schemas.openxmlformats.org/spreadsheetml/2006/main",
+    "rel": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "pkg": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+DOCX_NS = {"w": "http://schemas.openxmlformats.org/wordprocessingml/2006/main"}
+W = f"{{{DOCX_NS['w']}}}"
+
+HTML_SKIPPED_TAGS = {"script", "style", "noscript", "template", "svg"}
+HTML_BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "figure", "footer",
+    "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre", "section",
+    "table", "title", "tr", "ul",
+}
+
+
+def register_extractor(fmt: str, output_format: str):
+    """
+    Registers an extractor for a Bedrock document format (the values of settings.MIME_MAP).
+
+    Args:
+        fmt: Format of the uploaded document
+        output_format: Bedrock document format of the extracted text ("md" or "txt")
+    """
+
+    def decorator(func: Extractor) -> Extractor:
+        EXTRACTORS[fmt] = (func, output_format)
+        return func
+
+    return decorator
+
+
+def get_extractor(fmt: str) -> Optional[Tuple[Extractor, str]]:
+    return EXTRACTORS.get(fmt)
+
+
+def collapse_whitespace(text: str) -> str:
+    text = re.sub(r'[ \t\r\f\v\u00a0]+', ' ', text)
+    text = re.sub(r' *\n *', '\n', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def decode_text(data: bytes) -> str:
+    for encoding in ("utf-8-sig", "cp1252"):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return data.decode("latin-1")
+
+
+def to_markdown_table(rows: List[List[str]]) -> str:
+    rows = [[collapse_whitespace(cell).replace('\n', ' ').replace('|', '\\|') for cell in row] for row in rows]
+    rows = [row for row in rows if any(row)]
+    if not rows:
+        return ""
+
+    width = max(len(row) for row in rows)
+    while width and not any(len(row) >= width and row[width - 1] for row in rows):
+        width -= 1
+    rows = [(row + [""] * width)[:width] for row in rows]
+
+    lines = ["| " + " | ".join(rows[0]) + " |", "|" + "---|" * width]
+    lines += ["| " + " | ".join(row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+
+def read_csv_rows(data: bytes) -> List[List[str]]:
+    text = decode_text(data)
+    try:
+        dialect = csv.Sniffer().sniff(text[:4096], delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(io.StringIO(text), dialect))
+
+
+@register_extractor("csv", output_format="md")
+def extract_csv(data: bytes) -> str:
+    return to_markdown_table(read_csv_rows(data))
+
+
+def xlsx_column_index(reference: str) -> int:
+    index = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        index = index * 26 + ord(char.upper()) - ord('A') + 1
+    return index - 1
+
+
+def xlsx_cell_value(cell: ElementTree.Element, shared_strings: List[str]) -> str:
+    cell_type = cell.get("t", "n")
+    if cell_type == "inlineStr":
+        return "".join(t.text or "" for t in cell.iterfind(".//main:t", XLSX_NS))
+
+    value = cell.find("main:v", XLSX_NS)
+    if value is None or value.text is None:
+        return ""
+    if cell_type == "s":
+        return shared_strings[int(value.text)]
+    if cell_type == "b":
+        return "TRUE" if value.text == "1" else "FALSE"
+    return value.text
+
+
+def read_xlsx_sheets(data: bytes) -> List[Tuple[str, List[List[str]]]]:
+    """
+    Returns:
+        The name and the rows of every sheet of the workbook
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        shared_strings = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
+            shared_strings = [
+                "".join(t.text or "" for t in si.iterfind(".//main:t", XLSX_NS))
+                for si in root.iterfind("main:si", XLSX_NS)]
+
+        relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in relationships.iterfind("pkg:Relationship", XLSX_NS)}
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+
+        sheets = []
+        for sheet in workbook.iterfind("main:sheets/main:sheet", XLSX_NS):
+            target = targets[sheet.get(f"{{{XLSX_NS['rel']}}}id")].lstrip("/")
+            path = target if target.startswith("xl/") else f"xl/{target}"
+            rows = []
+            for row in ElementTree.fromstring(archive.read(path)).iterfind(".//main:sheetData/main:row", XLSX_NS):
+                values: Dict[int, str] = {}
+                for position, cell in enumerate(row.iterfind("main:c", XLSX_NS)):
+                    column = xlsx_column_index(cell.get("r", "")) if cell.get("r") else position
+                    values[column] = xlsx_cell_value(cell, shared_strings)
+                if values:
+                    rows.append([values.get(i, "") for i in range(max(values) + 1)])
+            sheets.append((sheet.get("name"), rows))
+
+    return sheets
+
+
+@register_extractor("xlsx", output_format="md")
+def extract_xlsx(data: bytes) -> str:
+    sections = []
+    for name, rows in read_xlsx_sheets(data):
+        table = to_markdown_table(rows)
+        if table:
+            sections.append(f"## {name}\n\n{table}")
+
+    return "\n\n".join(sections)
+
+
+def docx_text(element: ElementTree.Element) -> str:
+    parts = []
+    for node in element.iter():
+        if node.tag == f"{W}t" and node.text:
+            parts.append(node.text)
+        elif node.tag == f"{W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{W}br", f"{W}cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def docx_heading_level(paragraph: ElementTree.Element) -> int:
+    style = paragraph.find("w:pPr/w:pStyle", DOCX_NS)
+    if style is None:
+        return 0
+    match = re.match(r'(?i)heading\s*(\d)', style.get(f"{W}val", ""))
+    return int(match.group(1)) if match else 0
+
+
+@register_extractor("docx", output_format="md")
+def extract_docx(data: bytes) -> str:
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        body = ElementTree.fromstring(archive.read("word/document.xml")).find("w:body", DOCX_NS)
+
+    blocks = []
+    for element in body if body is not None else []:
+        if element.tag == f"{W}p":
+            text = collapse_whitespace(docx_text(element))
+            if text:
+                level = docx_heading_level(element)
+                blocks.append(f"{'#' * level} {text}" if level else text)
+        elif element.tag == f"{W}tbl":
+            rows = [
+                [docx_text(cell) for cell in row.iterfind("w:tc", DOCX_NS)]
+                for row in element.iterfind("w:tr", DOCX_NS)]
+            table = to_markdown_table(rows)
+            if table:
+                blocks.append(table)
+
+    return "\n\n".join(blocks)
+
+
+class HTMLTextParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTML_SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" | ")
+
+    def handle_endtag(self, tag):
+        if tag in HTML_SKIPPED_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in HTML_BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+@register_extractor("html", output_format="txt")
+def extract_html(data: bytes) -> str:
+    parser = HTMLTextParser()
+    parser.feed(decode_text(data))
+    parser.close()
+    return collapse_whitespace("".join(parser.parts))
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+import chainlit as cl
+
+from modules.cl import (
+    build_question, get_documents_from_message, get_content_block_from_document, get_pdf_source, get_table_database)
+from modules.metrics import ingestion_bytes, ingestion_seconds
+from modules.pdf import PdfDocument, PdfError, describe_document
+from modules.retrieval import BM25Index, index_content_blocks
+from modules.tables import TableCatalog
+from settings import (
+    INGESTION_MAX_WORKERS, INGESTION_MAX_CONCURRENT_FILES, INGESTION_MAX_IN_FLIGHT_BYTES, SESSION_MAX_DOCUMENT_BYTES,
+    PDF_PREVIEW_PAGES)
+
+logger = logging.getLogger(__name__)
+
+ingestion_executor = ThreadPoolExecutor(max_workers=INGESTION_MAX_WORKERS, thread_name_prefix="ingestion")
+
+
+class ByteBudget:
+    """
+    Async semaphore counted in bytes, shared by every session of the worker.
+
+    A single file bigger than the whole budget is still admitted, but only when nothing else is in flight.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def reserve(self, size: int):
+        size = min(size, self.max_bytes)
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight + size <= self.max_bytes)
+            self.in_flight += size
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.in_flight -= size
+                self.condition.notify_all()
+
+
+ingestion_budget = ByteBudget(max_bytes=INGESTION_MAX_IN_FLIGHT_BYTES)
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+async def get_question_from_message_async(message: cl.Message):
+    content_blocks = None
+    if message.elements:
+        with ingestion_seconds.time():
+            # The documents stay in the store until the chat ends
+            content_blocks = await get_content_blocks_from_message_async(message, owner=cl.user_session.get("id"))
+        ingestion_bytes.observe(sum(len(block["document"]["source"]["bytes"]) for block in content_blocks))
+        add_session_documents(content_blocks)
+        await index_documents(content_blocks)
+        await load_tables(content_blocks)
+        await load_pdf_documents(content_blocks)
+
+    return build_question(message, content_blocks)
+
+
+def add_session_documents(content_blocks: List[dict], max_bytes: int = SESSION_MAX_DOCUMENT_BYTES) -> None:
+    """
+    Accounts the new documents of a message to the session, whose retrieval index keeps their text in memory.
+
+    Raises:
+        SessionLimitError: If the documents of the session would exceed max_bytes
+    """
+    documents = cl.user_session.get("documents") or {}
+    new = {block["document"]["name"]: len(block["document"]["source"]["bytes"])
+           for block in content_blocks if "document" in block and block["document"]["name"] not in documents}
+    total = sum(documents.values()) + sum(new.values())
+    if total > max_bytes:
+        raise SessionLimitError(
+            f"The documents of this conversation would take {total / 1024 / 1024:.0f} MB, "
+            f"more than the {max_bytes / 1024 / 1024:.0f} MB allowed. Please start a new chat.")
+    cl.user_session.set("documents", {**documents, **new})
+
+
+async def index_documents(content_blocks: List[dict]) -> None:
+    """
+    Adds the uploaded text documents to the session retrieval index used by the search_documents tool.
+    """
+    index = cl.user_session.get("document_index")
+    if index is None:
+        index = BM25Index()
+        cl.user_session.set("document_index", index)
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    passages = await loop.run_in_executor(ingestion_executor, index_content_blocks, index, content_blocks)
+    if passages:
+        logger.info(f"Indexed {passages} passages in {time.perf_counter() - started:.3f}s")
+
+
+def add_tables(catalog: TableCatalog, content_blocks: List[dict]) -> List[str]:
+    """
+    Copies the tables of the spreadsheets of a question to the catalog. Runs in the ingestion pool.
+
+    Returns:
+        The names of the loaded tables
+    """
+    tables = []
+    for block in content_blocks:
+        database = get_table_database(block.get("document", {}).get("source", {}).get("bytes"))
+        if database is not None:
+            tables += catalog.add(database.path)
+    return tables
+
+
+async def load_tables(content_blocks: List[dict]) -> None:
+    """
+    Loads the tables of the uploaded spreadsheets in the session catalog queried by the query_tables tool.
+    """
+    catalog = cl.user_session.get("table_catalog")
+    if catalog is None:
+        catalog = TableCatalog()
+        cl.user_session.set("table_catalog", catalog)
+
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    tables = await loop.run_in_executor(ingestion_executor, add_tables, catalog, content_blocks)
+    if tables:
+        logger.info(f"Loaded tables {', '.join(tables)} in {time.perf_counter() - started:.3f}s")
+
+
+def open_pdf_documents(content_blocks: List[dict]) -> List[Tuple[int, PdfDocument]]:
+    """
+    Memory maps the whole PDFs of the previews of a question. Runs in the ingestion pool.
+
+    Returns:
+        The position of each preview in the content blocks, and its whole document
+    """
+    documents = []
+    for i, block in enumerate(content_blocks):
+        source = get_pdf_source(block.get("document", {}).get("source", {}).get("bytes"))
+        if source is None:
+            continue
+        try:
+            documents.append((i, PdfDocument.open(source.path)))
+        except (OSError, PdfError) as e:
+            logger.warning(f"Opening PDF document {block['document']['name']} failed: {e}")
+    return documents
+
+
+async def load_pdf_documents(content_blocks: List[dict]) -> None:
+    """
+    Keeps the whole PDFs of the previews in the session for the read_pages tool, and tells the model about
+    their other pages: the outline is added after each preview.
+    """
+    documents = cl.user_session.get("pdf_documents")
+    if documents is None:
+        documents = {}
+        cl.user_session.set("pdf_documents", documents)
+
+    loop = asyncio.get_running_loop()
+    opened = await loop.run_in_executor(ingestion_executor, open_pdf_documents, content_blocks)
+    for i, document in reversed(opened):
+        name = content_blocks[i]["document"]["name"]
+        if name in documents:
+            documents[name].close()
+        documents[name] = document
+        content_blocks.insert(i + 1, {"text": describe_document(document, name, PDF_PREVIEW_PAGES)})
+        logger.info(f"Sent the first {PDF_PREVIEW_PAGES} of the {document.page_count} pages of {name}")
+
+
+async def get_content_blocks_from_message_async(
+        message: cl.Message,
+        budget: Optional[ByteBudget] = None,
+        max_concurrent_files: int = INGESTION_MAX_CONCURRENT_FILES,
+        owner: Optional[str] = None,
+) -> List[dict]:
+    """
+    Reads, hashes and prepares the attachments of a message in the ingestion thread pool, pinning them in the
+    document store for the session of owner.
+
+    Concurrency is bounded per message by max_concurrent_files and per worker by the pool size and
+    the in-flight byte budget, so a large upload never blocks the event loop other sessions stream on.
+    """
+    docs = get_documents_from_message(message)
+    if not docs:
+        return []
+
+    loop = asyncio.get_running_loop()
+    budget = budget or ingestion_budget
+    semaphore = asyncio.Semaphore(max_concurrent_files)
+
+    async def ingest(doc: Any) -> dict:
+        async with semaphore:
+            size = await loop.run_in_executor(ingestion_executor, os.path.getsize, doc.path)
+            async with budget.reserve(size):
+                return await loop.run_in_executor(ingestion_executor, get_content_block_from_document, doc, owner)
+
+    try:
+        return list(await asyncio.gather(*(ingest(doc) for doc in docs)))
+    finally:
+        upload_dir = Path(docs[0].path).parent
+        await loop.run_in_executor(ingestion_executor, partial(shutil.rmtree, upload_dir, ignore_errors=True))
@@ -0,0 +1,204 @@
+import asyncio
+import logging
+import re
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Any, AsyncContextManager, AsyncIterator, Awaitable, Callable, Iterator, List, Optional
+
+from modules.prompts import MAP_SYSTEM_PROMPT, REDUCE_SYSTEM_PROMPT
+from modules.store import read_source
+from modules.tokens import DEFAULT_BYTES_PER_TOKEN, estimate_text_tokens
+from settings import MAPREDUCE_CHUNK_TOKENS, MAPREDUCE_MAX_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Formats whose bytes are text we can split locally (extracted office documents are sent as md or txt).
+TEXT_FORMATS = {"txt", "md", "csv", "html"}
+NO_RELEVANT_INFORMATION = "NO RELEVANT INFORMATION"
+
+# Waits for a model stream of the worker for a sub-agent request of the given size in bytes, held until exit
+Admit = Callable[[int], AsyncContextManager[Any]]
+
+
+def admit_immediately(size: int) -> AsyncContextManager[Any]:
+    return nullcontext()
+
+
+@dataclass
+class Chunk:
+    document: str
+    index: int
+    total: int
+    text: str
+
+
+def is_splittable(question: Any) -> bool:
+    if not isinstance(question, list):
+        return False
+    documents = [block["document"] for block in question if "document" in block]
+    return bool(documents) and all(document["format"] in TEXT_FORMATS for document in documents)
+
+
+def get_question_text(question: List[dict]) -> str:
+    return "\n".join(block["text"] for block in question if "text" in block)
+
+
+def iter_pieces(text: str, max_chars: int) -> Iterator[str]:
+    for paragraph in re.split(r'(?<=\n\n)', text):
+        if len(paragraph) <= max_chars:
+            yield paragraph
+            continue
+        for line in paragraph.splitlines(keepends=True):
+            if len(line) <= max_chars:
+                yield line
+                continue
+            for start in range(0, len(line), max_chars):
+                yield line[start:start + max_chars]
+
+
+def get_table_header(text: str, fmt: str) -> str:
+    lines = text.split("\n", 2)
+    if fmt == "csv":
+        return lines[0] + "\n"
+    if len(lines) > 1 and lines[0].startswith("|") and lines[1].startswith("|---"):
+        return f"{lines[0]}\n{lines[1]}\n"
+    return ""
+
+
+def split_text(text: str, max_chars: int, header: str = "") -> List[str]:
+    """
+    Splits text in chunks of at most max_chars, on paragraph boundaries first, then lines, then anywhere.
+    The header (the header row of a table) is repeated at the start of every chunk.
+    """
+    if header and text.startswith(header):
+        text = text[len(header):]
+    budget = max(max_chars - len(header), 1)
+
+    chunks, current, size = [], [], 0
+    for piece in iter_pieces(text, budget):
+        if current and size + len(piece) > budget:
+            chunks.append(header + "".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece)
+    if current:
+        chunks.append(header + "".join(current))
+    return chunks
+
+
+def get_chunks(question: List[dict], chunk_tokens: int = MAPREDUCE_CHUNK_TOKENS) -> List[Chunk]:
+    max_chars = int(chunk_tokens * DEFAULT_BYTES_PER_TOKEN)
+    chunks = []
+    for block in question:
+        if "document" not in block:
+            continue
+        document = block["document"]
+        text = bytes(read_source(document["source"]["bytes"])).decode("utf-8", errors="replace")
+        parts = split_text(text, max_chars, header=get_table_header(text, document["format"]))
+        chunks += [Chunk(document=document["name"], index=i, total=len(parts), text=part)
+                   for i, part in enumerate(parts)]
+    return chunks
+
+
+async def map_chunks(
+        prompt: str,
+        chunks: List[Chunk],
+        agent_factory: Callable[..., Any],
+        max_concurrency: int,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        admit: Admit = admit_immediately,
+) -> List[str]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+    done = 0
+
+    async def map_chunk(chunk: Chunk) -> str:
+        nonlocal done
+        request = (f"Question: {prompt}\n\n"
+                   f"Excerpt {chunk.index + 1} of {chunk.total} of the document \"{chunk.document}\":\n\n{chunk.text}")
+        async with semaphore, admit(len(request.encode())):
+            agent = agent_factory(system_prompt=MAP_SYSTEM_PROMPT)
+            result = await agent.invoke_async(request)
+        done += 1
+        if on_progress:
+            await on_progress(done, len(chunks))
+        return f"[{chunk.document}, part {chunk.index + 1} of {chunk.total}]\n{str(result).strip()}"
+
+    notes = await asyncio.gather(*(map_chunk(chunk) for chunk in chunks))
+    return [note for note in notes if not note.endswith(NO_RELEVANT_INFORMATION)]
+
+
+async def reduce_notes(
+        prompt: str,
+        notes: List[str],
+        agent_factory: Callable[..., Any],
+        chunk_tokens: int,
+        max_concurrency: int,
+        admit: Admit = admit_immediately,
+) -> List[str]:
+    """
+    Reduces the notes in groups until all of them fit in a single chunk, so the final reduce never overflows.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def reduce_group(group: List[str]) -> str:
+        if len(group) == 1:
+            return group[0]
+        request = build_reduce_prompt(prompt, group)
+        async with semaphore, admit(len(request.encode())):
+            agent = agent_factory(system_prompt=REDUCE_SYSTEM_PROMPT)
+            result = await agent.invoke_async(request)
+        return str(result).strip()
+
+    while len(notes) > 1 and estimate_text_tokens("\n\n".join(notes)) > chunk_tokens:
+        groups, current = [], []
+        for note in notes:
+            if current and estimate_text_tokens("\n\n".join(current + [note])) > chunk_tokens:
+                groups.append(current)
+                current = []
+            current.append(note)
+        groups.append(current)
+        if len(groups) == len(notes):
+            break
+        notes = list(await asyncio.gather(*(reduce_group(group) for group in groups)))
+    return notes
+
+
+def build_reduce_prompt(prompt: str, notes: List[str]) -> str:
+    joined = "\n\n".join(notes) if notes else NO_RELEVANT_INFORMATION
+    return f"Question: {prompt}\n\nNotes:\n\n{joined}"
+
+
+async def map_reduce(
+        question: List[dict],
+        agent_factory: Callable[..., Any],
+        chunk_tokens: int = MAPREDUCE_CHUNK_TOKENS,
+        max_concurrency: int = MAPREDUCE_MAX_CONCURRENCY,
+        on_progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+        admit: Admit = admit_immediately,
+) -> AsyncIterator[Any]:
+    """
+    Answers a question about documents larger than the context window.
+
+    The documents are split in chunks that are read concurrently by sub-agents (at most max_concurrency at a
+    time), and their notes are reduced into a final answer whose events are streamed like agent.stream_async.
+
+    Args:
+        question: Content blocks with the documents and the question text
+        agent_factory: Builds the sub-agents, called with a system_prompt keyword argument
+        chunk_tokens: Estimated tokens of every chunk
+        max_concurrency: Maximum number of chunks processed at the same time
+        on_progress: Awaited with (processed chunks, total chunks) after every chunk
+        admit: Holds a model stream of the worker for every sub-agent request, called with its size in bytes
+    """
+    prompt = get_question_text(question)
+    chunks = get_chunks(question, chunk_tokens)
+    logger.info(f"[map_reduce] {len(chunks)} chunks of ~{chunk_tokens} tokens")
+
+    notes = await map_chunks(prompt, chunks, agent_factory, max_concurrency, on_progress, admit)
+    notes = await reduce_notes(prompt, notes, agent_factory, chunk_tokens, max_concurrency, admit)
+
+    request = build_reduce_prompt(prompt, notes)
+    async with admit(len(request.encode())):
+        agent = agent_factory(system_prompt=REDUCE_SYSTEM_PROMPT)
+        async for event in agent.stream_async(request):
+            yield event
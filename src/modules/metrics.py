@@ -0,0 +1,140 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+METRICS_PREFIX = "file_ia"
+
+SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(11))
+TOKENS_BUCKETS = (100, 500, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 200_000)
+THROUGHPUT_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 400)
+
+
+def escape_label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Cumulative histogram with fixed buckets, one series per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            counts, totals = self._series.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            totals[0] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def snapshot(self, **labels: str) -> Dict[str, Any]:
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            counts, totals = self._series.get(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            return {"count": sum(counts), "sum": totals[0], "counts": list(counts)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            for key, (counts, totals) in series:
+                labels = dict(zip(self.labels, key))
+                cumulative = 0
+                for bound, count in zip((*self.buckets, math.inf), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels({**labels, 'le': format_value(bound)})} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(labels)} {format_value(totals[0])}")
+                lines.append(f"{self.name}_count{format_labels(labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Histograms of the worker plus the stats() of its caches, rendered in the Prometheus text format.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self.histograms: Dict[str, Histogram] = {}
+        self.stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        histogram = Histogram(f"{self.prefix}_{name}", documentation, buckets, labels)
+        self.histograms[name] = histogram
+        return histogram
+
+    def add_stats(self, name: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        self.stats[name] = stats
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms.values():
+            lines += histogram.render()
+        for name, stats in self.stats.items():
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f"{self.prefix}_{name}_{key}"
+                    lines += [f"# TYPE {metric} gauge", f"{metric} {format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+ingestion_seconds = registry.histogram(
+    "ingestion_seconds", "Time to read and prepare the attachments of a message", SECONDS_BUCKETS)
+ingestion_bytes = registry.histogram(
+    "ingestion_bytes", "Bytes of the attachments of a message", BYTES_BUCKETS)
+request_bytes = registry.histogram(
+    "request_bytes", "Bytes of the question content blocks sent to the model", BYTES_BUCKETS)
+request_blocks = registry.histogram(
+    "request_blocks", "Content blocks of the question sent to the model", (1, 2, 3, 5, 10, 20))
+time_to_first_token_seconds = registry.histogram(
+    "time_to_first_token_seconds", "Time from the question to the first streamed token", SECONDS_BUCKETS)
+turn_seconds = registry.histogram(
+    "turn_seconds", "Time from the question to the end of the answer", SECONDS_BUCKETS)
+stream_tokens_per_second = registry.histogram(
+    "stream_tokens_per_second", "Output tokens per second after the first token", THROUGHPUT_BUCKETS)
+tool_seconds = registry.histogram(
+    "tool_seconds", "Duration of the tool calls", SECONDS_BUCKETS, labels=("tool",))
+input_tokens = registry.histogram(
+    "input_tokens", "Bedrock input tokens of a turn, cached ones included", TOKENS_BUCKETS)
+output_tokens = registry.histogram(
+    "output_tokens", "Bedrock output tokens of a turn", TOKENS_BUCKETS)
+admission_wait_seconds = registry.histogram(
+    "admission_wait_seconds", "Time a turn waited for a free model stream", SECONDS_BUCKETS)
+rate_limit_wait_seconds = registry.histogram(
+    "rate_limit_wait_seconds", "Time a model request waited for the shared rate limiter", SECONDS_BUCKETS)
@@ -0,0 +1,162 @@
+import io
+import logging
+import mmap
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import IO, Any, Iterator, List, Optional
+
+from pypdf import PdfReader, PdfWriter
+from pypdf.errors import PyPdfError
+
+logger = logging.getLogger(__name__)
+
+OUTLINE_MAX_ENTRIES = 500
+# Store suffix of the previews of long PDFs: their whole documents are stored next to them
+PDF_PREVIEW_SUFFIX = ".preview.pdf"
+# Errors raised by pypdf on malformed documents, besides its own
+READ_ERRORS = (PyPdfError, ValueError, KeyError, TypeError, IndexError, AttributeError, RecursionError,
+               NotImplementedError)
+
+
+class PdfError(ValueError):
+    pass
+
+
+@dataclass
+class OutlineEntry:
+    title: str
+    level: int
+    page: Optional[int]
+
+
+def read_outline(reader: PdfReader) -> List[OutlineEntry]:
+    """
+    Returns:
+        The flattened outline of a document, at most OUTLINE_MAX_ENTRIES entries, with their page counted from 0
+    """
+    entries: List[OutlineEntry] = []
+
+    def visit(items: List[Any], level: int) -> None:
+        for item in items:
+            if len(entries) >= OUTLINE_MAX_ENTRIES:
+                return
+            # The children of an entry are the list that follows it
+            if isinstance(item, list):
+                visit(item, level + 1)
+                continue
+            page = reader.get_destination_page_number(item)
+            entries.append(OutlineEntry(title=item.title or "", level=level, page=page if page >= 0 else None))
+
+    visit(reader.outline, 0)
+    return entries
+
+
+class PdfDocument:
+    """
+    Page index of a PDF: its pages and outline, read once at upload by pypdf.
+
+    The objects of the pages are read from the document only when a range of pages is cut out of it:
+    write_pages then copies the pages in a standalone PDF. open memory-maps the file, so those reads come from
+    the page cache instead of a copy of the document in the heap. Encrypted documents are not supported.
+    """
+
+    def __init__(self, reader: PdfReader, file: Optional[IO[bytes]] = None):
+        self.reader = reader
+        self.outline: List[OutlineEntry] = []
+        self._file = file
+        # The reader loads objects on demand and is not safe to share between threads
+        self._lock = threading.Lock()
+
+    @classmethod
+    def open(cls, path: Path) -> "PdfDocument":
+        """
+        Raises:
+            PdfError: If the document is not a PDF pypdf can read
+        """
+        with Path(path).open("rb") as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise PdfError("Invalid document: empty file")
+        try:
+            return cls.read(data, data)
+        except BaseException:
+            data.close()
+            raise
+
+    @classmethod
+    def load(cls, data: bytes) -> "PdfDocument":
+        return cls.read(io.BytesIO(data))
+
+    @classmethod
+    def read(cls, stream: IO[bytes], file: Optional[IO[bytes]] = None) -> "PdfDocument":
+        """
+        Raises:
+            PdfError: If the document is not a PDF pypdf can read
+        """
+        try:
+            reader = PdfReader(stream)
+            if reader.is_encrypted:
+                raise PdfError("Encrypted documents are not supported")
+            document = cls(reader, file)
+            if not document.page_count:
+                raise PdfError("No pages")
+        except READ_ERRORS as e:
+            raise PdfError(f"Invalid document: {e}")
+        try:
+            document.outline = read_outline(reader)
+        except READ_ERRORS as e:
+            logger.debug(f"Invalid outline, ignored: {e}")
+        return document
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def page_count(self) -> int:
+        return len(self.reader.pages)
+
+    def write_pages(self, start: int, end: int) -> bytes:
+        """
+        Returns:
+            A PDF of the pages start to end, counted from 1 and included
+        """
+        writer = PdfWriter()
+        with self._lock:
+            for index in range(start - 1, end):
+                writer.add_page(self.reader.pages[index])
+            buffer = io.BytesIO()
+            writer.write(buffer)
+        return buffer.getvalue()
+
+
+def iter_outline(outline: List[OutlineEntry]) -> Iterator[str]:
+    for entry in outline:
+        page = f" (page {entry.page + 1})" if entry.page is not None else ""
+        yield f"{'  ' * entry.level}- {entry.title or 'Untitled'}{page}"
+
+
+def describe_document(document: PdfDocument, name: str, preview_pages: int) -> str:
+    """
+    Returns:
+        What the model is told about a document sent as a preview: its size, outline and how to read the rest
+    """
+    outline = "\n".join(iter_outline(document.outline)) or "The document has no outline."
+    return (f"The document {name} has {document.page_count} pages: only pages 1 to {preview_pages} are attached. "
+            f"Use the read_pages tool to read other pages, guided by the outline.\n\nOutline of {name}:\n{outline}")
+
+
+def build_pdf_preview(data: bytes, min_pages: int, preview_pages: int) -> Optional[bytes]:
+    """
+    Returns:
+        A PDF of the first preview_pages pages of the document, None if it has no more than min_pages pages
+
+    Raises:
+        PdfError: If the document cannot be read
+    """
+    document = PdfDocument.load(data)
+    if document.page_count <= max(min_pages, preview_pages):
+        return None
+    return document.write_pages(1, preview_pages)
@@ -0,0 +1,137 @@
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from strands.hooks import HookProvider, HookRegistry, BeforeInvocationEvent, AfterInvocationEvent, BeforeModelCallEvent
+
+logger = logging.getLogger(__name__)
+
+# Bedrock accepts at most 4 cache checkpoints per request, counting the system prompt and tools ones.
+MAX_CACHE_POINTS = 4
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+def is_cache_point(block: Dict[str, Any]) -> bool:
+    return "cachePoint" in block
+
+
+def get_system_prompt_blocks(system_prompt: str) -> List[Dict[str, Any]]:
+    return [{"text": system_prompt}, CACHE_POINT]
+
+
+def get_cache_point_positions(messages: List[Dict[str, Any]], max_points: int) -> List[Tuple[int, int]]:
+    """
+    Chooses where to put the message checkpoints of a request, as (message index, block index) positions.
+
+    The end of the conversation gets one, so the next call of a tool loop or the next turn reads the whole
+    history from the cache. The rest go after the documents of the most recent messages that attached any,
+    which keeps them cached even when the history after them changes.
+    """
+    if max_points <= 0 or not messages:
+        return []
+
+    documents = []
+    for i in reversed(range(len(messages))):
+        content = messages[i].get("content", [])
+        positions = [j for j, block in enumerate(content) if "document" in block]
+        if positions:
+            documents.append((i, positions[-1] + 1))
+
+    last = len(messages) - 1
+    tail = (last, len(messages[last].get("content", [])))
+    positions = [tail] + [position for position in documents if position != tail]
+    return sorted(positions[:max_points])
+
+
+def place_cache_points(messages: List[Dict[str, Any]], max_points: int) -> int:
+    """
+    Moves the cache checkpoints of the conversation to the positions chosen by get_cache_point_positions.
+
+    The content lists are replaced instead of modified, since they can be shared with the chat history.
+
+    Returns:
+        The number of checkpoints placed
+    """
+    for message in messages:
+        content = message.get("content", [])
+        if any(is_cache_point(block) for block in content):
+            message["content"] = [block for block in content if not is_cache_point(block)]
+
+    positions = get_cache_point_positions(messages, max_points)
+    for i, j in reversed(positions):
+        content = list(messages[i]["content"])
+        content.insert(j, CACHE_POINT)
+        messages[i]["content"] = content
+    return len(positions)
+
+
+class PromptCacheStats:
+    """
+    Prompt cache usage reported by Bedrock, aggregated over every agent of the worker.
+    """
+
+    def __init__(self):
+        self.invocations = 0
+        self.input_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self._lock = threading.Lock()
+
+    def record(self, input_tokens: int, cache_read_tokens: int, cache_write_tokens: int) -> None:
+        with self._lock:
+            self.invocations += 1
+            self.input_tokens += input_tokens
+            self.cache_read_tokens += cache_read_tokens
+            self.cache_write_tokens += cache_write_tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self.invocations = self.input_tokens = self.cache_read_tokens = self.cache_write_tokens = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            prompt_tokens = self.input_tokens + self.cache_read_tokens + self.cache_write_tokens
+            return {
+                "invocations": self.invocations,
+                "input_tokens": self.input_tokens,
+                "cache_read_tokens": self.cache_read_tokens,
+                "cache_write_tokens": self.cache_write_tokens,
+                "hit_ratio": self.cache_read_tokens / prompt_tokens if prompt_tokens else 0.0,
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
+
+
+class PromptCacheHooks(HookProvider):
+    """
+    Places the message cache checkpoints before every model call and records the cache usage of every invocation.
+
+    Args:
+        max_points: Checkpoints available for the messages, after the system prompt and tools ones
+        stats: Where the cache usage is recorded
+    """
+
+    def __init__(self, max_points: int, stats: Optional[PromptCacheStats] = None):
+        self.max_points = max_points
+        self.stats = stats or prompt_cache_stats
+        self._usage: Dict[str, int] = {}
+
+    def register_hooks(self, registry: HookRegistry) -> None:
+        registry.add_callback(BeforeInvocationEvent, self.before_invocation)
+        registry.add_callback(BeforeModelCallEvent, self.before_model_call)
+        registry.add_callback(AfterInvocationEvent, self.after_invocation)
+
+    def before_invocation(self, event: BeforeInvocationEvent) -> None:
+        self._usage = dict(event.agent.event_loop_metrics.accumulated_usage)
+
+    def before_model_call(self, event: BeforeModelCallEvent) -> None:
+        place_cache_points(event.agent.messages, self.max_points)
+
+    def after_invocation(self, event: AfterInvocationEvent) -> None:
+        usage = event.agent.event_loop_metrics.accumulated_usage
+        delta = {key: usage.get(key, 0) - self._usage.get(key, 0)
+                 for key in ("inputTokens", "cacheReadInputTokens", "cacheWriteInputTokens")}
+        self.stats.record(delta["inputTokens"], delta["cacheReadInputTokens"], delta["cacheWriteInputTokens"])
+        logger.info(f"Prompt cache: {delta['cacheReadInputTokens']:,} tokens read, "
+                    f"{delta['cacheWriteInputTokens']:,} written, {delta['inputTokens']:,} uncached")
@@ -25,6 +25,7 @@ When routing, clearly state:
 - Always provide context to specialized agents about what the user needs
 - If a request is ambiguous, ask the user for clarification before routing
 - For multi-agent requests, coordinate the sequence (e.g., get data first, then analyze)
+- When several tools are needed and none depends on the result of another, call them all in the same response: they run in parallel
 - Maintain conversation context across multiple exchanges
 - Be concise but thorough in your routing decisions
 
@@ -51,3 +52,15 @@ No questions, no offers, no suggestions, no transition phrases, no inferred moti
 End each response immediately after delivering the informational or requested material, without appendices, without soft closures.
 The sole objective is to assist in the restoration of high-fidelity independent thinking.
 Model obsolescence through user self-sufficiency is the end result."""
+
+MAP_SYSTEM_PROMPT = """You read one excerpt of a document that is too large to be read at once.
+Extract from the excerpt every fact, figure and quote that is relevant to the user's question.
+Use only the information in the excerpt. Do not answer from general knowledge.
+Keep the extraction concise and mention where in the excerpt each fact appears (section, heading or row).
+If the excerpt contains nothing relevant to the question, reply exactly: NO RELEVANT INFORMATION"""
+
+REDUCE_SYSTEM_PROMPT = """You answer a question about a large document from notes taken on consecutive excerpts of it.
+The notes are in document order. Combine them into a single, coherent answer to the user's question.
+Use only the information in the notes. Ignore notes that say NO RELEVANT INFORMATION.
+Resolve duplicates and contradictions between excerpts, and say so when the notes are insufficient to answer.
+Never mention excerpts, notes or the way the document was processed."""
@@ -0,0 +1,253 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterable, Callable, Dict, Tuple
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+from strands.models import Model
+from strands.types.exceptions import ModelThrottledException
+
+from modules.metrics import rate_limit_wait_seconds
+from settings import (
+    MODEL_RATE_LIMIT, MODEL_RATE_LIMIT_MIN, MODEL_RATE_LIMIT_BURST, MODEL_THROTTLE_MAX_ATTEMPTS, MODEL_HEDGE_AFTER,
+    MODEL_RETRY_DELAY)
+
+logger = logging.getLogger(__name__)
+
+# Bedrock errors worth sending the same request again, lowercase since stream events name them in camel case
+TRANSIENT_ERROR_CODES = {"internalserverexception", "serviceunavailableexception", "modelnotreadyexception"}
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Returns:
+        Whether the error is a server or connection failure a new attempt of the request may not meet
+    """
+    if isinstance(error, ClientError):
+        return error.response.get("Error", {}).get("Code", "").lower() in TRANSIENT_ERROR_CODES
+    # Connection refused, reset or timed out
+    return isinstance(error, (ConnectionError, HTTPClientError))
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket of model requests per second, shared by every agent and sub-agent of the worker.
+
+    A throttle empties the bucket and multiplies the rate by decrease, at most once per cooldown seconds
+    since the requests of one burst are throttled together. Every successful request then adds increase
+    requests per second back, until max_rate.
+    """
+
+    def __init__(
+            self,
+            max_rate: float,
+            min_rate: float,
+            burst: int,
+            decrease: float = 0.5,
+            increase: float = 0.0,
+            cooldown: float = 1.0,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.decrease = decrease
+        self.increase = increase or max_rate / 20
+        self.cooldown = cooldown
+        self.clock = clock
+        self.rate = max_rate
+        self.tokens = float(burst)
+        self.throttles = 0
+        self.decreases = 0
+        self.waits = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._updated = clock()
+        self._decreased = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    async def acquire(self) -> None:
+        started = time.perf_counter()
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    break
+                delay = (1 - self.tokens) / self.rate
+                self.waits += 1
+            await asyncio.sleep(delay)
+        rate_limit_wait_seconds.observe(time.perf_counter() - started)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.throttles += 1
+            now = self.clock()
+            if now - self._decreased < self.cooldown:
+                return
+            self._refill()
+            self._decreased = now
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            self.decreases += 1
+        logger.warning(f"Model throttled, rate limited to {self.rate:.2f} requests/s")
+
+    def on_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def on_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill()
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "max_rate": self.max_rate,
+                "throttles": self.throttles,
+                "decreases": self.decreases,
+                "waits": self.waits,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+
+
+rate_limiter = AdaptiveRateLimiter(
+    max_rate=MODEL_RATE_LIMIT, min_rate=MODEL_RATE_LIMIT_MIN, burst=MODEL_RATE_LIMIT_BURST)
+
+
+def discard_result(future: asyncio.Future) -> None:
+    if not future.cancelled():
+        future.exception()
+
+
+class RateLimitedModel(Model):
+    """
+    Model whose requests go through the shared rate limiter.
+
+    Throttled requests are retried up to max_attempts times, paced by the limiter, and so are transient errors
+    (see is_transient_error) after an exponential backoff from retry_delay seconds. Only requests that failed
+    before their first event are retried, so an answer is never streamed twice. When hedge_after seconds
+    pass without a first event and the limiter has a token to spare, the same request is sent a second time
+    and the first stream to start wins, the other one is cancelled and closed.
+    """
+
+    def __init__(
+            self,
+            model: Model,
+            limiter: AdaptiveRateLimiter = rate_limiter,
+            max_attempts: int = MODEL_THROTTLE_MAX_ATTEMPTS,
+            hedge_after: float = MODEL_HEDGE_AFTER,
+            retry_delay: float = MODEL_RETRY_DELAY,
+    ):
+        self.model = model
+        self.limiter = limiter
+        self.max_attempts = max_attempts
+        self.hedge_after = hedge_after
+        self.retry_delay = retry_delay
+
+    @property
+    def config(self) -> Any:
+        return self.model.get_config()
+
+    def update_config(self, **model_config: Any) -> None:
+        self.model.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.model.get_config()
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        return self.model.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+
+    async def _start(self, args: Tuple, kwargs: Dict[str, Any]) -> Tuple[Any, Any]:
+        """
+        Returns:
+            The first event of the request and its stream, from the hedged request if it started first
+        """
+        first = self.model.stream(*args, **kwargs)
+        pending = {asyncio.ensure_future(anext(first)): first}
+        hedged = not self.hedge_after
+        try:
+            while True:
+                done, _ = await asyncio.wait(
+                    pending, timeout=None if hedged else self.hedge_after, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    if self.limiter.try_acquire():
+                        self.limiter.on_hedge()
+                        logger.info(f"No first event after {self.hedge_after}s, hedging the request")
+                        hedge = self.model.stream(*args, **kwargs)
+                        pending[asyncio.ensure_future(anext(hedge))] = hedge
+                    continue
+                for future in done:
+                    stream = pending.pop(future)
+                    # A failed request only loses if the other one can still start
+                    if future.exception() is None or not pending:
+                        if stream is not first:
+                            self.limiter.on_hedge_win()
+                        return future.result(), stream
+        finally:
+            for future in pending:
+                future.cancel()
+            # A generator cannot be closed while it runs: the losing requests are closed once cancelled
+            await asyncio.gather(*pending, return_exceptions=True)
+            for stream in pending.values():
+                await stream.aclose()
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs) -> AsyncIterable[Any]:
+        args = (messages, tool_specs, system_prompt)
+        for attempt in range(1, self.max_attempts + 1):
+            await self.limiter.acquire()
+            try:
+                event, stream = await self._start(args, kwargs)
+            except StopAsyncIteration:
+                return
+            except ModelThrottledException:
+                self.limiter.on_throttle()
+                if attempt == self.max_attempts:
+                    raise
+                logger.info(f"Model throttled, attempt {attempt} of {self.max_attempts}")
+                continue
+            except Exception as e:
+                if attempt == self.max_attempts or not is_transient_error(e):
+                    raise
+                # Full jitter, so the requests failed together are not retried together
+                delay = random.uniform(0, self.retry_delay * 2 ** (attempt - 1))
+                logger.info(f"Model error, attempt {attempt} of {self.max_attempts}, retrying in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+                continue
+
+            try:
+                yield event
+                async for event in stream:
+                    yield event
+            except ModelThrottledException:
+                self.limiter.on_throttle()
+                raise
+            finally:
+                # Closed right away when the turn is cancelled, rather than when it is garbage collected
+                await stream.aclose()
+            self.limiter.on_success()
+            return
@@ -0,0 +1,284 @@
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from strands.hooks import HookProvider, HookRegistry, BeforeToolCallEvent, AfterToolCallEvent
+from strands.models import Model
+from strands.tools.tools import PythonAgentTool
+
+from settings import ModelBackend, MODEL_RECORDINGS_PATH, MODEL_REPLAY_SPEED, MODEL_REPLAY_TOOLS
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_cassettes: Dict[str, "Cassette"] = {}
+
+
+class RecordingNotFoundError(Exception):
+    pass
+
+
+def get_hash(value: Any) -> str:
+    data = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+
+def get_canonical_content(content: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Content blocks without their cache points, the bytes of documents and images replaced with their size.
+    """
+    blocks = []
+    for block in content:
+        if "cachePoint" in block:
+            continue
+        for kind in ("document", "image"):
+            if kind in block:
+                source = block[kind].get("source", {})
+                if "bytes" in source:
+                    block = {kind: {**block[kind], "source": {"bytes": len(source["bytes"])}}}
+        blocks.append(block)
+    return blocks
+
+
+def get_system_prompt_text(system_prompt: Optional[str], system_prompt_content: Optional[List[Any]]) -> str:
+    if system_prompt_content:
+        return "".join(block.get("text", "") for block in system_prompt_content)
+    return system_prompt or ""
+
+
+def get_structured_output_specs(output_model: Any) -> List[Dict[str, Any]]:
+    # Structured output is requested as a tool named after the output model
+    return [{"name": output_model.__name__}]
+
+
+def get_request_key(system_prompt: str, tool_specs: Optional[List[Any]], messages: List[Dict[str, Any]]) -> str:
+    return get_hash({
+        "system": system_prompt,
+        "tools": sorted(spec["name"] for spec in tool_specs or []),
+        "messages": [{"role": message["role"], "content": get_canonical_content(message["content"])}
+                     for message in messages],
+    })
+
+
+class Cassette:
+    """
+    Recordings of model streams, structured outputs and tool results, appended as gzip JSON lines to a file.
+
+    An entry is found by the key of its request or, when the traffic changed (e.g. a new conversation
+    manager rewrote the history), by order among the unused entries of its group: the system prompt of the
+    agent for the model calls, the tool name for the tool results.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        self._entries: Optional[List[Dict[str, Any]]] = None
+        self._used: set = set()
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict[str, Any]) -> None:
+        line = json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(line)
+            if self._entries is not None:
+                self._entries.append(entry)
+
+    def _load(self) -> List[Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = []
+            if self.path.exists():
+                with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                    self._entries = [json.loads(line) for line in f if line.strip()]
+            logger.info(f"Loaded {len(self._entries)} recordings from {self.path}")
+        return self._entries
+
+    def find(self, kind: str, key: str, group: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entries = [(i, entry) for i, entry in enumerate(self._load())
+                       if entry["kind"] == kind and entry["group"] == group]
+            # Identical requests replay the same entry, so recorded traffic can be replayed by many users
+            found = (next(((i, e) for i, e in entries if e["key"] == key and i not in self._used), None)
+                     or next(((i, e) for i, e in entries if e["key"] == key), None))
+            if found:
+                self.hits += 1
+            else:
+                found = next(((i, e) for i, e in entries if i not in self._used), None)
+                if found is None:
+                    self.misses += 1
+                    return None
+                self.fallbacks += 1
+            self._used.add(found[0])
+            return found[1]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries or []),
+                "hits": self.hits,
+                "fallbacks": self.fallbacks,
+                "misses": self.misses,
+            }
+
+
+def get_cassette(path: str = MODEL_RECORDINGS_PATH) -> Cassette:
+    with _lock:
+        cassette = _cassettes.get(path)
+        if cassette is None:
+            cassette = _cassettes[path] = Cassette(Path(path))
+        return cassette
+
+
+class RecordingModel(Model):
+    """
+    Model that forwards the requests to another one, recording its stream and structured output events and
+    their timing.
+    """
+
+    def __init__(self, model: Model, cassette: Cassette):
+        self.model = model
+        self.cassette = cassette
+
+    @property
+    def config(self) -> Any:
+        return self.model.get_config()
+
+    def update_config(self, **model_config: Any) -> None:
+        self.model.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.model.get_config()
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs) -> AsyncIterable[Any]:
+        system = system_prompt or ""
+        key = get_request_key(system, get_structured_output_specs(output_model), prompt)
+        started = time.perf_counter()
+        events = []
+        async for event in self.model.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs):
+            # The output is an instance of the output model, recorded as its fields
+            recorded = {"output": event["output"].model_dump(mode="json")} if "output" in event else event
+            events.append([round(time.perf_counter() - started, 4), recorded])
+            yield event
+        self.cassette.append({"kind": "structured_output", "key": key, "group": get_hash(system), "events": events})
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs) -> AsyncIterable[Any]:
+        system = get_system_prompt_text(system_prompt, kwargs.get("system_prompt_content"))
+        key = get_request_key(system, tool_specs, messages)
+        started = time.perf_counter()
+        events = []
+        async for event in self.model.stream(messages, tool_specs, system_prompt, **kwargs):
+            events.append([round(time.perf_counter() - started, 4), event])
+            yield event
+        # Interrupted streams are not recorded
+        self.cassette.append({"kind": "model", "key": key, "group": get_hash(system), "events": events})
+
+
+class ReplayModel(Model):
+    """
+    Model that streams the recorded events of the requests, speed times faster than they were recorded
+    (0 to stream them without waiting).
+    """
+
+    def __init__(self, cassette: Cassette, model_id: str, speed: float = MODEL_REPLAY_SPEED):
+        self.cassette = cassette
+        self.config = {"model_id": model_id}
+        self.speed = speed
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Any:
+        return self.config
+
+    async def _replay(self, kind: str, key: str, system: str) -> AsyncIterable[Any]:
+        entry = self.cassette.find(kind, key, get_hash(system))
+        if entry is None:
+            raise RecordingNotFoundError(f"No recording left for this request in {self.cassette.path}")
+
+        started = time.perf_counter()
+        for offset, event in entry["events"]:
+            if self.speed:
+                delay = started + offset / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield event
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs) -> AsyncIterable[Any]:
+        system = system_prompt or ""
+        key = get_request_key(system, get_structured_output_specs(output_model), prompt)
+        async for event in self._replay("structured_output", key, system):
+            if "output" in event:
+                event = {"output": output_model.model_validate(event["output"])}
+            yield event
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs) -> AsyncIterable[Any]:
+        system = get_system_prompt_text(system_prompt, kwargs.get("system_prompt_content"))
+        async for event in self._replay("model", get_request_key(system, tool_specs, messages), system):
+            yield event
+
+
+class ToolRecordingHooks(HookProvider):
+    """
+    Records the results of the given tools, whose calls need the network or depend on the clock.
+    """
+
+    def __init__(self, cassette: Cassette, tools: List[str] = MODEL_REPLAY_TOOLS):
+        self.cassette = cassette
+        self.tools = set(tools)
+
+    def register_hooks(self, registry: HookRegistry) -> None:
+        registry.add_callback(AfterToolCallEvent, self.after_tool)
+
+    def after_tool(self, event: AfterToolCallEvent) -> None:
+        name = event.tool_use["name"]
+        if name in self.tools and event.exception is None and event.cancel_message is None:
+            self.cassette.append({
+                "kind": "tool",
+                "key": get_hash(event.tool_use.get("input")),
+                "group": name,
+                "result": event.result,
+            })
+
+
+class ToolReplayHooks(HookProvider):
+    """
+    Replaces the calls of the given tools with their recorded results. Calls without one run the real tool.
+    """
+
+    def __init__(self, cassette: Cassette, tools: List[str] = MODEL_REPLAY_TOOLS):
+        self.cassette = cassette
+        self.tools = set(tools)
+
+    def register_hooks(self, registry: HookRegistry) -> None:
+        registry.add_callback(BeforeToolCallEvent, self.before_tool)
+
+    def before_tool(self, event: BeforeToolCallEvent) -> None:
+        name = event.tool_use["name"]
+        if name not in self.tools or event.selected_tool is None:
+            return
+        entry = self.cassette.find("tool", get_hash(event.tool_use.get("input")), name)
+        if entry is None:
+            logger.warning(f"No recording left for tool {name}, running it")
+            return
+
+        def replay(tool_use, **kwargs):
+            return {**entry["result"], "toolUseId": tool_use["toolUseId"]}
+
+        event.selected_tool = PythonAgentTool(name, event.selected_tool.tool_spec, replay)
+
+
+def get_backend_hooks(backend: ModelBackend, cassette: Cassette) -> List[HookProvider]:
+    if backend == ModelBackend.RECORD:
+        return [ToolRecordingHooks(cassette)]
+    if backend == ModelBackend.REPLAY:
+        return [ToolReplayHooks(cassette)]
+    return []
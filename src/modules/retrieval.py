@@ -0,0 +1,109 @@
+import logging
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from heapq import nlargest
+from typing import Dict, List, Tuple
+
+from modules.mapreduce import TEXT_FORMATS, get_table_header, split_text
+from modules.store import read_source
+from settings import RETRIEVAL_PASSAGE_CHARS
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+@dataclass
+class Passage:
+    document: str
+    index: int
+    text: str
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index over the passages of the documents uploaded in a session.
+
+    Documents can be added at any time: idf is computed from the document frequencies at query time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.passages: List[Passage] = []
+        self.documents: Dict[str, int] = {}
+        self._lengths: List[int] = []
+        self._total_length = 0
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def add(self, document: str, passages: List[str]) -> None:
+        with self._lock:
+            for position, text in enumerate(passages):
+                passage_id = len(self.passages)
+                terms = Counter(tokenize(text))
+                for term, frequency in terms.items():
+                    self._postings[term].append((passage_id, frequency))
+                length = sum(terms.values())
+                self.passages.append(Passage(document=document, index=position, text=text))
+                self._lengths.append(length)
+                self._total_length += length
+            self.documents[document] = self.documents.get(document, 0) + len(passages)
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[float, Passage]]:
+        with self._lock:
+            if not self.passages:
+                return []
+            total = len(self.passages)
+            average_length = self._total_length / total
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for passage_id, frequency in postings:
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[passage_id] / average_length)
+                    scores[passage_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+            best = nlargest(top_k, scores.items(), key=lambda item: item[1])
+            return [(score, self.passages[passage_id]) for passage_id, score in best]
+
+    def __len__(self) -> int:
+        return len(self.passages)
+
+
+def get_passages(text: str, fmt: str, passage_chars: int = RETRIEVAL_PASSAGE_CHARS) -> List[str]:
+    return [p for p in split_text(text, passage_chars, header=get_table_header(text, fmt)) if p.strip()]
+
+
+def index_content_blocks(index: BM25Index, content_blocks: List[dict]) -> int:
+    """
+    Adds the text documents of a question to the index. Runs in the ingestion pool.
+
+    Returns:
+        The number of indexed passages
+    """
+    indexed = 0
+    for block in content_blocks:
+        document = block.get("document")
+        if not document or document["format"] not in TEXT_FORMATS or document["name"] in index.documents:
+            continue
+        text = bytes(read_source(document["source"]["bytes"])).decode("utf-8", errors="replace")
+        passages = get_passages(text, document["format"])
+        index.add(document["name"], passages)
+        indexed += len(passages)
+    return indexed
+
+
+def format_results(results: List[Tuple[float, Passage]]) -> str:
+    return "\n\n".join(
+        f"[{passage.document}, passage {passage.index + 1}, score {score:.2f}]\n{passage.text.strip()}"
+        for score, passage in results)
@@ -0,0 +1,194 @@
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from settings import DOCUMENT_STORE_DIR, DOCUMENT_STORE_MAX_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Directory of the hard links pinning the documents used by sessions, per worker process and session
+PINS_DIR = ".pins"
+
+
+@dataclass(frozen=True)
+class DocumentRef:
+    """
+    Reference to a document of the DocumentStore, used in content blocks in place of its bytes.
+
+    The conversation only holds references: the bytes are read when a request is built, or scanned in place
+    from a memory map with open(), so between turns they live in the page cache instead of the heap of the worker.
+    """
+    path: Path
+    size: int
+
+    def __len__(self) -> int:
+        return self.size
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @contextmanager
+    def open(self) -> Iterator[Any]:
+        """
+        Maps the document in memory, unmapping it on exit.
+        """
+        if self.size == 0:
+            yield b""
+            return
+        with self.path.open('rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The modification time is the last use of the document for the eviction of the store
+        os.utime(self.path)
+        with data:
+            yield data
+
+    def read(self) -> bytes:
+        with self.open() as data:
+            return data[:]
+
+
+def read_source(source: Any) -> Any:
+    """
+    Returns the bytes of a document source, reading them from the store if the source is a DocumentRef.
+    """
+    return source.read() if isinstance(source, DocumentRef) else source
+
+
+@contextmanager
+def open_source(source: Any) -> Iterator[Any]:
+    """
+    Gives the bytes of a document source, memory-mapped from the store if the source is a DocumentRef.
+    """
+    if isinstance(source, DocumentRef):
+        with source.open() as data:
+            yield data
+    else:
+        yield source
+
+
+class DocumentStore:
+    """
+    Directory of processed documents shared by every session of the node, named by digest and format.
+
+    When the files exceed max_bytes the least recently used ones are deleted, the use being the file
+    modification time, which every read refreshes. Files pinned by a session are never deleted: a pin is a hard
+    link, so the pins of every worker of the node are seen in the link count of the file.
+    """
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.remove_stale_pins()
+        self._size = sum(size for _, _, size, _ in self._scan())
+
+    def _scan(self):
+        for directory in os.scandir(self.root):
+            if not directory.is_dir() or directory.name.startswith("."):
+                continue
+            for entry in os.scandir(directory.path):
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    yield stat.st_mtime, Path(entry.path), stat.st_size, stat.st_nlink > 1
+
+    def get_pins_path(self, owner: str) -> Path:
+        return self.root / PINS_DIR / str(os.getpid()) / owner
+
+    def pin(self, owner: str, refs: Iterable[DocumentRef]) -> bool:
+        """
+        Keeps documents from eviction until the owner unpins them.
+
+        Returns:
+            Whether every document is still in the store
+        """
+        directory = self.get_pins_path(owner)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            for ref in refs:
+                try:
+                    os.link(ref.path, directory / ref.path.name)
+                except FileExistsError:
+                    pass
+                except FileNotFoundError:
+                    return False
+        return True
+
+    def unpin(self, owner: str) -> None:
+        shutil.rmtree(self.get_pins_path(owner), ignore_errors=True)
+
+    def remove_stale_pins(self) -> None:
+        """
+        Removes the pins of the worker processes that are gone.
+        """
+        pins = self.root / PINS_DIR
+        if not pins.is_dir():
+            return
+        for directory in os.scandir(pins):
+            try:
+                os.kill(int(directory.name), 0)
+            except ValueError:
+                continue
+            except ProcessLookupError:
+                shutil.rmtree(directory.path, ignore_errors=True)
+            except PermissionError:
+                pass
+
+    def get_path(self, digest: str, fmt: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.{fmt}"
+
+    def get(self, digest: str, fmt: str) -> Optional[DocumentRef]:
+        path = self.get_path(digest, fmt)
+        try:
+            return DocumentRef(path=path, size=path.stat().st_size)
+        except FileNotFoundError:
+            return None
+
+    def put(self, digest: str, fmt: str, data: bytes) -> DocumentRef:
+        path = self.get_path(digest, fmt)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            # Written aside and renamed, so readers never see a partial file
+            with tempfile.NamedTemporaryFile(dir=path.parent, prefix=".", delete=False) as f:
+                f.write(data)
+            os.replace(f.name, path)
+            with self._lock:
+                self.writes += 1
+            self.evict(keep=path)
+        return DocumentRef(path=path, size=len(data))
+
+    def evict(self, keep: Optional[Path] = None) -> None:
+        with self._lock:
+            # The directory is shared by the workers of the node: only a scan sees the files they wrote
+            files = sorted(self._scan())
+            self._size = sum(size for _, _, size, _ in files)
+            for _, path, size, pinned in files:
+                if self._size <= self.max_bytes:
+                    break
+                if pinned or path == keep:
+                    continue
+                path.unlink(missing_ok=True)
+                self._size -= size
+                self.evictions += 1
+                logger.debug(f"[DocumentStore] Evicted {path.name} ({size} bytes)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+                "writes": self.writes,
+                "evictions": self.evictions,
+            }
+
+
+document_store = DocumentStore(root=DOCUMENT_STORE_DIR, max_bytes=DOCUMENT_STORE_MAX_BYTES)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from settings import STREAM_FLUSH_INTERVAL, STREAM_FLUSH_BYTES
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuffer:
+    """
+    Coalesces streamed tokens into fewer, larger UI updates.
+
+    Tokens are sent once max_bytes are buffered or interval seconds after the first buffered token, whichever
+    comes first, and on flush() or when the buffer is closed. An interval of 0 sends every token as it comes.
+
+    Usage:
+        async with TokenBuffer(msg.stream_token) as buffer:
+            await buffer.write(token)
+    """
+
+    def __init__(
+            self,
+            send: Callable[[str], Awaitable[None]],
+            interval: float = STREAM_FLUSH_INTERVAL,
+            max_bytes: int = STREAM_FLUSH_BYTES,
+    ):
+        self.send = send
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.writes = 0
+        self.flushes = 0
+        self._parts: List[str] = []
+        self._size = 0
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._scheduled: Optional[asyncio.Future] = None
+
+    async def write(self, text: str) -> None:
+        if not text:
+            return
+        self._raise_failed_flush()
+        self.writes += 1
+        self._parts.append(text)
+        self._size += len(text.encode())
+        if self._size >= self.max_bytes or self.interval <= 0:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self._flush_later)
+
+    def _flush_later(self) -> None:
+        self._timer = None
+        self._scheduled = asyncio.ensure_future(self.flush())
+
+    def _raise_failed_flush(self) -> None:
+        # Timed flushes run in their own task: a failed send is raised by the next write rather than lost
+        if self._scheduled is not None and self._scheduled.done():
+            scheduled, self._scheduled = self._scheduled, None
+            scheduled.result()
+
+    async def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Sends are serialized so the text always arrives in order
+        async with self._lock:
+            if not self._parts:
+                return
+            text = "".join(self._parts)
+            self._parts, self._size = [], 0
+            self.flushes += 1
+            await self.send(text)
+
+    async def close(self) -> None:
+        await self.flush()
+        if self._scheduled is not None:
+            scheduled, self._scheduled = self._scheduled, None
+            await scheduled
+        logger.debug(f"Streamed {self.writes} tokens in {self.flushes} updates")
+
+    async def __aenter__(self) -> "TokenBuffer":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
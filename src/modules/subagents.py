@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Tuple
+
+import chainlit as cl
+from strands import Agent
+
+from modules.cancellation import cancellation_stats
+
+logger = logging.getLogger(__name__)
+
+# A factory returns the sub-agent and the resources (e.g. code interpreters) to clean up when it is discarded
+SubAgentFactory = Callable[[], Tuple[Agent, List[Any]]]
+
+
+@dataclass
+class PooledSubAgent:
+    agent: Agent
+    resources: List[Any] = field(default_factory=list)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def cleanup_resources(resources: List[Any]) -> None:
+    for resource in resources:
+        try:
+            resource.cleanup_platform()
+        except Exception as e:
+            logger.warning(f"Error cleaning up {type(resource).__name__}: {e}")
+
+
+class SubAgentPool:
+    """
+    Pool of initialised sub-agents of one session, so repeated tool calls reuse the agent, its tools and its
+    code interpreter session (and keep the context of related queries).
+
+    Concurrent calls get their own agent, because an agent cannot stream two requests at once.
+    Agents idle for longer than idle_timeout are discarded, as are agents whose request failed or was cancelled.
+    """
+
+    def __init__(self, name: str, factory: SubAgentFactory, idle_timeout: float):
+        self.name = name
+        self.factory = factory
+        self.idle_timeout = idle_timeout
+        self.created = 0
+        self.reused = 0
+        self._idle: List[PooledSubAgent] = []
+        self._busy: List[PooledSubAgent] = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        await self.evict_idle()
+        if self._idle:
+            pooled = self._idle.pop()
+            self.reused += 1
+        else:
+            agent, resources = self.factory()
+            pooled = PooledSubAgent(agent=agent, resources=resources)
+            self.created += 1
+            logger.debug(f"[{self.name}] created sub-agent ({self.created} created, {self.reused} reused)")
+
+        self._busy.append(pooled)
+        try:
+            yield pooled.agent
+        except BaseException as e:
+            self._busy.remove(pooled)
+            await asyncio.to_thread(cleanup_resources, pooled.resources)
+            if isinstance(e, (asyncio.CancelledError, GeneratorExit)):
+                cancellation_stats.record(resources=len(pooled.resources))
+            raise
+        self._busy.remove(pooled)
+        pooled.last_used = time.monotonic()
+        self._idle.append(pooled)
+
+    async def evict_idle(self) -> None:
+        now = time.monotonic()
+        expired = [pooled for pooled in self._idle if now - pooled.last_used > self.idle_timeout]
+        for pooled in expired:
+            self._idle.remove(pooled)
+            await asyncio.to_thread(cleanup_resources, pooled.resources)
+
+    async def close(self) -> None:
+        pooled_agents = self._idle + self._busy
+        self._idle, self._busy = [], []
+        for pooled in pooled_agents:
+            await asyncio.to_thread(cleanup_resources, pooled.resources)
+
+    def __len__(self) -> int:
+        return len(self._idle) + len(self._busy)
+
+
+def get_session_pool(name: str, factory: SubAgentFactory, idle_timeout: float) -> SubAgentPool:
+    pools: Dict[str, SubAgentPool] = cl.user_session.get("sub_agent_pools")
+    if pools is None:
+        pools = {}
+        cl.user_session.set("sub_agent_pools", pools)
+    if name not in pools:
+        pools[name] = SubAgentPool(name=name, factory=factory, idle_timeout=idle_timeout)
+    return pools[name]
+
+
+async def close_session_pools() -> None:
+    pools: Dict[str, SubAgentPool] = cl.user_session.get("sub_agent_pools") or {}
+    for pool in pools.values():
+        await pool.close()
+    pools.clear()
@@ -0,0 +1,179 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from modules.extractors import read_csv_rows, read_xlsx_sheets, to_markdown_table
+
+logger = logging.getLogger(__name__)
+
+# Uploads loaded in tables. build_table_database runs in the extraction pool: like the extractors, this module
+# must be importable without side effects
+TABLE_FORMATS = {"csv", "xlsx"}
+
+INTEGER_PATTERN = re.compile(r'[-+]?\d+')
+REAL_PATTERN = re.compile(r'[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?')
+# What a read-only query needs, the authorizer denies anything else (writes, ATTACH, PRAGMA...)
+READ_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def get_identifier(name: str, default: str, used: Set[str]) -> str:
+    """
+    Returns:
+        A lowercase SQL identifier for the name, made unique among the used ones (which it is added to)
+    """
+    identifier = re.sub(r'\W+', '_', name.strip().lower()).strip('_') or default
+    if identifier[0].isdigit():
+        identifier = f"{default}_{identifier}"
+    unique, suffix = identifier, 2
+    while unique in used:
+        unique, suffix = f"{identifier}_{suffix}", suffix + 1
+    used.add(unique)
+    return unique
+
+
+def read_tables(fmt: str, data: bytes) -> List[Tuple[str, List[List[str]]]]:
+    if fmt == "csv":
+        return [("", read_csv_rows(data))]
+    return read_xlsx_sheets(data)
+
+
+def get_column_type(values: Sequence[str]) -> str:
+    values = [value for value in values if value]
+    if values and all(INTEGER_PATTERN.fullmatch(value) for value in values):
+        return "INTEGER"
+    if values and all(REAL_PATTERN.fullmatch(value) for value in values):
+        return "REAL"
+    return "TEXT"
+
+
+def convert_value(value: str, column_type: str) -> Any:
+    if not value:
+        return None
+    if column_type == "INTEGER":
+        return int(value)
+    if column_type == "REAL":
+        return float(value)
+    return value
+
+
+def format_rows(columns: List[str], rows: Sequence[Sequence[Any]]) -> str:
+    return to_markdown_table([columns] + [["" if value is None else str(value) for value in row] for row in rows])
+
+
+def describe_table(connection: sqlite3.Connection, table: str, headers: List[str], sample_rows: int) -> str:
+    columns = connection.execute(f"SELECT name, type FROM pragma_table_info('{table}')").fetchall()
+    count = connection.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+    schema = format_rows(["column", "type", "header"], [
+        (name, column_type, header) for (name, column_type), header in zip(columns, headers)])
+    sample = connection.execute(f'SELECT * FROM "{table}" LIMIT {sample_rows}').fetchall()
+    return (f"## Table {table} ({count} rows)\n\n{schema}\n\n"
+            f"First {len(sample)} rows:\n\n{format_rows([name for name, _ in columns], sample)}")
+
+
+def build_table_database(fmt: str, data: bytes, name: str, sample_rows: int) -> Optional[Tuple[bytes, str]]:
+    """
+    Loads a CSV or XLSX upload in a SQLite database: one table per sheet, named after the document and the
+    sheet, with the first row as the header and INTEGER, REAL or TEXT columns depending on their values.
+
+    Returns:
+        The serialized database and the description of its tables for the model (schema and first rows),
+        None if no sheet has any row
+    """
+    connection = sqlite3.connect(":memory:", isolation_level=None)
+    tables, columns_used, sections = set(), set(), []
+    for sheet, rows in read_tables(fmt, data):
+        rows = [row for row in rows if any(cell.strip() for cell in row)]
+        if not rows:
+            continue
+        width = max(len(row) for row in rows)
+        headers, *body = [[cell.strip() for cell in row] + [""] * (width - len(row)) for row in rows]
+        table = get_identifier(f"{name} {sheet}", "table", tables)
+        columns_used.clear()
+        columns = [get_identifier(header, f"column_{i + 1}", columns_used) for i, header in enumerate(headers)]
+        types = [get_column_type([row[i] for row in body]) for i in range(width)]
+
+        definitions = ", ".join(f'"{column}" {column_type}' for column, column_type in zip(columns, types))
+        connection.execute(f'CREATE TABLE "{table}" ({definitions})')
+        connection.executemany(
+            f'INSERT INTO "{table}" VALUES ({", ".join("?" * width)})',
+            ([convert_value(value, column_type) for value, column_type in zip(row, types)] for row in body))
+        sections.append(describe_table(connection, table, headers, sample_rows))
+
+    if not sections:
+        return None
+    description = (f"# {name}\n\nThe rows of this document are loaded in SQLite tables: only their first rows are "
+                   f"shown here. Use the query_tables tool to filter, count or aggregate them.\n\n"
+                   + "\n\n".join(sections))
+    database = connection.serialize()
+    connection.close()
+    return database, description
+
+
+def authorize_read(action: int, *args: Any) -> int:
+    return sqlite3.SQLITE_OK if action in READ_ACTIONS else sqlite3.SQLITE_DENY
+
+
+class TableCatalog:
+    """
+    In-memory SQLite database of the tables uploaded in a session, queried by the query_tables tool.
+
+    Tables are copied from the databases of the document store once, when their document is uploaded.
+    Queries can only read, and are interrupted after their timeout.
+    """
+
+    def __init__(self):
+        self.tables: Dict[str, int] = {}
+        self._connection = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False, uri=True)
+        self._lock = threading.Lock()
+
+    def add(self, path: Path) -> List[str]:
+        """
+        Copies the tables of a database file, replacing the tables of the same name.
+
+        Returns:
+            The names of the copied tables
+        """
+        with self._lock:
+            self._connection.execute("ATTACH DATABASE ? AS upload", (f"{Path(path).absolute().as_uri()}?mode=ro",))
+            try:
+                definitions = self._connection.execute(
+                    "SELECT name, sql FROM upload.sqlite_master WHERE type = 'table'").fetchall()
+                for table, sql in definitions:
+                    self._connection.execute(f'DROP TABLE IF EXISTS main."{table}"')
+                    self._connection.execute(sql)
+                    self._connection.execute(f'INSERT INTO main."{table}" SELECT * FROM upload."{table}"')
+                    self.tables[table] = self._connection.execute(f'SELECT COUNT(*) FROM main."{table}"').fetchone()[0]
+            finally:
+                self._connection.execute("DETACH DATABASE upload")
+        return [table for table, _ in definitions]
+
+    def query(self, sql: str, max_rows: int, timeout: float) -> Tuple[List[str], List[Tuple], bool]:
+        """
+        Returns:
+            The columns and at most max_rows rows of the query, and whether there were more
+
+        Raises:
+            sqlite3.Error: If the query is invalid, is not read-only or takes longer than timeout seconds
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._connection.set_authorizer(authorize_read)
+            self._connection.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+            try:
+                cursor = self._connection.execute(sql)
+                columns = [column[0] for column in cursor.description or []]
+                rows = cursor.fetchmany(max_rows + 1)
+            finally:
+                self._connection.set_authorizer(None)
+                self._connection.set_progress_handler(None, 0)
+        return columns, rows[:max_rows], len(rows) > max_rows
+
+    def describe(self) -> str:
+        return ", ".join(f"{table} ({rows} rows)" for table, rows in self.tables.items())
+
+    def __len__(self) -> int:
+        return len(self.tables)
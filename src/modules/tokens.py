@@ -0,0 +1,177 @@
+import io
+import json
+import logging
+import re
+import zipfile
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+from modules.store import open_source
+from settings import Models, MODEL_CONTEXT_WINDOWS, MODEL_OUTPUT_TOKENS_RESERVE
+
+logger = logging.getLogger(__name__)
+
+# Average bytes per token of the uploaded file, per Bedrock document format. Markup heavy formats count
+# more bytes per token because Bedrock only hands the model their text.
+BYTES_PER_TOKEN = {
+    "txt": 4.0,
+    "md": 3.8,
+    "csv": 3.0,
+    "html": 6.0,
+    "doc": 6.0,
+    "xls": 6.0,
+}
+DEFAULT_BYTES_PER_TOKEN = 4.0
+# Office Open XML documents are zipped markup: only a fraction of the uncompressed XML is text.
+OOXML_MARKUP_RATIO = {
+    "docx": 0.30,
+    "xlsx": 0.20,
+}
+OOXML_CONTENT_PREFIXES = {
+    "docx": ("word/document.xml",),
+    "xlsx": ("xl/sharedStrings.xml", "xl/worksheets/"),
+}
+PDF_TOKENS_PER_PAGE = 1000
+PDF_BYTES_PER_TOKEN = 20.0
+IMAGE_TOKENS = 1600
+MESSAGE_OVERHEAD_TOKENS = 4
+DOCUMENT_OVERHEAD_TOKENS = 20
+PDF_PAGE_PATTERN = re.compile(rb"/Type ?/Page(?!s)")
+
+
+@dataclass
+class TokenEstimate:
+    system_prompt: int
+    tools: int
+    history: int
+    question: int
+    context_window: int
+    output_reserve: int
+
+    @property
+    def total(self) -> int:
+        return self.system_prompt + self.tools + self.history + self.question
+
+    @property
+    def available(self) -> int:
+        return self.context_window - self.output_reserve
+
+    @property
+    def fits(self) -> bool:
+        return self.total <= self.available
+
+    @property
+    def fits_without_history(self) -> bool:
+        """
+        Whether the new question fits by itself: the conversation manager can make room for it in the history.
+        """
+        return self.total - self.history <= self.available
+
+    @property
+    def usage(self) -> float:
+        return self.total / self.available if self.available > 0 else float("inf")
+
+    def summary(self) -> str:
+        return (f"~{self.total:,} input tokens of {self.available:,} available "
+                f"({self.usage:.0%}: documents and question {self.question:,}, history {self.history:,}, "
+                f"system prompt and tools {self.system_prompt + self.tools:,})")
+
+
+def estimate_text_tokens(text: str) -> int:
+    return int(len(text) / DEFAULT_BYTES_PER_TOKEN) + 1 if text else 0
+
+
+def count_pdf_pages(data: Any) -> int:
+    return sum(1 for _ in PDF_PAGE_PATTERN.finditer(data))
+
+
+def estimate_ooxml_tokens(fmt: str, data: Any) -> int:
+    try:
+        # Memory-mapped documents are read in place
+        with zipfile.ZipFile(data if hasattr(data, "seek") else io.BytesIO(data)) as archive:
+            xml_size = sum(
+                info.file_size for info in archive.infolist()
+                if info.filename.startswith(OOXML_CONTENT_PREFIXES[fmt]))
+    except zipfile.BadZipFile:
+        xml_size = len(data)
+    return int(xml_size * OOXML_MARKUP_RATIO[fmt] / DEFAULT_BYTES_PER_TOKEN)
+
+
+def estimate_document_tokens(fmt: str, data: Any) -> int:
+    """
+    Estimates the tokens of a document block without parsing it, so it can run on every turn.
+
+    Args:
+        fmt: Bedrock document format
+        data: Bytes of the document or its DocumentRef
+    """
+    size = len(data)
+    if fmt == "pdf":
+        with open_source(data) as source:
+            pages = count_pdf_pages(source)
+        tokens = pages * PDF_TOKENS_PER_PAGE if pages else int(size / PDF_BYTES_PER_TOKEN)
+    elif fmt in OOXML_MARKUP_RATIO:
+        with open_source(data) as source:
+            tokens = estimate_ooxml_tokens(fmt, source)
+    else:
+        tokens = int(size / BYTES_PER_TOKEN.get(fmt, DEFAULT_BYTES_PER_TOKEN))
+    return tokens + DOCUMENT_OVERHEAD_TOKENS
+
+
+def estimate_content_tokens(content: Any) -> int:
+    if isinstance(content, str):
+        return estimate_text_tokens(content)
+
+    tokens = 0
+    for block in content:
+        if "text" in block:
+            tokens += estimate_text_tokens(block["text"])
+        elif "document" in block:
+            document = block["document"]
+            tokens += estimate_document_tokens(document.get("format", "txt"), document["source"]["bytes"])
+        elif "image" in block:
+            tokens += IMAGE_TOKENS
+        elif "toolResult" in block:
+            tokens += estimate_content_tokens(
+                [c if "json" not in c else {"text": json.dumps(c["json"], default=str)}
+                 for c in block["toolResult"].get("content", [])])
+        elif "toolUse" in block:
+            tokens += estimate_text_tokens(json.dumps(block["toolUse"].get("input", {}), default=str))
+        elif "reasoningContent" in block:
+            tokens += estimate_text_tokens(block["reasoningContent"].get("reasoningText", {}).get("text", ""))
+    return tokens
+
+
+def estimate_messages_tokens(messages: Iterable[Dict[str, Any]]) -> int:
+    return sum(estimate_content_tokens(message.get("content", [])) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def estimate_request(
+        question: Any,
+        system_prompt: Optional[str] = None,
+        tool_specs: Optional[List[Dict[str, Any]]] = None,
+        messages: Optional[List[Dict[str, Any]]] = None,
+        model: str = Models.CLAUDE_45,
+) -> TokenEstimate:
+    return TokenEstimate(
+        system_prompt=estimate_text_tokens(system_prompt or ""),
+        tools=estimate_text_tokens(json.dumps(tool_specs or [], default=str)),
+        history=estimate_messages_tokens(messages or []),
+        question=estimate_content_tokens(question) + MESSAGE_OVERHEAD_TOKENS,
+        context_window=MODEL_CONTEXT_WINDOWS.get(model, min(MODEL_CONTEXT_WINDOWS.values())),
+        output_reserve=MODEL_OUTPUT_TOKENS_RESERVE,
+    )
+
+
+def estimate_agent_request(agent: Any, question: Any) -> TokenEstimate:
+    """
+    Estimates the next request of an agent: its system prompt, tool specs, the messages currently kept by its
+    conversation manager and the new question.
+    """
+    return estimate_request(
+        question=question,
+        system_prompt=agent.system_prompt,
+        tool_specs=agent.tool_registry.get_all_tool_specs(),
+        messages=agent.messages,
+        model=agent.model.config.get("model_id", Models.CLAUDE_45),
+    )
@@ -0,0 +1,63 @@
+import importlib
+import logging
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+from modules.cl import extraction_executor, get_agent, get_orchestrator_tools
+from modules.extractors import extract_csv
+from modules.prompts import MAIN_SYSTEM_PROMPT
+from settings import EXTRACTION_MAX_WORKERS
+
+logger = logging.getLogger(__name__)
+
+# Tool modules only imported by the first session or the first weather query otherwise
+WARMUP_MODULES = (
+    "strands_tools.calculator",
+    "strands_tools.current_time",
+    "strands_tools.think",
+    "strands_tools.code_interpreter",
+    "tools.documents.tools",
+    "tools.weather.agent",
+    "tools.weather.tools",
+)
+
+
+@contextmanager
+def warm_up_step(name: str, timings: Dict[str, float]):
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        # The worker still starts, the first session pays for the step instead
+        logger.warning(f"Warm-up step {name} failed: {e}")
+    timings[name] = time.perf_counter() - started
+
+
+def warm_up() -> Dict[str, float]:
+    """
+    Pays the first session costs of the worker before it accepts traffic: imports the tool modules, builds
+    an orchestrator agent (tool specs and the shared Bedrock client of the default configuration) and starts
+    the processes of the extraction pool.
+
+    Returns:
+        The seconds spent by each step
+    """
+    timings: Dict[str, float] = {}
+    with warm_up_step("imports", timings):
+        for module in WARMUP_MODULES:
+            importlib.import_module(module)
+
+    with warm_up_step("agent", timings):
+        agent = get_agent(system_prompt=MAIN_SYSTEM_PROMPT, tools=get_orchestrator_tools())
+        agent.tool_registry.get_all_tool_specs()
+
+    if extraction_executor:
+        with warm_up_step("extraction_pool", timings):
+            # Submitted together, so every worker process is spawned and imports the extractors
+            futures = [extraction_executor.submit(extract_csv, b"warm,up") for _ in range(EXTRACTION_MAX_WORKERS)]
+            for future in futures:
+                future.result()
+
+    logger.info("Warm-up completed: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()))
+    return timings
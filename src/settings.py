@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from enum import StrEnum
 from pathlib import Path
@@ -31,6 +32,45 @@ class Models(StrEnum):
     CLAUDE_45 = 'eu.anthropic.claude-sonnet-4-5-20250929-v1:0'
 
 
+MODEL_CONTEXT_WINDOWS = {
+    Models.CLAUDE_45: 200_000,
+}
+MODEL_OUTPUT_TOKENS_RESERVE = int(os.getenv('MODEL_OUTPUT_TOKENS_RESERVE', 8192))
+# Bedrock prompt caching of the system prompt, tools and documents, for the models that support it
+MODEL_PROMPT_CACHING = {
+    Models.CLAUDE_45: os.getenv('PROMPT_CACHING', 'True') == 'True',
+}
+
+
+class ModelBackend(StrEnum):
+    BEDROCK = 'bedrock'
+    RECORD = 'record'
+    REPLAY = 'replay'
+
+
+# Bedrock, Bedrock with its stream events and the results of MODEL_REPLAY_TOOLS recorded to
+# MODEL_RECORDINGS_PATH, or the recordings replayed without network at MODEL_REPLAY_SPEED times their timing
+# (0 to replay without waiting)
+MODEL_BACKEND = ModelBackend(os.getenv('MODEL_BACKEND', ModelBackend.BEDROCK))
+MODEL_RECORDINGS_PATH = os.getenv('MODEL_RECORDINGS_PATH', os.path.join(BASE_DIR, '..', 'recordings.jsonl.gz'))
+MODEL_REPLAY_SPEED = float(os.getenv('MODEL_REPLAY_SPEED', 1))
+MODEL_REPLAY_TOOLS = [name for name in os.getenv(
+    'MODEL_REPLAY_TOOLS', 'current_time,get_hourly_weather_data,code_interpreter').split(',') if name]
+
+
+class ExtractionMode(StrEnum):
+    RAW = 'raw'
+    EXTRACTED = 'extracted'
+    # Spreadsheets only: loaded in SQLite tables queried by the query_tables tool, the model only gets their schema
+    TABLE = 'table'
+
+
+class DocumentHistoryPolicy(StrEnum):
+    VERBATIM = 'verbatim'
+    HANDLE = 'handle'
+    OUTLINE = 'outline'
+
+
 MY_LATITUDE = float(os.getenv('MY_LATITUDE'))
 MY_LONGITUDE = float(os.getenv('MY_LONGITUDE'))
 
@@ -46,3 +86,88 @@ MIME_MAP = {
     "text/markdown": "md",
     "text/x-markdown": "md"
 }
+
+DOCUMENT_CACHE_MAX_BYTES = int(os.getenv('DOCUMENT_CACHE_MAX_MB', 1024)) * 1024 * 1024
+# Processed documents are kept on disk, shared by the workers of the node, and only referenced from the sessions
+DOCUMENT_STORE_DIR = os.getenv('DOCUMENT_STORE_DIR', os.path.join(tempfile.gettempdir(), 'documents'))
+DOCUMENT_STORE_MAX_BYTES = int(os.getenv('DOCUMENT_STORE_MAX_MB', 10240)) * 1024 * 1024
+# What replaces the documents of older messages once answered, and how many messages with documents keep them
+DOCUMENT_HISTORY_POLICY = DocumentHistoryPolicy(os.getenv('DOCUMENT_HISTORY_POLICY', DocumentHistoryPolicy.OUTLINE))
+DOCUMENT_HISTORY_KEEP = int(os.getenv('DOCUMENT_HISTORY_KEEP', 1))
+DOCUMENT_OUTLINE_CHARS = int(os.getenv('DOCUMENT_OUTLINE_CHARS', 2000))
+# Opt-in cache of the answers to the first question of conversations about the same documents, e.g. the default
+# summary of a shared file, replayed without calling the model for ANSWER_CACHE_TTL seconds. 0 disables it
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', 0))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv('ANSWER_CACHE_MAX_MB', 64)) * 1024 * 1024
+# Maximum bytes of the documents attached in a session, whose text is kept in memory by its retrieval index
+SESSION_MAX_DOCUMENT_BYTES = int(os.getenv('SESSION_MAX_DOCUMENT_MB', 512)) * 1024 * 1024
+
+INGESTION_MAX_WORKERS = int(os.getenv('INGESTION_MAX_WORKERS', 8))
+INGESTION_MAX_CONCURRENT_FILES = int(os.getenv('INGESTION_MAX_CONCURRENT_FILES', 4))
+INGESTION_MAX_IN_FLIGHT_BYTES = int(os.getenv('INGESTION_MAX_IN_FLIGHT_MB', 1024)) * 1024 * 1024
+
+EXTRACTION_MAX_WORKERS = int(os.getenv('EXTRACTION_MAX_WORKERS', 2))
+# Per format switch between shipping the uploaded bytes as they are, the locally extracted text or, for
+# spreadsheets, their tables, e.g. EXTRACTION_MODE_HTML=raw or EXTRACTION_MODE_CSV=extracted
+EXTRACTION_MODES = {
+    fmt: ExtractionMode(os.getenv(f'EXTRACTION_MODE_{fmt.upper()}', default))
+    for fmt, default in (
+        ('csv', ExtractionMode.TABLE),
+        ('xlsx', ExtractionMode.TABLE),
+        ('docx', ExtractionMode.EXTRACTED),
+        ('html', ExtractionMode.EXTRACTED),
+    )
+}
+# Rows of each table shown to the model, and returned at most by a query_tables call
+TABLE_SAMPLE_ROWS = int(os.getenv('TABLE_SAMPLE_ROWS', 5))
+TABLE_QUERY_MAX_ROWS = int(os.getenv('TABLE_QUERY_MAX_ROWS', 100))
+TABLE_QUERY_TIMEOUT = float(os.getenv('TABLE_QUERY_TIMEOUT', 5))
+# PDFs of more than PDF_PREVIEW_MIN_PAGES pages are sent as their first PDF_PREVIEW_PAGES pages and their outline,
+# the read_pages tool reads the others, at most PDF_READ_MAX_PAGES at once. PDF_PREVIEW_MIN_PAGES=0 sends them whole
+PDF_PREVIEW_MIN_PAGES = int(os.getenv('PDF_PREVIEW_MIN_PAGES', 50))
+PDF_PREVIEW_PAGES = int(os.getenv('PDF_PREVIEW_PAGES', 10))
+PDF_READ_MAX_PAGES = int(os.getenv('PDF_READ_MAX_PAGES', 20))
+
+MAPREDUCE_CHUNK_TOKENS = int(os.getenv('MAPREDUCE_CHUNK_TOKENS', 50_000))
+MAPREDUCE_MAX_CONCURRENCY = int(os.getenv('MAPREDUCE_MAX_CONCURRENCY', 4))
+
+RETRIEVAL_PASSAGE_CHARS = int(os.getenv('RETRIEVAL_PASSAGE_CHARS', 1500))
+
+# Streamed tokens are sent to the UI in batches of STREAM_FLUSH_BYTES or every STREAM_FLUSH_INTERVAL_MS
+STREAM_FLUSH_INTERVAL = int(os.getenv('STREAM_FLUSH_INTERVAL_MS', 30)) / 1000
+STREAM_FLUSH_BYTES = int(os.getenv('STREAM_FLUSH_BYTES', 256))
+
+# Worker-wide limits of the turns streaming from the model and of their request bytes, the others are queued
+ADMISSION_MAX_STREAMS = int(os.getenv('ADMISSION_MAX_STREAMS', 16))
+ADMISSION_MAX_IN_FLIGHT_BYTES = int(os.getenv('ADMISSION_MAX_IN_FLIGHT_MB', 256)) * 1024 * 1024
+
+BEDROCK_MAX_POOL_CONNECTIONS = int(os.getenv('BEDROCK_MAX_POOL_CONNECTIONS', 50))
+# Model requests per second of the worker, shared by every agent: throttling shrinks the rate down to
+# MODEL_RATE_LIMIT_MIN, successful requests bring it back to MODEL_RATE_LIMIT
+MODEL_RATE_LIMIT = float(os.getenv('MODEL_RATE_LIMIT', 10))
+MODEL_RATE_LIMIT_MIN = float(os.getenv('MODEL_RATE_LIMIT_MIN', 0.5))
+MODEL_RATE_LIMIT_BURST = int(os.getenv('MODEL_RATE_LIMIT_BURST', 10))
+MODEL_THROTTLE_MAX_ATTEMPTS = int(os.getenv('MODEL_THROTTLE_MAX_ATTEMPTS', 3))
+# Seconds before the first retry of a transient model error (5xx, model not ready, lost connection), doubled
+# by every further attempt
+MODEL_RETRY_DELAY = float(os.getenv('MODEL_RETRY_DELAY', 0.5))
+# Seconds without a first event after which a second identical request is sent, 0 to disable
+MODEL_HEDGE_AFTER = float(os.getenv('MODEL_HEDGE_AFTER', 0))
+
+# Import the tools, build the shared clients and start the extraction workers before accepting traffic
+WARMUP = os.getenv('WARMUP', 'False') == 'True'
+
+# Tool calls of one model response running in parallel, the others wait for one of them to complete
+TOOL_MAX_CONCURRENCY = int(os.getenv('TOOL_MAX_CONCURRENCY', 4))
+
+# Seconds a cancelled turn gets to close its streams and tools when its session ends
+CANCELLATION_TIMEOUT = float(os.getenv('CANCELLATION_TIMEOUT', 10))
+
+SUB_AGENT_IDLE_TIMEOUT = int(os.getenv('SUB_AGENT_IDLE_TIMEOUT', 600))
+
+OPEN_METEO_URL = os.getenv('OPEN_METEO_URL', 'https://api.open-meteo.com/v1/forecast')
+WEATHER_HTTP_TIMEOUT = float(os.getenv('WEATHER_HTTP_TIMEOUT', 30))
+WEATHER_HTTP_POOL_SIZE = int(os.getenv('WEATHER_HTTP_POOL_SIZE', 10))
+WEATHER_CACHE_PAST_TTL = int(os.getenv('WEATHER_CACHE_PAST_TTL', 24 * 60 * 60))
+WEATHER_CACHE_FORECAST_TTL = int(os.getenv('WEATHER_CACHE_FORECAST_TTL', 15 * 60))
+WEATHER_CACHE_MAX_DAYS = int(os.getenv('WEATHER_CACHE_MAX_DAYS', 5000))
@@ -0,0 +1,92 @@
+import logging
+import sqlite3
+from typing import Any
+
+import chainlit as cl
+from strands import tool
+
+from modules.retrieval import format_results
+from modules.tables import format_rows
+from settings import TABLE_QUERY_MAX_ROWS, TABLE_QUERY_TIMEOUT, PDF_READ_MAX_PAGES
+
+logger = logging.getLogger(__name__)
+
+
+@tool
+def search_documents(query: str, top_k: int = 5) -> str:
+    """
+    Search the documents uploaded in this conversation and return the most relevant passages.
+    Use it to answer follow-up questions about uploaded documents with the exact passages they contain.
+
+    Args:
+        query: Keywords or question to look for in the documents
+        top_k: Number of passages to return
+    """
+    index = cl.user_session.get("document_index")
+    if not index:
+        return "No documents have been uploaded in this conversation."
+
+    results = index.search(query, top_k=top_k)
+    logger.info(f"[search_documents] {len(results)} passages found for '{query}'")
+    return format_results(results) or "No passage of the uploaded documents matches the query."
+
+
+@tool
+def query_tables(sql: str, max_rows: int = 50) -> str:
+    """
+    Run a read-only SQLite query on the tables of the CSV and Excel documents uploaded in this conversation.
+    Use it to filter, count, sum, average or group their rows: the documents only show their first rows.
+    Only use the table and column names given in the descriptions of the documents.
+
+    Args:
+        sql: A single SQLite SELECT statement
+        max_rows: Maximum number of rows to return
+    """
+    catalog = cl.user_session.get("table_catalog")
+    if not catalog:
+        return "No tables have been uploaded in this conversation."
+
+    try:
+        columns, rows, truncated = catalog.query(
+            sql, max_rows=min(max_rows, TABLE_QUERY_MAX_ROWS), timeout=TABLE_QUERY_TIMEOUT)
+    except sqlite3.Error as e:
+        logger.info(f"[query_tables] Query failed ({e}): {sql}")
+        return f"The query failed: {e}. The tables are {catalog.describe()}."
+
+    logger.info(f"[query_tables] {len(rows)} rows for '{sql}'")
+    if not columns:
+        return "The query returned no columns."
+    result = format_rows(columns, rows) if rows else "The query returned no rows."
+    if truncated:
+        result += f"\n\nOnly the first {len(rows)} rows are shown, aggregate or filter to get the others."
+    return result
+
+
+@tool
+def read_pages(document: str, start: int, end: int) -> Any:
+    """
+    Read a range of pages of a long PDF document of which only the first pages are attached.
+    Use its outline to find the pages that answer the question, and read only those.
+
+    Args:
+        document: Name of the document, as given with its outline
+        start: First page to read, counted from 1
+        end: Last page to read, included
+    """
+    documents = cl.user_session.get("pdf_documents") or {}
+    pdf = documents.get(document)
+    if pdf is None:
+        return f"Unknown document {document}. The documents with pages to read are: {', '.join(documents) or 'none'}."
+    if not 1 <= start <= min(end, pdf.page_count):
+        return f"Invalid page range {start} to {end}: {document} has pages 1 to {pdf.page_count}."
+
+    end = min(end, pdf.page_count, start + PDF_READ_MAX_PAGES - 1)
+    data = pdf.write_pages(start, end)
+    logger.info(f"[read_pages] Pages {start} to {end} of {document} ({len(data)} bytes)")
+    return {
+        "status": "success",
+        "content": [
+            {"text": f"Pages {start} to {end} of the {pdf.page_count} pages of {document}"},
+            {"document": {"name": f"{document} pages {start}-{end}", "format": "pdf", "source": {"bytes": data}}},
+        ],
+    }
@@ -1,11 +1,11 @@
-from strands import tool
-from strands_tools import calculator, current_time, think
-from strands_tools.code_interpreter import AgentCoreCodeInterpreter
+from contextlib import aclosing
+
+from strands import ToolContext, tool
 
 from modules.cl import get_agent, stream_to_step
 from modules.prompts import SPARTAN_PROMPT
-from settings import AWS_REGION, MY_LONGITUDE, MY_LATITUDE
-from tools.weather.tools import WeatherTools
+from modules.subagents import get_session_pool
+from settings import AWS_REGION, MY_LONGITUDE, MY_LATITUDE, SUB_AGENT_IDLE_TIMEOUT
 
 ASSISTANT_PROMPT = f"""
 You are an expert in meteorological and climate topics.
@@ -17,30 +17,44 @@ Weather information is always for a specific location,
 """
 
 
-@tool
+def create_weather_agent():
+    # Imported by the first weather query (or the warm-up) rather than with weather_assistant:
+    # they load the code interpreter SDK, sympy and the HTTP client
+    from strands_tools import calculator, current_time, think
+    from strands_tools.code_interpreter import AgentCoreCodeInterpreter
+    from tools.weather.tools import WeatherTools
+
+    code_interpreter = AgentCoreCodeInterpreter(region=AWS_REGION, persist_sessions=False)
+    tools = [
+        calculator,
+        think,
+        current_time,
+        code_interpreter.code_interpreter
+    ]
+    tools += WeatherTools(latitude=MY_LATITUDE, longitude=MY_LONGITUDE).get_tools()
+
+    research_agent = get_agent(
+        system_prompt=ASSISTANT_PROMPT,
+        tools=tools
+    )
+    return research_agent, [code_interpreter]
+
+
+@tool(context=True)
 @stream_to_step("weather_assistant")
-async def weather_assistant(query: str):
+async def weather_assistant(query: str, tool_context: ToolContext):
     """
     A research assistant specialized in weather topics with streaming support.
     Yields:
         Tokens (str) containing the answer progressively.
     """
     try:
-        tools = [
-            calculator,
-            think,
-            current_time,
-            AgentCoreCodeInterpreter(region=AWS_REGION).code_interpreter
-        ]
-        tools += WeatherTools(latitude=MY_LATITUDE, longitude=MY_LONGITUDE).get_tools()
-
-        research_agent = get_agent(
-            system_prompt=ASSISTANT_PROMPT,
-            tools=tools
-        )
-
-        async for token in research_agent.stream_async(query):
-            yield token
+        pool = get_session_pool("weather_assistant", create_weather_agent, idle_timeout=SUB_AGENT_IDLE_TIMEOUT)
+        async with pool.acquire() as research_agent:
+            # Closed as soon as the call is cancelled, with the model stream of the sub-agent
+            async with aclosing(research_agent.stream_async(query)) as events:
+                async for token in events:
+                    yield token
 
     except Exception as e:
         yield f"Error in research assistant: {str(e)}"
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from settings import WEATHER_CACHE_PAST_TTL, WEATHER_CACHE_FORECAST_TTL, WEATHER_CACHE_MAX_DAYS
+from .models import MeteoSeries
+
+
+class WeatherCache:
+    """
+    Per-day cache of hourly weather data keyed by (latitude, longitude, day).
+
+    Past days barely change and live for past_ttl seconds; today and forecast days live for forecast_ttl.
+    Open-Meteo returns hours in GMT, so days are compared with the UTC date.
+    """
+
+    def __init__(self, past_ttl: int, forecast_ttl: int, max_days: int):
+        self.past_ttl = past_ttl
+        self.forecast_ttl = forecast_ttl
+        self.max_days = max_days
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Tuple[float, float, date], Tuple[float, MeteoSeries]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ttl(self, day: date) -> int:
+        return self.past_ttl if day < datetime.now(timezone.utc).date() else self.forecast_ttl
+
+    def get(self, latitude: float, longitude: float, day: date) -> Optional[MeteoSeries]:
+        key = (latitude, longitude, day)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, latitude: float, longitude: float, day: date, series: MeteoSeries) -> None:
+        key = (latitude, longitude, day)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl(day), series)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_days:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_days": self.max_days,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+weather_cache = WeatherCache(
+    past_ttl=WEATHER_CACHE_PAST_TTL, forecast_ttl=WEATHER_CACHE_FORECAST_TTL, max_days=WEATHER_CACHE_MAX_DAYS)
@@ -1,4 +1,7 @@
-from datetime import datetime
+from array import array
+from datetime import date, datetime
+from math import isnan, nan
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, Field
 
@@ -48,3 +51,86 @@ class MeteoData(BaseModel):
     precipitation: list[PrecipitationReading] = Field(..., description="List of precipitation readings")
     evapotranspiration: list[EvapotranspirationReading] = Field(..., description="List of evapotranspiration readings")
     surface_pressure: list[SurfacePressureReading] = Field(..., description="List of surface pressure readings")
+
+
+# Open-Meteo hourly variable and reading model of every MeteoData field
+METEO_VARIABLES = {
+    "temperature": ("temperature_2m", TemperatureReading),
+    "humidity": ("relative_humidity_2m", HumidityReading),
+    "apparent_temperature": ("apparent_temperature", ApparentTemperatureReading),
+    "precipitation": ("precipitation", PrecipitationReading),
+    "evapotranspiration": ("evapotranspiration", EvapotranspirationReading),
+    "surface_pressure": ("surface_pressure", SurfacePressureReading),
+}
+
+
+def to_float_array(values: list) -> array:
+    try:
+        return array('d', values)
+    except TypeError:
+        # Open-Meteo sends null for hours without data
+        return array('d', (nan if value is None else value for value in values))
+
+
+class MeteoSeries:
+    """
+    Columnar meteorological data: one float array per variable, all sharing a single time index.
+
+    The pydantic MeteoData view is only built when meteo_data is accessed. As a tool result it is rendered as a
+    compact CSV table.
+    """
+
+    def __init__(self, time: List[datetime], columns: Dict[str, array]):
+        self.time = time
+        self.columns = columns
+        self._meteo_data: Optional[MeteoData] = None
+
+    @classmethod
+    def from_open_meteo(cls, hourly: Dict[str, list]) -> "MeteoSeries":
+        return cls(
+            time=list(map(datetime.fromisoformat, hourly['time'])),
+            columns={field: to_float_array(hourly[variable]) for field, (variable, _) in METEO_VARIABLES.items()})
+
+    @classmethod
+    def concat(cls, series: List["MeteoSeries"]) -> "MeteoSeries":
+        columns = {field: array('d') for field in METEO_VARIABLES}
+        for part in series:
+            for field, column in columns.items():
+                column.extend(part.columns[field])
+        return cls(time=[time for part in series for time in part.time], columns=columns)
+
+    def split_days(self) -> Dict[date, "MeteoSeries"]:
+        days = {}
+        start = 0
+        for i in range(1, len(self.time) + 1):
+            if i == len(self.time) or self.time[i].date() != self.time[start].date():
+                days[self.time[start].date()] = MeteoSeries(
+                    time=self.time[start:i],
+                    columns={field: column[start:i] for field, column in self.columns.items()})
+                start = i
+        return days
+
+    @property
+    def meteo_data(self) -> MeteoData:
+        if self._meteo_data is None:
+            readings = {}
+            for field, (_, reading) in METEO_VARIABLES.items():
+                readings[field] = [
+                    reading(time=time, value=value)
+                    for time, value in zip(self.time, self.columns[field]) if not isnan(value)]
+            self._meteo_data = MeteoData(**readings)
+        return self._meteo_data
+
+    def to_csv(self) -> str:
+        lines = [",".join(["time", *METEO_VARIABLES])]
+        columns = [self.columns[field] for field in METEO_VARIABLES]
+        for i, time in enumerate(self.time):
+            values = ("" if isnan(column[i]) else f"{column[i]:g}" for column in columns)
+            lines.append(",".join([time.isoformat(timespec='minutes'), *values]))
+        return "\n".join(lines)
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    def __str__(self) -> str:
+        return self.to_csv()
@@ -1,83 +1,102 @@
 import logging
-from datetime import datetime, date
-from typing import List
+from datetime import date, timedelta
+from typing import List, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
 from strands import tool
 
-from .models import (
-    TemperatureReading, HumidityReading, ApparentTemperatureReading,
-    PrecipitationReading, EvapotranspirationReading, SurfacePressureReading, MeteoData)
+from settings import OPEN_METEO_URL, WEATHER_HTTP_TIMEOUT, WEATHER_HTTP_POOL_SIZE
+from .cache import WeatherCache, weather_cache
+from .models import MeteoSeries, METEO_VARIABLES
 
 logger = logging.getLogger(__name__)
 
 
+def get_http_session(pool_size: int = WEATHER_HTTP_POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+http_session = get_http_session()
+
+
+def get_missing_ranges(days: List[date]) -> List[Tuple[date, date]]:
+    ranges = []
+    for day in days:
+        if ranges and ranges[-1][1] + timedelta(days=1) == day:
+            ranges[-1] = (ranges[-1][0], day)
+        else:
+            ranges.append((day, day))
+    return ranges
+
+
 class WeatherTools:
-    def __init__(self, latitude: float, longitude: float):
+    def __init__(
+            self,
+            latitude: float,
+            longitude: float,
+            url: str = OPEN_METEO_URL,
+            cache: WeatherCache = weather_cache,
+            session: requests.Session = http_session,
+    ):
         self.latitude = latitude
         self.longitude = longitude
+        self.url = url
+        self.cache = cache
+        self.session = session
+
+    def fetch_hourly_series(self, start_date: date, end_date: date) -> MeteoSeries:
+        response = self.session.get(self.url, timeout=WEATHER_HTTP_TIMEOUT, params={
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "hourly": ",".join(variable for variable, _ in METEO_VARIABLES.values()),
+            "start_date": start_date.strftime('%Y-%m-%d'),
+            "end_date": end_date.strftime('%Y-%m-%d'),
+        })
+        response.raise_for_status()
+        return MeteoSeries.from_open_meteo(response.json()['hourly'])
+
+    def get_hourly_series(self, from_date: date, to_date: date) -> MeteoSeries:
+        """
+        Assembles the range from cached days and only downloads the missing ones, in as few requests as possible.
+        """
+        days = [from_date + timedelta(days=i) for i in range((to_date - from_date).days + 1)]
+        series = {day: self.cache.get(self.latitude, self.longitude, day) for day in days}
+        missing = [day for day in days if series[day] is None]
+
+        for start_date, end_date in get_missing_ranges(missing):
+            fetched = self.fetch_hourly_series(start_date, end_date)
+            for day, day_series in fetched.split_days().items():
+                self.cache.put(self.latitude, self.longitude, day, day_series)
+                if day in series:
+                    series[day] = day_series
+
+        logger.info(f"[get_hourly_series] {len(days) - len(missing)} of {len(days)} days from cache")
+        return MeteoSeries.concat([series[day] for day in days if series[day] is not None])
 
     def get_tools(self, tools=None) -> List[tool]:
         @tool
-        def get_hourly_weather_data(from_date: date, to_date: date) -> MeteoData:
+        def get_hourly_weather_data(from_date: date, to_date: date) -> MeteoSeries:
             """
             Get hourly weather data for a specific date range.
             Notes:
-                - The response is a MeteoData object containing lists of readings for temperature, humidity,
-                  apparent temperature, precipitation, evapotranspiration, and surface pressure.
-                - Each reading has a timestamp and a value.
+                - The response is a CSV table with one row per hour and the columns time, temperature (°C),
+                  humidity (%), apparent_temperature (°C), precipitation (mm), evapotranspiration (mm)
+                  and surface_pressure (hPa).
+                - Empty values mean there is no data for that hour.
 
             Returns:
-                MeteoData: Object containing weather readings for the specified date range
+                MeteoSeries: Weather readings for the specified date range
             """
+            meteo = self.get_hourly_series(from_date, to_date)
 
-            start_date = from_date.strftime('%Y-%m-%d')
-            end_date = to_date.strftime('%Y-%m-%d')
-            url = (f"https://api.open-meteo.com/v1/forecast?"
-                   f"latitude={self.latitude}&"
-                   f"longitude={self.longitude}&"
-                   f"hourly=temperature_2m,relative_humidity_2m,apparent_temperature,precipitation,evapotranspiration,surface_pressure&"
-                   f"start_date={start_date}&"
-                   f"end_date={end_date}")
-            response = requests.get(url)
-
-            meteo = MeteoData(
-                temperature=[],
-                humidity=[],
-                apparent_temperature=[],
-                precipitation=[],
-                evapotranspiration=[],
-                surface_pressure=[]
-            )
-            data = response.json()
-
-            weather_data = data['hourly']['time']
-
-            logger.info(f"[get_hourly_weather_data] Fetched weather data from {start_date} to {end_date}. {len(weather_data)} records found.")
-            for iso in weather_data:
-                time = datetime.fromisoformat(iso)
-                meteo.temperature.append(TemperatureReading(
-                    time=time,
-                    value=data['hourly']['temperature_2m'][data['hourly']['time'].index(iso)]))
-                meteo.humidity.append(HumidityReading(
-                    time=time,
-                    value=data['hourly']['relative_humidity_2m'][data['hourly']['time'].index(iso)]))
-                meteo.apparent_temperature.append(ApparentTemperatureReading(
-                    time=time,
-                    value=data['hourly']['apparent_temperature'][data['hourly']['time'].index(iso)]))
-                meteo.precipitation.append(PrecipitationReading(
-                    time=time,
-                    value=data['hourly']['precipitation'][data['hourly']['time'].index(iso)]))
-                meteo.evapotranspiration.append(EvapotranspirationReading(
-                    time=time,
-                    value=data['hourly']['evapotranspiration'][data['hourly']['time'].index(iso)]))
-                meteo.surface_pressure.append(SurfacePressureReading(
-                    time=time,
-                    value=data['hourly']['surface_pressure'][data['hourly']['time'].index(iso)]))
+            logger.info(f"[get_hourly_weather_data] Fetched weather data from {from_date} to {to_date}. {len(meteo)} records found.")
             return meteo
 
         all_tools = [get_hourly_weather_data]
 
         return all_tools if tools is None else [tool for tool in all_tools if tool.__name__ in tools]
-
-
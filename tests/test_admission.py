@@ -0,0 +1,97 @@
+import sys
+import os
+import asyncio
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.admission import AdmissionScheduler
+from modules.metrics import admission_wait_seconds
+
+async def hold(scheduler, user, size, admitted, release, positions=None):
+    async def on_position(position):
+        positions.append(position)
+
+    async with scheduler.admit(user, size, on_position=on_position if positions is not None else None):
+        admitted.append(user)
+        await release.wait()
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+@pytest.mark.asyncio
+async def test_admit_limits_concurrent_streams():
+    scheduler = AdmissionScheduler(max_streams=2, max_bytes=1000)
+    admitted, release = [], asyncio.Event()
+    tasks = [asyncio.create_task(hold(scheduler, user, 10, admitted, release)) for user in ("a", "b", "c")]
+    await settle()
+
+    assert admitted == ["a", "b"]
+    assert scheduler.stats()["waiting"] == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert admitted == ["a", "b", "c"]
+    assert scheduler.stats() == {"active": 0, "max_streams": 2, "in_flight_bytes": 0, "max_bytes": 1000,
+                                 "waiting": 0, "admitted": 3, "queued": 1}
+
+@pytest.mark.asyncio
+async def test_admit_is_fair_between_users():
+    scheduler = AdmissionScheduler(max_streams=1, max_bytes=1000)
+    admitted, releases = [], [asyncio.Event() for _ in range(6)]
+    tasks = [asyncio.create_task(hold(scheduler, "busy", 10, admitted, releases[i])) for i in range(5)]
+    await settle()
+    tasks.append(asyncio.create_task(hold(scheduler, "other", 10, admitted, releases[5])))
+    await settle()
+
+    for release in releases:
+        release.set()
+        await settle()
+    await asyncio.gather(*tasks)
+
+    assert admitted == ["busy", "other", "busy", "busy", "busy", "busy"]
+
+@pytest.mark.asyncio
+async def test_admit_limits_in_flight_bytes():
+    scheduler = AdmissionScheduler(max_streams=10, max_bytes=100)
+    admitted, release = [], asyncio.Event()
+    first = asyncio.create_task(hold(scheduler, "a", 60, admitted, release))
+    await settle()
+    second = asyncio.create_task(hold(scheduler, "b", 150, admitted, asyncio.Event()))
+    await settle()
+
+    assert admitted == ["a"]
+    assert scheduler.in_flight == 60
+
+    release.set()
+    await first
+    await settle()
+    # Bigger than the budget, but admitted once alone
+    assert admitted == ["a", "b"]
+    assert scheduler.in_flight == 100
+    second.cancel()
+
+@pytest.mark.asyncio
+async def test_admit_reports_positions_and_forgets_cancelled_requests():
+    scheduler = AdmissionScheduler(max_streams=1, max_bytes=1000)
+    admitted, release, positions = [], asyncio.Event(), []
+    wait_count = admission_wait_seconds.snapshot()["count"]
+    running = asyncio.create_task(hold(scheduler, "a", 10, admitted, release))
+    await settle()
+    cancelled = asyncio.create_task(hold(scheduler, "b", 10, admitted, asyncio.Event()))
+    await settle()
+    waiting = asyncio.create_task(hold(scheduler, "c", 10, admitted, release, positions))
+    await settle()
+
+    assert positions == [2]
+    cancelled.cancel()
+    await settle()
+    assert positions == [2, 1]
+
+    release.set()
+    await asyncio.gather(running, waiting)
+    assert admitted == ["a", "c"]
+    assert scheduler.stats()["active"] == 0 and scheduler.stats()["waiting"] == 0
+    assert admission_wait_seconds.snapshot()["count"] == wait_count + 2
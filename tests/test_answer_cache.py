@@ -0,0 +1,96 @@
+import sys
+import os
+from pathlib import Path
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.answer_cache import AnswerCache, get_answer_key, is_cacheable, replay_answer
+from modules.store import DocumentRef
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_question(text, source=b"report", fmt="txt"):
+    return [{"document": {"name": "report", "format": fmt, "source": {"bytes": source}}}, {"text": text}]
+
+def answer(text):
+    return {"role": "assistant", "content": [{"text": text}]}
+
+def test_answer_key():
+    key = get_answer_key(make_question("Write a summary of the document"), "model", "system")
+
+    assert get_answer_key(make_question("  write a SUMMARY of\nthe document? "), "model", "system") == key
+    assert get_answer_key(make_question("Write a summary of the document"), "model",
+                          [{"text": "system"}, {"cachePoint": {"type": "default"}}]) == key
+    assert len({key,
+                get_answer_key(make_question("List the risks"), "model", "system"),
+                get_answer_key(make_question("Write a summary of the document", b"other"), "model", "system"),
+                get_answer_key(make_question("Write a summary of the document"), "other model", "system"),
+                get_answer_key(make_question("Write a summary of the document"), "model", "other system")}) == 5
+    assert get_answer_key("Write a summary of the document", "model", "system") is None
+    assert get_answer_key([{"text": "Write a summary"}], "model", "system") is None
+
+def test_answer_key_of_stored_documents_is_their_digest(tmp_path):
+    ref = DocumentRef(path=Path(tmp_path / "ab12.pdf"), size=10)
+    moved = DocumentRef(path=Path(tmp_path / "other" / "ab12.pdf"), size=10)
+
+    assert (get_answer_key(make_question("Summary", ref, "pdf"), "model", "system")
+            == get_answer_key(make_question("Summary", moved, "pdf"), "model", "system"))
+
+def test_cache_expires_and_reports_savings():
+    clock = FakeClock()
+    cache = AnswerCache(ttl=60, max_bytes=1024, clock=clock)
+
+    assert cache.get("key", request_bytes=5000) is None
+    cache.put("key", answer("Summary"))
+    assert cache.get("key", request_bytes=5000).message == answer("Summary")
+    clock.now = 61
+    assert cache.get("key", request_bytes=5000) is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["bytes_saved"]) == (1, 2, 1, 5000)
+    assert stats["entries"] == 0 and stats["size_bytes"] == 0
+
+def test_cache_evicts_least_recently_used():
+    cache = AnswerCache(ttl=60, max_bytes=150)
+    for key in ("a", "b"):
+        cache.put(key, answer(key * 20))
+    cache.get("a", request_bytes=1)
+    cache.put("c", answer("c" * 20))
+
+    assert cache.get("b", request_bytes=1) is None
+    assert cache.get("a", request_bytes=1) and cache.get("c", request_bytes=1)
+    assert cache.stats()["evictions"] == 1
+    cache.put("d", answer("d" * 200))
+    assert cache.get("d", request_bytes=1) is None
+
+def test_cached_answer_is_a_copy():
+    cache = AnswerCache(ttl=60, max_bytes=1024)
+    message = answer("Summary")
+    cache.put("key", message)
+    message["content"].append({"cachePoint": {"type": "default"}})
+
+    assert cache.get("key", request_bytes=5000).message == answer("Summary")
+
+def test_is_cacheable():
+    assert is_cacheable([answer("Summary")])
+    assert not is_cacheable([])
+    assert not is_cacheable([{"role": "assistant", "content": [{"toolUse": {"name": "current_time"}}]},
+                             {"role": "user", "content": [{"toolResult": {}}]}, answer("It is noon")])
+
+@pytest.mark.asyncio
+async def test_replay_answer():
+    cache = AnswerCache(ttl=60, max_bytes=10_000)
+    cache.put("key", answer("x" * 450))
+
+    events = [event async for event in replay_answer(cache.get("key", request_bytes=5000))]
+
+    assert [len(event["data"]) for event in events[:-1]] == [200, 200, 50]
+    assert events[-1] == {"message": answer("x" * 450)}
+    assert events[-1]["message"] is not cache.get("key", request_bytes=5000).message
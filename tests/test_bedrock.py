@@ -0,0 +1,168 @@
+import sys
+import os
+import asyncio
+import contextlib
+import inspect
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+import pytest
+import urllib3
+from botocore.eventstream import EventStream
+from strands.models import BedrockModel
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.bedrock import (
+    DocumentStoreBedrockModel, attach_response_stream, clear_bedrock_models, close_response_stream, get_bedrock_model)
+from modules.cancellation import cancellation_stats
+from modules.store import DocumentStore
+
+@pytest.fixture(autouse=True)
+def clear_pool():
+    clear_bedrock_models()
+    yield
+    clear_bedrock_models()
+
+def make_model(**kwargs):
+    params = dict(model_id="model", temperature=0.3, read_timeout=300, connect_timeout=60)
+    params.update(kwargs)
+    return get_bedrock_model(**params)
+
+@patch('modules.bedrock.get_boto_session')
+@patch('modules.bedrock.DocumentStoreBedrockModel')
+def test_get_bedrock_model_is_shared(mock_model_cls, mock_session):
+    mock_model_cls.side_effect = lambda **kwargs: MagicMock()
+
+    first = make_model()
+    second = make_model()
+
+    assert first is second
+    mock_model_cls.assert_called_once()
+    config = mock_model_cls.call_args.kwargs["boto_client_config"]
+    assert config.read_timeout == 300
+    assert config.connect_timeout == 60
+    # Throttles are retried by RateLimitedModel, through the shared limiter
+    assert config.retries == {'total_max_attempts': 1}
+    assert config.max_pool_connections == 50
+    assert mock_model_cls.call_args.kwargs["boto_session"] is mock_session.return_value
+    first.client.meta.events.register.assert_called_once_with(
+        "after-call.bedrock-runtime.ConverseStream", attach_response_stream)
+
+@patch('modules.bedrock.get_boto_session')
+@patch('modules.bedrock.DocumentStoreBedrockModel')
+def test_get_bedrock_model_keyed_by_configuration(mock_model_cls, mock_session):
+    mock_model_cls.side_effect = lambda **kwargs: MagicMock()
+
+    assert make_model() is not make_model(model_id="other")
+    assert make_model() is not make_model(read_timeout=10)
+    assert make_model() is not make_model(max_pool_connections=3)
+    assert mock_model_cls.call_count == 4
+
+def test_document_store_model_reads_document_refs(tmp_path):
+    ref = DocumentStore(root=tmp_path, max_bytes=1024).put("abcdef", "txt", b"hello")
+    model = DocumentStoreBedrockModel(model_id="model", boto_session=MagicMock())
+
+    content = {"document": {"name": "notes", "format": "txt", "source": {"bytes": ref}}}
+    formatted = model._format_request_message_content(content)
+
+    assert formatted["document"]["source"]["bytes"][:] == b"hello"
+    assert content["document"]["source"]["bytes"] is ref
+
+class BlockingResponse:
+    """Like the urllib3 response of an event stream whose read blocks until the socket is shut down."""
+
+    def __init__(self):
+        self.closed = False
+        self.unblocked = threading.Event()
+
+    def shutdown(self):
+        self.unblocked.set()
+
+    def close(self):
+        self.closed = True
+        self.unblocked.set()
+
+class FakeEventStream:
+    def __init__(self, raw_stream):
+        self._raw_stream = raw_stream
+
+    def close(self):
+        self._raw_stream.close()
+
+@pytest.mark.asyncio
+async def test_cancelled_stream_closes_its_connection():
+    model = DocumentStoreBedrockModel.__new__(DocumentStoreBedrockModel)
+    model.config = {"model_id": "model"}
+    response, finished = BlockingResponse(), threading.Event()
+
+    def read_stream(callback, *args):
+        try:
+            attach_response_stream(parsed={"stream": FakeEventStream(response)})
+            callback({"messageStart": {"role": "assistant"}})
+            # Waiting for the next chunk, like a model still thinking
+            response.unblocked.wait(timeout=5)
+            callback({"contentBlockDelta": {"delta": {"text": "late"}}})
+        finally:
+            try:
+                callback()
+            finally:
+                finished.set()
+
+    model._stream = read_stream
+    before = cancellation_stats.stats()
+
+    stream = model.stream([{"role": "user", "content": [{"text": "hi"}]}])
+    assert await anext(stream) == {"messageStart": {"role": "assistant"}}
+    await stream.aclose()
+
+    assert response.closed
+    assert await asyncio.to_thread(finished.wait, 1)
+    stats = cancellation_stats.stats()
+    assert stats["model_streams"] == before["model_streams"] + 1
+    assert stats["connections"] == before["connections"] + 1
+
+def test_close_response_stream_interrupts_a_blocked_read():
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    accepted = []
+
+    def serve():
+        connection, _ = server.accept()
+        accepted.append(connection)
+        connection.recv(65536)
+        # Headers, then nothing: the model has not produced its first token yet
+        connection.sendall(b"HTTP/1.1 200 OK\r\nContent-Type: application/vnd.amazon.eventstream\r\n"
+                           b"Transfer-Encoding: chunked\r\n\r\n")
+
+    threading.Thread(target=serve, daemon=True).start()
+    http = urllib3.PoolManager(timeout=urllib3.Timeout(connect=5, read=30))
+    raw = http.request("POST", f"http://127.0.0.1:{server.getsockname()[1]}/", preload_content=False)
+    reader = ThreadPoolExecutor(max_workers=1)
+    read = reader.submit(lambda: list(raw.stream()))
+    time.sleep(0.1)
+
+    started = time.perf_counter()
+    assert close_response_stream(FakeEventStream(raw))
+    with contextlib.suppress(Exception):
+        read.result(timeout=5)
+
+    assert time.perf_counter() - started < 1
+    assert not close_response_stream(FakeEventStream(raw))
+    reader.shutdown()
+    for connection in accepted:
+        connection.close()
+    server.close()
+
+def test_private_api_contract():
+    # DocumentStoreBedrockModel and close_response_stream build on private strands and botocore APIs:
+    # strands-agents is pinned in pyproject.toml and this fails when an upgrade changes them
+    assert list(inspect.signature(BedrockModel._stream).parameters) == [
+        "self", "callback", "messages", "tool_specs", "system_prompt_content", "tool_choice"]
+    assert list(inspect.signature(BedrockModel._format_request_message_content).parameters) == ["self", "content"]
+    raw = MagicMock()
+    assert EventStream(raw, None, None, "ConverseStream")._raw_stream is raw
@@ -0,0 +1,57 @@
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.cache import CachedDocument, DocumentCache, get_file_digest
+
+def make_document(digest, size, fmt="pdf"):
+    return CachedDocument(digest=digest, format=fmt, source=b"x" * size, size=size)
+
+def test_get_file_digest(tmp_path):
+    file = tmp_path / "doc.txt"
+    file.write_bytes(b"hello")
+    assert get_file_digest(file) == "2cf24dba5fb0a30e26e83b2ac5b9e29e1b161e5c1fa7425e73043362938b9824"
+
+def test_document_cache_hit_and_miss():
+    cache = DocumentCache(max_bytes=100)
+    assert cache.get("a", "pdf") is None
+
+    document = make_document("a", 10)
+    cache.put(document)
+
+    assert cache.get("a", "pdf") is document
+    assert cache.get("a", "csv") is None
+    assert cache.hits == 1
+    assert cache.misses == 2
+
+def test_document_cache_lru_eviction():
+    cache = DocumentCache(max_bytes=25)
+    cache.put(make_document("a", 10))
+    cache.put(make_document("b", 10))
+    cache.get("a", "pdf")
+    cache.put(make_document("c", 10))
+
+    assert cache.get("b", "pdf") is None
+    assert cache.get("a", "pdf") is not None
+    assert cache.get("c", "pdf") is not None
+    assert cache.evictions == 1
+    assert cache.stats()["size_bytes"] == 20
+
+def test_document_cache_skips_oversized_documents():
+    cache = DocumentCache(max_bytes=5)
+    cache.put(make_document("a", 10))
+    assert len(cache) == 0
+
+def test_document_cache_stats():
+    cache = DocumentCache(max_bytes=100)
+    cache.put(make_document("a", 10))
+    cache.get("a", "pdf")
+    cache.get("b", "pdf")
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
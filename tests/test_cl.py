@@ -1,12 +1,22 @@
 import sys
 import os
+import asyncio
 from unittest.mock import MagicMock, patch, AsyncMock
 import pytest
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from modules.cl import sanitize_filename, get_question_from_message, get_content_blocks_from_message, auth_callback
+from modules.admission import admission_scheduler
+from modules.answer_cache import AnswerCache
+from modules.cache import DocumentCache
+from modules.cancellation import cancellation_stats
+from modules.store import DocumentStore
+from modules.cl import (
+    sanitize_filename, get_question_from_message, get_content_blocks_from_message, auth_callback, extract_document,
+    process_user_task, get_agent, stream_to_step, LoggingHooks, get_request_size, QueueStatus)
+from modules.metrics import tool_seconds
+from settings import ExtractionMode, ModelBackend, Models
 
 def test_sanitize_filename():
     assert sanitize_filename("valid_name.txt") == "valid name txt"
@@ -38,9 +48,12 @@ def test_get_question_from_message_with_files(mock_get_blocks):
     assert question[0] == {"document": "data"}
     assert question[1] == {"text": "Summarize this"}
 
+@patch('modules.cl.get_file_digest', return_value="digest")
+@patch('modules.cl.document_cache', DocumentCache(max_bytes=1024))
+@patch('modules.cl.document_store')
 @patch('modules.cl.Path')
 @patch('modules.cl.shutil.rmtree')
-def test_get_content_blocks_from_message(mock_rmtree, mock_path):
+def test_get_content_blocks_from_message(mock_rmtree, mock_path, mock_store, mock_digest):
     message = MagicMock()
     element = MagicMock()
     element.type = "file"
@@ -61,10 +74,56 @@ def test_get_content_blocks_from_message(mock_rmtree, mock_path):
         assert len(blocks) == 1
         assert blocks[0]["document"]["name"] == "test pdf"
         assert blocks[0]["document"]["format"] == "pdf"
-        assert blocks[0]["document"]["source"]["bytes"] == b"file_content"
+        assert blocks[0]["document"]["source"]["bytes"] is mock_store.put.return_value
+        mock_store.put.assert_called_once_with("digest", "pdf", b"file_content")
         
         mock_rmtree.assert_called_once()
 
+@patch('modules.cl.shutil.rmtree')
+def test_get_content_blocks_from_message_cache_hit(mock_rmtree, tmp_path):
+    cache = DocumentCache(max_bytes=1024)
+
+    def upload(name):
+        upload_dir = tmp_path / name
+        upload_dir.mkdir()
+        file = upload_dir / "report.pdf"
+        file.write_bytes(b"same content")
+        element = MagicMock()
+        element.type = "file"
+        element.mime = "application/pdf"
+        element.path = str(file)
+        element.name = "report.pdf"
+        message = MagicMock()
+        message.elements = [element]
+        return message
+
+    with patch('modules.cl.MIME_MAP', {"application/pdf": "pdf"}), patch('modules.cl.document_cache', cache), \
+            patch('modules.cl.document_store', DocumentStore(root=tmp_path / "store", max_bytes=1024)):
+        first = get_content_blocks_from_message(upload("first"))
+        with patch('modules.cl.Path.read_bytes') as mock_read_bytes:
+            second = get_content_blocks_from_message(upload("second"))
+            mock_read_bytes.assert_not_called()
+
+    assert first == second
+    assert second[0]["document"]["source"]["bytes"].read()[:] == b"same content"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_extract_document_extracted_mode():
+    source, fmt = extract_document("csv", b"a,b\n1,2\n")
+    assert source == b"| a | b |\n|---|---|\n| 1 | 2 |"
+    assert fmt == "md"
+
+@patch('modules.cl.extraction_executor', None)
+def test_extract_document_raw_mode():
+    with patch('modules.cl.EXTRACTION_MODES', {"csv": ExtractionMode.RAW}):
+        assert extract_document("csv", b"a,b\n1,2\n") == (b"a,b\n1,2\n", "csv")
+    assert extract_document("pdf", b"%PDF") == (b"%PDF", "pdf")
+
+@patch('modules.cl.extraction_executor', None)
+def test_extract_document_falls_back_to_raw_on_error():
+    assert extract_document("xlsx", b"not a zip") == (b"not a zip", "xlsx")
+
 @patch('modules.cl.jwt.decode')
 @patch('modules.cl.cl.User')
 def test_auth_callback_success(mock_user_cls, mock_jwt_decode):
@@ -101,3 +160,293 @@ def test_auth_callback_expired(mock_jwt_decode):
     user = auth_callback(headers, "secret", "HS256")
     
     assert user is None
+
+@pytest.fixture
+def new_chat():
+    """
+    Starts chat sessions for process_user_task, each with a new mock agent.
+
+    Returns:
+        A function returning the agent of a new session and the message its answers stream to
+    """
+    with patch('modules.cl.cl.user_session') as mock_session, patch('modules.cl.cl.Message') as mock_message_cls:
+        def start():
+            agent = MagicMock()
+            agent.system_prompt = "system"
+            agent.tool_registry.get_all_tool_specs.return_value = []
+            agent.messages = []
+            agent.model.config = {}
+            agent.model.get_config.return_value = {"model_id": "model"}
+            session = {"agent": agent, "user": None, "id": "session"}
+            mock_session.get.side_effect = session.get
+            msg = AsyncMock()
+            mock_message_cls.return_value = msg
+            return agent, msg
+
+        yield start
+
+def get_streamed(msg):
+    return "".join(call.args[0] for call in msg.stream_token.call_args_list)
+
+@pytest.mark.asyncio
+async def test_process_user_task_rejects_oversized_request(new_chat):
+    agent, msg = new_chat()
+
+    question = [
+        {"document": {"name": "big", "format": "pdf", "source": {"bytes": b"x" * 20_000_000}}},
+        {"text": "Summarize"}]
+    await process_user_task(question=question, debug=False)
+
+    agent.stream_async.assert_not_called()
+    streamed = get_streamed(msg)
+    assert "Estimated input" in streamed
+    assert "too large" in streamed
+    msg.update.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_process_user_task_sends_question_with_long_history(new_chat):
+    agent, msg = new_chat()
+    agent.messages = [{"role": "user", "content": [{"text": "x" * 800_000}]}]
+
+    async def events(question):
+        yield {"data": "Answer"}
+
+    agent.stream_async.side_effect = events
+    await process_user_task(question="And the conclusion?", debug=False)
+
+    # The conversation manager makes room for the question in the history
+    agent.stream_async.assert_called_once_with("And the conclusion?")
+    streamed = get_streamed(msg)
+    assert "Answer" in streamed
+    assert "file" not in streamed
+
+@pytest.mark.asyncio
+@patch('modules.cl.map_reduce')
+async def test_process_user_task_keeps_history_for_a_fitting_document(mock_map_reduce, new_chat):
+    agent, _ = new_chat()
+    agent.messages = [{"role": "user", "content": [{"text": "x" * 800_000}]}]
+
+    async def events(question):
+        yield {"data": "Answer"}
+
+    agent.stream_async.side_effect = events
+    question = [
+        {"document": {"name": "small", "format": "txt", "source": {"bytes": b"x" * 1000}}},
+        {"text": "Summarize"}]
+    await process_user_task(question=question, debug=False)
+
+    mock_map_reduce.assert_not_called()
+    agent.stream_async.assert_called_once_with(question)
+
+@pytest.mark.asyncio
+async def test_process_user_task_closes_the_stream_when_cancelled(new_chat):
+    agent, _ = new_chat()
+    streaming, closed = asyncio.Event(), []
+
+    async def events(question):
+        try:
+            yield {"data": "Partial"}
+            streaming.set()
+            await asyncio.sleep(60)
+        finally:
+            closed.append(question)
+
+    agent.stream_async.side_effect = events
+    turns = cancellation_stats.stats()["turns"]
+
+    task = asyncio.create_task(process_user_task(question="Question", debug=False))
+    await streaming.wait()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert closed == ["Question"]
+    assert cancellation_stats.stats()["turns"] == turns + 1
+    assert admission_scheduler.stats()["active"] == 0
+
+@pytest.mark.asyncio
+@patch('modules.cl.get_progress_step', new_callable=AsyncMock)
+@patch('modules.cl.map_reduce')
+async def test_process_user_task_map_reduce_for_oversized_text(mock_map_reduce, mock_progress_step, new_chat):
+    agent, msg = new_chat()
+    answer = {"role": "assistant", "content": [{"text": "Summary"}]}
+    active = []
+
+    async def events(admit, **kwargs):
+        # Only the sub-agents hold model streams, not the turn
+        async with admit(100):
+            active.append(admission_scheduler.stats()["active"])
+        yield {"data": "Summary"}
+        yield {"message": answer}
+
+    mock_map_reduce.side_effect = events
+
+    question = [
+        {"document": {"name": "big", "format": "txt", "source": {"bytes": b"x" * 2_000_000}}},
+        {"text": "Summarize"}]
+    await process_user_task(question=question, debug=False)
+
+    agent.stream_async.assert_not_called()
+    mock_map_reduce.assert_called_once()
+    assert active == [1]
+    assert "Summary" in get_streamed(msg)
+    assert agent.messages == [{"role": "user", "content": [{"text": "Summarize"}]}, answer]
+
+@pytest.mark.asyncio
+@patch('modules.cl.answer_cache', new_callable=lambda: AnswerCache(ttl=60, max_bytes=1024))
+async def test_process_user_task_replays_cached_answer(mock_answer_cache, new_chat):
+    answer = {"role": "assistant", "content": [{"text": "The report is about sales."}]}
+
+    async def events(question):
+        yield {"data": "The report is about sales."}
+        yield {"message": answer}
+
+    async def ask(question):
+        agent, msg = new_chat()
+        agent.stream_async.side_effect = events
+        await process_user_task(question=question, debug=False)
+        return agent, get_streamed(msg)
+
+    def make_question(text):
+        return [{"document": {"name": "report", "format": "txt", "source": {"bytes": b"sales"}}}, {"text": text}]
+
+    first, _ = await ask(make_question("Write a summary of the document"))
+    second, streamed = await ask(make_question("write a summary of the document."))
+
+    first.stream_async.assert_called_once()
+    second.stream_async.assert_not_called()
+    assert "The report is about sales." in streamed
+    assert second.messages == [{"role": "user", "content": make_question("write a summary of the document.")}, answer]
+    assert mock_answer_cache.stats()["hits"] == 1 and mock_answer_cache.stats()["bytes_saved"] == 5 + 32
+
+    third, _ = await ask(make_question("List the risks"))
+    third.stream_async.assert_called_once()
+
+@patch('modules.cl.Agent')
+@patch('modules.cl.get_bedrock_model')
+def test_get_agent_uses_shared_model(mock_get_model, mock_agent_cls):
+    get_agent(system_prompt="system", llm_read_timeout=10, llm_max_attempts=4)
+
+    mock_get_model.assert_called_once_with(
+        model_id=Models.CLAUDE_45, temperature=0.3, read_timeout=10, connect_timeout=60)
+    model = mock_agent_cls.call_args.kwargs["model"]
+    assert type(model).__name__ == "RateLimitedModel"
+    assert model.model is mock_get_model.return_value
+    assert model.max_attempts == 4
+
+@patch('modules.cl.Agent')
+@patch('modules.cl.get_bedrock_model')
+def test_get_agent_prompt_caching(mock_get_model, mock_agent_cls):
+    get_agent(system_prompt="system", prompt_caching=True)
+
+    kwargs = mock_agent_cls.call_args.kwargs
+    assert kwargs["system_prompt"] == [{"text": "system"}, {"cachePoint": {"type": "default"}}]
+    assert [type(hook).__name__ for hook in kwargs["hooks"]] == ["PromptCacheHooks"]
+    assert kwargs["hooks"][0].max_points == 3
+
+    get_agent(system_prompt="system", prompt_caching=False)
+
+    kwargs = mock_agent_cls.call_args.kwargs
+    assert kwargs["system_prompt"] == "system"
+    assert kwargs["hooks"] == []
+
+@patch('modules.cl.Agent')
+@patch('modules.cl.get_cassette')
+@patch('modules.cl.get_bedrock_model')
+def test_get_agent_backends(mock_get_model, mock_get_cassette, mock_agent_cls):
+    get_agent(system_prompt="system", prompt_caching=False, backend=ModelBackend.RECORD)
+
+    kwargs = mock_agent_cls.call_args.kwargs
+    assert type(kwargs["model"].model).__name__ == "RecordingModel"
+    assert kwargs["model"].model.model is mock_get_model.return_value
+    assert [type(hook).__name__ for hook in kwargs["hooks"]] == ["ToolRecordingHooks"]
+
+    mock_get_model.reset_mock()
+    get_agent(system_prompt="system", prompt_caching=False, backend=ModelBackend.REPLAY)
+
+    kwargs = mock_agent_cls.call_args.kwargs
+    mock_get_model.assert_not_called()
+    assert type(kwargs["model"]).__name__ == "ReplayModel"
+    assert kwargs["model"].config == {"model_id": Models.CLAUDE_45}
+    assert [type(hook).__name__ for hook in kwargs["hooks"]] == ["ToolReplayHooks"]
+
+@pytest.mark.asyncio
+@patch('modules.cl.cl.user_session')
+async def test_stream_to_step_coalesces_tokens(mock_session):
+    step = AsyncMock()
+    mock_session.get.return_value = step
+
+    @stream_to_step("tool")
+    async def tool(tool_context):
+        for token in ["a", "b", "c"]:
+            yield {"delta": {"text": token}}
+        yield {"message": {"role": "assistant", "content": []}}
+        yield {"delta": {"text": "d"}}
+
+    events = [event async for event in tool(tool_context=MagicMock(tool_use={"toolUseId": "tool-1"}))]
+
+    assert len(events) == 5
+    mock_session.get.assert_called_once_with("step_tool-1")
+    assert [call.args[0] for call in step.stream_token.call_args_list] == ["abc", "d"]
+    assert step.output == "abcd"
+    step.update.assert_awaited_once()
+
+@pytest.mark.asyncio
+@patch('modules.cl.cl.Step')
+@patch('modules.cl.cl.user_session')
+async def test_logging_hooks_record_tool_duration(mock_session, mock_step_cls):
+    mock_step_cls.return_value = AsyncMock()
+    mock_session.get.return_value = mock_step_cls.return_value
+    hooks = LoggingHooks()
+    event = MagicMock()
+    event.tool_use = {"name": "metrics_test_tool", "toolUseId": "tool-1"}
+
+    await hooks.before_tool(event)
+    await hooks.after_tool(event)
+
+    assert tool_seconds.snapshot(tool="metrics_test_tool")["count"] == 1
+
+@pytest.mark.asyncio
+@patch('modules.cl.cl.Step')
+@patch('modules.cl.cl.user_session')
+async def test_logging_hooks_key_steps_by_tool_use_id(mock_session, mock_step_cls):
+    steps = {}
+    mock_session.set.side_effect = steps.__setitem__
+    mock_session.get.side_effect = steps.get
+    mock_step_cls.side_effect = lambda **kwargs: AsyncMock()
+    hooks = LoggingHooks()
+    first, second = MagicMock(), MagicMock()
+    first.tool_use = {"name": "calculator", "toolUseId": "tool-1"}
+    second.tool_use = {"name": "calculator", "toolUseId": "tool-2"}
+
+    await hooks.before_tool(first)
+    await hooks.before_tool(second)
+
+    assert steps["step_tool-1"] is not steps["step_tool-2"]
+    step = steps["step_tool-1"]
+    await hooks.after_tool(first)
+    step.update.assert_awaited_once()
+    assert steps["step_tool-1"] is None and steps["step_tool-2"] is not None
+
+def test_get_request_size():
+    assert get_request_size("héllo") == (6, 1)
+    question = [{"document": {"name": "a", "format": "txt", "source": {"bytes": b"x" * 10}}}, {"text": "abc"}]
+    assert get_request_size(question) == (13, 2)
+
+@pytest.mark.asyncio
+async def test_queue_status_shows_position_until_admitted():
+    msg = AsyncMock()
+    msg.content = "_Estimated input_\n\n"
+    status = QueueStatus(msg)
+
+    await status.clear()
+    msg.update.assert_not_awaited()
+
+    await status.show(3)
+    assert msg.content.startswith("_Estimated input_\n\n") and "number 3 in line" in msg.content
+    await status.show(1)
+    assert "number 1 in line" in msg.content and "number 3" not in msg.content
+
+    await status.clear()
+    assert msg.content == "_Estimated input_\n\n"
+    assert msg.update.await_count == 3
@@ -0,0 +1,118 @@
+import sys
+import os
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.conversation import (
+    DocumentConversationManager, compact_documents, get_document_digest, get_document_outline)
+from modules.store import DocumentStore
+from modules.tokens import estimate_messages_tokens
+from settings import DocumentHistoryPolicy
+
+REPORT = "# Report\n\nIntro text\n\n## Sales\n\n" + "Sales grew in every region. " * 2000 + "\n\n## Costs\n\nFlat."
+
+def document(name, text, fmt="md"):
+    return {"document": {"name": name, "format": fmt, "source": {"bytes": text.encode()}}}
+
+def turn(question, *documents):
+    return [
+        {"role": "user", "content": [*documents, {"text": question}]},
+        {"role": "assistant", "content": [{"text": "Answer"}]},
+    ]
+
+def test_get_document_outline():
+    assert get_document_outline(REPORT, "md") == "# Report\n## Sales\n## Costs"
+    assert get_document_outline("a,b\n1,2\n3,4\n", "csv") == "Columns: a,b\nRows: 2"
+    assert get_document_outline("first\n\n  second  \n", "txt") == "first\nsecond"
+    assert get_document_outline("line\n" * 100, "txt", max_chars=12) == "line\nline\n..."
+
+def test_get_document_digest():
+    handle = get_document_digest(document("report", REPORT)["document"], DocumentHistoryPolicy.HANDLE)
+    outline = get_document_digest(document("report", REPORT)["document"], DocumentHistoryPolicy.OUTLINE)
+    pdf = get_document_digest(document("scan", "%PDF", fmt="pdf")["document"], DocumentHistoryPolicy.OUTLINE)
+
+    assert "report" in handle and "search_documents" in handle and "Outline" not in handle
+    assert outline.endswith("Outline:\n# Report\n## Sales\n## Costs]")
+    assert "attach it again" in pdf and "Outline" not in pdf
+
+def test_get_document_digest_of_long_pdfs(tmp_path):
+    preview = DocumentStore(root=tmp_path, max_bytes=1024).put("abcd", "pdf.preview.pdf", b"%PDF")
+    pages = {"name": "book pages 3-4", "format": "pdf", "source": {"bytes": b"%PDF"}}
+
+    previewed = get_document_digest(
+        {"name": "book", "format": "pdf", "source": {"bytes": preview}}, DocumentHistoryPolicy.OUTLINE)
+    read = get_document_digest(pages, DocumentHistoryPolicy.OUTLINE, read_by_tool=True)
+
+    assert "read_pages" in previewed and "attach it again" not in previewed
+    assert read.startswith('[Document "book pages 3-4" (pdf, 0 KB) was read with the read_pages tool')
+
+def test_compact_documents_keeps_most_recent_attachment():
+    messages = turn("Summarize", document("first", REPORT)) + turn("Compare", document("second", REPORT))
+
+    assert compact_documents(messages, DocumentHistoryPolicy.OUTLINE, keep=1) == 1
+    assert messages[0]["content"][0]["text"].startswith('[Document "first"')
+    assert messages[0]["content"][1] == {"text": "Summarize"}
+    assert "document" in messages[2]["content"][0]
+
+def test_compact_documents_skips_unanswered_and_verbatim():
+    messages = turn("Summarize", document("first", REPORT))
+    messages.append({"role": "user", "content": [document("second", REPORT), {"text": "Compare"}]})
+
+    assert compact_documents(messages, DocumentHistoryPolicy.VERBATIM, keep=0) == 0
+    assert compact_documents(messages, DocumentHistoryPolicy.HANDLE, keep=0) == 1
+    assert "document" in messages[2]["content"][0]
+
+def test_compact_documents_does_not_modify_shared_content():
+    question = [document("first", REPORT), {"text": "Summarize"}]
+    messages = [{"role": "user", "content": question}, {"role": "assistant", "content": [{"text": "Answer"}]}]
+
+    compact_documents(messages, DocumentHistoryPolicy.HANDLE, keep=0)
+
+    assert "document" in question[0]
+
+def test_compact_documents_replaces_pages_read_by_tool():
+    pages = {"document": {"name": "book pages 3-4", "format": "pdf", "source": {"bytes": b"%PDF" * 1000}}}
+    tool_use = {"toolUse": {"toolUseId": "1", "name": "read_pages", "input": {"document": "book"}}}
+    tool_result = {"toolResult": {"toolUseId": "1", "status": "success", "content": [{"text": "Pages"}, pages]}}
+    messages = turn("Summarize", document("book", REPORT))
+    messages[1:1] = [{"role": "assistant", "content": [tool_use]}, {"role": "user", "content": [tool_result]}]
+
+    # The attachment is kept, the pages are read again if needed
+    assert compact_documents(messages, DocumentHistoryPolicy.OUTLINE, keep=1) == 1
+    assert "document" in messages[0]["content"][0]
+    result = messages[2]["content"][0]["toolResult"]
+    assert result["toolUseId"] == "1" and result["content"][0] == {"text": "Pages"}
+    assert "read_pages" in result["content"][1]["text"]
+    assert "document" in tool_result["toolResult"]["content"][1]
+
+    assert compact_documents(messages, DocumentHistoryPolicy.OUTLINE, keep=1) == 0
+
+def test_input_tokens_flatten_over_follow_ups():
+    manager = DocumentConversationManager(window_size=30, policy=DocumentHistoryPolicy.OUTLINE, keep=0)
+    agent = MagicMock()
+    agent.messages = []
+
+    tokens = []
+    for i in range(5):
+        documents = [document(f"doc{i}", REPORT)] if i in (0, 2) else []
+        agent.messages += turn(f"Question {i}", *documents)
+        tokens.append(estimate_messages_tokens(agent.messages))
+        manager.apply_management(agent)
+
+    # Only the documents of the current turn are sent in full
+    assert tokens[2] < tokens[0] * 1.2
+    assert tokens[4] < tokens[0] / 10
+
+def test_reduce_context_drops_recent_documents_first():
+    manager = DocumentConversationManager(window_size=30, policy=DocumentHistoryPolicy.VERBATIM, keep=1)
+    agent = MagicMock()
+    agent.messages = turn("Summarize", document("first", REPORT))
+
+    manager.apply_management(agent)
+    assert "document" in agent.messages[0]["content"][0]
+
+    manager.reduce_context(agent)
+    assert "search_documents" in agent.messages[0]["content"][0]["text"]
+    assert len(agent.messages) == 2
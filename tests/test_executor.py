@@ -0,0 +1,171 @@
+import sys
+import os
+import asyncio
+import inspect
+import time
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from strands import Agent, tool
+from strands.models import Model
+from strands.tools.executors import ConcurrentToolExecutor
+from strands.tools.executors._executor import ToolExecutor
+
+from modules.cancellation import cancellation_stats
+from modules.executor import BoundedToolExecutor
+
+class ParallelToolsModel(Model):
+    """Asks for a tool three times in one response, then answers with the number of results."""
+
+    def __init__(self, tool_name="wait"):
+        self.tool_name = tool_name
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {"model_id": "stub"}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        yield {"messageStart": {"role": "assistant"}}
+        results = [block for block in messages[-1]["content"] if "toolResult" in block]
+        if results:
+            yield {"contentBlockDelta": {"delta": {"text": f"{len(results)} results"}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            return
+        for i in range(3):
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"t{i}", "name": self.tool_name}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": '{"seconds": 0.2}'}}}}
+            yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "tool_use"}}
+
+running = []
+peak = []
+
+@tool
+async def wait(seconds: float) -> str:
+    """Waits for some seconds."""
+    running.append(seconds)
+    peak.append(len(running))
+    await asyncio.sleep(seconds)
+    running.pop()
+    return "done"
+
+started = []
+closed = []
+
+async def nested_stream(seconds):
+    try:
+        yield "started"
+        await asyncio.sleep(seconds)
+        yield "done"
+    finally:
+        closed.append("nested")
+
+@tool
+async def stream_slowly(seconds: float):
+    """Streams its progress for some seconds."""
+    try:
+        async for progress in nested_stream(seconds):
+            started.append(progress)
+            yield progress
+    finally:
+        closed.append("tool")
+
+produced = []
+
+@tool
+async def stream_quickly(seconds: float):
+    """Streams its progress without waiting."""
+    for step in range(5):
+        produced.append(step)
+        yield step
+
+@pytest.mark.parametrize("max_concurrency,expected_peak,min_seconds,max_seconds", [
+    (1, 1, 0.6, 1.0),
+    (2, 2, 0.4, 0.6),
+    (4, 3, 0.2, 0.4),
+])
+def test_tool_calls_run_in_parallel_up_to_the_limit(max_concurrency, expected_peak, min_seconds, max_seconds):
+    peak.clear()
+    agent = Agent(model=ParallelToolsModel(), tools=[wait], callback_handler=None,
+                  tool_executor=BoundedToolExecutor(max_concurrency=max_concurrency))
+
+    started = time.perf_counter()
+    result = agent("Wait three times")
+    elapsed = time.perf_counter() - started
+
+    assert str(result).strip() == "3 results"
+    assert max(peak) == expected_peak
+    assert min_seconds <= elapsed < max_seconds
+
+def test_agent_is_reused_from_another_event_loop():
+    agent = Agent(model=ParallelToolsModel(), tools=[wait], callback_handler=None,
+                  tool_executor=BoundedToolExecutor(max_concurrency=1))
+
+    # Every synchronous call runs in its own event loop
+    assert str(agent("Wait three times")).strip() == "3 results"
+    assert str(agent("Wait three times again")).strip() == "3 results"
+
+@pytest.mark.asyncio
+async def test_cancelled_turn_leaves_no_orphaned_tasks():
+    started.clear()
+    closed.clear()
+    cancelled = cancellation_stats.stats()["tool_calls"]
+    agent = Agent(model=ParallelToolsModel("stream_slowly"), tools=[stream_slowly], callback_handler=None,
+                  tool_executor=BoundedToolExecutor(max_concurrency=2))
+
+    async def turn():
+        async for _ in agent.stream_async("Stream three times"):
+            pass
+
+    task = asyncio.create_task(turn())
+    while len(started) < 2:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    # The running calls and their nested streams are closed by the time the cancellation completes
+    assert sorted(closed) == ["nested", "nested", "tool", "tool"]
+    assert [other for other in asyncio.all_tasks() if other is not asyncio.current_task()] == []
+    # The third call waited for a free slot, it is cancelled too
+    assert cancellation_stats.stats()["tool_calls"] == cancelled + 3
+
+@pytest.mark.asyncio
+async def test_tool_waits_for_its_events_to_be_consumed():
+    produced.clear()
+    agent = Agent(model=ParallelToolsModel("stream_quickly"), tools=[stream_quickly], callback_handler=None,
+                  tool_executor=BoundedToolExecutor(max_concurrency=1))
+    ahead = []
+
+    async for event in agent.stream_async("Stream three times"):
+        if "tool_stream_event" in event:
+            # Events produced beyond the ones consumed so far, this one included
+            ahead.append(len(produced) - len(ahead) - 1)
+            await asyncio.sleep(0)
+
+    assert len(ahead) == 15
+    # A tool produces its next event only once the previous one is consumed
+    assert max(ahead) == 0
+
+def test_private_api_contract():
+    # BoundedToolExecutor overrides private strands methods: strands-agents is pinned in pyproject.toml and
+    # this fails when an upgrade changes them
+    assert list(inspect.signature(ConcurrentToolExecutor._execute).parameters) == [
+        "self", "agent", "tool_uses", "tool_results", "cycle_trace", "cycle_span", "invocation_state",
+        "structured_output_context"]
+    assert list(inspect.signature(ConcurrentToolExecutor._task).parameters) == [
+        "self", "agent", "tool_use", "tool_results", "cycle_trace", "cycle_span", "invocation_state", "task_id",
+        "task_queue", "task_event", "stop_event", "structured_output_context"]
+    assert isinstance(inspect.getattr_static(ToolExecutor, "_stream_with_trace"), staticmethod)
+    assert list(inspect.signature(ToolExecutor._stream_with_trace).parameters) == [
+        "agent", "tool_use", "tool_results", "cycle_trace", "cycle_span", "invocation_state",
+        "structured_output_context", "kwargs"]
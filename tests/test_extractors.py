@@ -0,0 +1,76 @@
+import sys
+import os
+import io
+import zipfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.extractors import (
+    collapse_whitespace, extract_csv, extract_docx, extract_html, extract_xlsx, get_extractor, to_markdown_table)
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def make_xlsx():
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    return make_zip({
+        "xl/workbook.xml": (
+            f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>'
+            f'<sheet name="Sales" sheetId="1" r:id="rId1"/></sheets></workbook>'),
+        "xl/_rels/workbook.xml.rels": (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>'),
+        "xl/sharedStrings.xml": f'<sst xmlns="{main}"><si><t>Region</t></si><si><t>North</t></si></sst>',
+        "xl/worksheets/sheet1.xml": (
+            f'<worksheet xmlns="{main}"><sheetData>'
+            f'<row r="1"><c r="A1" t="s"><v>0</v></c><c r="B1" t="inlineStr"><is><t>Total</t></is></c></row>'
+            f'<row r="2"><c r="A2" t="s"><v>1</v></c><c r="C2"><v>42</v></c></row>'
+            f'</sheetData></worksheet>'),
+    })
+
+def make_docx():
+    w = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    return make_zip({
+        "word/document.xml": (
+            f'<w:document xmlns:w="{w}"><w:body>'
+            f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr><w:r><w:t>Annual   report</w:t></w:r></w:p>'
+            f'<w:p><w:r><w:t>First </w:t></w:r><w:r><w:t>paragraph.</w:t></w:r></w:p>'
+            f'<w:p/>'
+            f'<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Year</w:t></w:r></w:p></w:tc>'
+            f'<w:tc><w:p><w:r><w:t>Revenue</w:t></w:r></w:p></w:tc></w:tr>'
+            f'<w:tr><w:tc><w:p><w:r><w:t>2024</w:t></w:r></w:p></w:tc>'
+            f'<w:tc><w:p><w:r><w:t>10</w:t></w:r></w:p></w:tc></w:tr></w:tbl>'
+            f'</w:body></w:document>'),
+    })
+
+def test_collapse_whitespace():
+    assert collapse_whitespace("  a \t  b \n\n\n\n  c  ") == "a b\n\nc"
+
+def test_to_markdown_table():
+    table = to_markdown_table([["a", "b|c", ""], ["1", "2", ""], ["", "", ""]])
+    assert table == "| a | b\\|c |\n|---|---|\n| 1 | 2 |"
+
+def test_extract_csv():
+    assert extract_csv(b"name;value\nfoo;1\nbar;2\n") == "| name | value |\n|---|---|\n| foo | 1 |\n| bar | 2 |"
+
+def test_extract_xlsx():
+    assert extract_xlsx(make_xlsx()) == "## Sales\n\n| Region | Total |  |\n|---|---|---|\n| North |  | 42 |"
+
+def test_extract_docx():
+    text = extract_docx(make_docx())
+    assert text == "# Annual report\n\nFirst paragraph.\n\n| Year | Revenue |\n|---|---|\n| 2024 | 10 |"
+
+def test_extract_html():
+    html = (b"<html><head><title>Doc</title><style>p {color: red}</style></head>"
+            b"<body><script>alert(1)</script><h1>Title</h1><p>Some   <b>bold</b>&amp; text</p></body></html>")
+    assert extract_html(html) == "Doc\n\nTitle\n\nSome bold& text"
+
+def test_get_extractor():
+    assert get_extractor("csv") == (extract_csv, "md")
+    assert get_extractor("pdf") is None
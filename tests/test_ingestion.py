@@ -0,0 +1,116 @@
+import sys
+import os
+import asyncio
+from unittest.mock import MagicMock, patch
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.cache import DocumentCache
+from modules.ingestion import (
+    ByteBudget, SessionLimitError, add_session_documents, get_content_blocks_from_message_async,
+    get_question_from_message_async)
+from modules.retrieval import BM25Index
+from modules.store import PINS_DIR, DocumentStore, read_source
+
+def make_message(tmp_path, files, content=""):
+    upload_dir = tmp_path / "upload"
+    upload_dir.mkdir()
+    elements = []
+    for name, data in files.items():
+        file = upload_dir / name
+        file.write_bytes(data)
+        element = MagicMock()
+        element.type = "file"
+        element.mime = "text/plain"
+        element.path = str(file)
+        element.name = name
+        elements.append(element)
+
+    message = MagicMock()
+    message.elements = elements
+    message.content = content
+    return message
+
+@pytest.mark.asyncio
+@patch('modules.cl.document_cache', DocumentCache(max_bytes=1024))
+async def test_get_content_blocks_from_message_async_keeps_order(tmp_path):
+    files = {f"file{i}.txt": f"content {i}".encode() for i in range(6)}
+    message = make_message(tmp_path, files)
+
+    with patch('modules.cl.document_store', DocumentStore(root=tmp_path / "store", max_bytes=1024)):
+        blocks = await get_content_blocks_from_message_async(message, budget=ByteBudget(max_bytes=1024))
+
+    assert [read_source(b["document"]["source"]["bytes"])[:] for b in blocks] == list(files.values())
+    assert [b["document"]["format"] for b in blocks] == ["txt"] * 6
+    assert not (tmp_path / "upload").exists()
+
+@pytest.mark.asyncio
+@patch('modules.ingestion.cl.user_session')
+@patch('modules.cl.document_cache', DocumentCache(max_bytes=1024))
+async def test_get_question_from_message_async(mock_session, tmp_path):
+    index = BM25Index()
+    session = {"document_index": index, "id": "session"}
+    mock_session.get.side_effect = session.get
+    mock_session.set.side_effect = session.__setitem__
+    message = make_message(tmp_path, {"notes.txt": b"notes"})
+
+    with patch('modules.cl.document_store', DocumentStore(root=tmp_path / "store", max_bytes=1024)):
+        question = await get_question_from_message_async(message)
+
+    assert question[0]["document"]["name"] == "notes txt"
+    assert question[1] == {"text": "Write a summary of the document"}
+    assert index.documents == {"notes txt": 1}
+    assert session["documents"] == {"notes txt": 5}
+    assert (tmp_path / "store" / PINS_DIR / str(os.getpid()) / "session").is_dir()
+
+@patch('modules.ingestion.cl.user_session')
+def test_add_session_documents_limit(mock_session):
+    session = {}
+    mock_session.get.side_effect = session.get
+    mock_session.set.side_effect = session.__setitem__
+
+    def block(name, size):
+        return {"document": {"name": name, "format": "txt", "source": {"bytes": b"x" * size}}}
+
+    add_session_documents([block("a", 60), {"text": "question"}], max_bytes=100)
+    # Documents already in the session are not counted twice
+    add_session_documents([block("a", 60), block("b", 40)], max_bytes=100)
+    with pytest.raises(SessionLimitError):
+        add_session_documents([block("c", 1)], max_bytes=100)
+
+    assert session["documents"] == {"a": 60, "b": 40}
+
+@pytest.mark.asyncio
+async def test_get_question_from_message_async_text_only():
+    message = MagicMock()
+    message.elements = []
+    message.content = "Hello world"
+
+    assert await get_question_from_message_async(message) == "Hello world"
+
+@pytest.mark.asyncio
+async def test_byte_budget_bounds_in_flight_bytes():
+    budget = ByteBudget(max_bytes=10)
+    peak = 0
+
+    async def worker(size):
+        nonlocal peak
+        async with budget.reserve(size):
+            peak = max(peak, budget.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(worker(6) for _ in range(4)))
+
+    assert peak == 6
+    assert budget.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_byte_budget_admits_oversized_request_alone():
+    budget = ByteBudget(max_bytes=10)
+
+    async with budget.reserve(50):
+        assert budget.in_flight == 10
+
+    assert budget.in_flight == 0
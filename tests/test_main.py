@@ -16,9 +16,11 @@ mock_cl.header_auth_callback = lambda f: f
 mock_cl.on_chat_start = lambda f: f
 mock_cl.on_chat_end = lambda f: f
 mock_cl.on_message = lambda f: f
+mock_cl.on_app_startup = lambda f: f
 
 # Now import main
-from main import header_auth_callback, start_chat, on_chat_end, handle_message
+from main import header_auth_callback, start_chat, on_chat_end, handle_message, on_app_startup
+from modules.ingestion import SessionLimitError
 
 @patch('main.ENVIRONMENT', 'local')
 @patch('main.FAKE_USER', 'test_user')
@@ -69,56 +71,104 @@ async def test_start_chat(mock_get_tools, mock_get_agent):
     mock_session.set.assert_any_call("agent", mock_get_agent.return_value)
 
 @pytest.mark.asyncio
-async def test_on_chat_end():
+@patch('main.close_session_pools', new_callable=AsyncMock)
+async def test_on_chat_end(mock_close_pools):
     # Setup user_session mock
     mock_session = MagicMock()
     mock_cl.user_session = mock_session
-    
-    mock_task = MagicMock()
-    mock_task.done.return_value = False
-    
-    mock_session.get.side_effect = [mock_task, mock_task] # current_task, task
-    
-    await on_chat_end()
-    
-    assert mock_task.cancel.call_count == 2
+    unwound = []
+
+    async def turn():
+        try:
+            await asyncio.sleep(60)
+        finally:
+            # The turn closes its streams before the pools are closed
+            await asyncio.sleep(0)
+            unwound.append(mock_close_pools.await_count)
+
+    current_task, task = asyncio.create_task(turn()), asyncio.create_task(turn())
+    await asyncio.sleep(0)
+    document = MagicMock()
+    # current_task, task, pdf_documents, id
+    mock_session.get.side_effect = [current_task, task, {"report pdf": document}, "session"]
+
+    with patch('main.document_store') as mock_store:
+        await on_chat_end()
+
+    assert current_task.cancelled() and task.cancelled()
+    assert unwound == [0, 0]
+    mock_close_pools.assert_awaited_once()
+    document.close.assert_called_once()
+    mock_store.unpin.assert_called_once_with("session")
 
 @pytest.mark.asyncio
-@patch('main.get_question_from_message')
-@patch('main.process_user_task')
-@patch('main.asyncio.create_task')
+@patch('main.get_question_from_message_async', new_callable=AsyncMock)
+@patch('main.process_user_task', new_callable=AsyncMock)
 @patch('main.DEBUG', False)
-async def test_handle_message(mock_create_task, mock_process_task, mock_get_question):
+async def test_handle_message(mock_process_task, mock_get_question):
     # Setup user_session mock
     mock_session = MagicMock()
     mock_cl.user_session = mock_session
-    
+
     message = MagicMock()
-    mock_agent = MagicMock()
-    mock_history = []
-    
-    def get_side_effect(key):
-        if key == "agent": return mock_agent
-        if key == "message_history": return mock_history
-        return None
-        
-    mock_session.get.side_effect = get_side_effect
-    
     mock_get_question.return_value = "test question"
-    
-    # Mock the task to be awaitable
-    # Use a Future which is awaitable
-    loop = asyncio.get_running_loop()
-    mock_task = loop.create_future()
-    mock_task.set_result(None)
-    
-    mock_create_task.return_value = mock_task
-    
+
     await handle_message(message)
-    
-    print(f"Process task calls: {mock_process_task.call_args_list}")
-    print(f"Session get agent: {mock_session.get('agent')}")
-    
-    mock_create_task.assert_called_once()
-    mock_process_task.assert_called_once_with(question="test question", debug=False)
-    mock_session.set.assert_any_call("task", mock_task)
+
+    mock_get_question.assert_awaited_once_with(message)
+    mock_process_task.assert_awaited_once_with(question="test question", debug=False)
+    task = mock_session.set.call_args.args[1]
+    assert mock_session.set.call_args.args[0] == "task" and task.done()
+
+@pytest.mark.asyncio
+@patch('main.get_question_from_message_async')
+@patch('main.process_user_task', new_callable=AsyncMock)
+async def test_handle_message_cancels_ingestion(mock_process_task, mock_get_question):
+    mock_session = MagicMock()
+    mock_cl.user_session = mock_session
+    ingesting, cancelled = asyncio.Event(), []
+
+    async def ingest(message):
+        ingesting.set()
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(message)
+            raise
+
+    mock_get_question.side_effect = ingest
+    message = MagicMock()
+
+    handler = asyncio.create_task(handle_message(message))
+    await ingesting.wait()
+    # Stop button or end of the chat
+    mock_session.set.call_args.args[1].cancel()
+    await handler
+
+    assert cancelled == [message]
+    mock_process_task.assert_not_called()
+
+@pytest.mark.asyncio
+@patch('main.get_question_from_message_async', new_callable=AsyncMock)
+@patch('main.process_user_task')
+async def test_handle_message_session_limit(mock_process_task, mock_get_question):
+    mock_get_question.side_effect = SessionLimitError("too many documents")
+    mock_message = AsyncMock()
+    mock_cl.Message = MagicMock(return_value=mock_message)
+
+    await handle_message(MagicMock())
+
+    mock_process_task.assert_not_called()
+    assert "too many documents" in mock_cl.Message.call_args.kwargs["content"]
+    mock_message.send.assert_awaited_once()
+
+@pytest.mark.asyncio
+@patch('main.warm_up')
+async def test_on_app_startup_warm_up(mock_warm_up):
+    with patch('main.WARMUP', False):
+        await on_app_startup()
+    mock_warm_up.assert_not_called()
+
+    with patch('main.WARMUP', True):
+        await on_app_startup()
+    mock_warm_up.assert_called_once()
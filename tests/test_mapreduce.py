@@ -0,0 +1,119 @@
+import sys
+import os
+import asyncio
+from contextlib import asynccontextmanager
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.admission import AdmissionScheduler
+from modules.mapreduce import (
+    NO_RELEVANT_INFORMATION, get_chunks, get_question_text, is_splittable, map_reduce, reduce_notes, split_text)
+from modules.prompts import MAP_SYSTEM_PROMPT, REDUCE_SYSTEM_PROMPT
+
+class FakeAgent:
+    running = 0
+    max_running = 0
+    prompts = []
+
+    def __init__(self, system_prompt, **kwargs):
+        self.system_prompt = system_prompt
+
+    async def invoke_async(self, prompt):
+        FakeAgent.prompts.append((self.system_prompt, prompt))
+        FakeAgent.running += 1
+        FakeAgent.max_running = max(FakeAgent.max_running, FakeAgent.running)
+        await asyncio.sleep(0.01)
+        FakeAgent.running -= 1
+        if self.system_prompt == MAP_SYSTEM_PROMPT and "needle" not in prompt:
+            return NO_RELEVANT_INFORMATION
+        return "found the needle"
+
+    async def stream_async(self, prompt):
+        FakeAgent.prompts.append((self.system_prompt, prompt))
+        for token in ["The ", "answer"]:
+            yield {"data": token}
+        yield {"message": {"role": "assistant", "content": [{"text": "The answer"}]}}
+
+@pytest.fixture(autouse=True)
+def reset_fake_agent():
+    FakeAgent.running = 0
+    FakeAgent.max_running = 0
+    FakeAgent.prompts = []
+
+def document(name, text, fmt="txt"):
+    return {"document": {"name": name, "format": fmt, "source": {"bytes": text.encode()}}}
+
+def test_is_splittable():
+    assert is_splittable([document("a", "text"), {"text": "question"}])
+    assert not is_splittable([{"document": {"name": "a", "format": "pdf", "source": {"bytes": b""}}}])
+    assert not is_splittable([{"text": "question"}])
+    assert not is_splittable("question")
+
+def test_split_text_respects_boundaries():
+    text = "first paragraph\n\nsecond paragraph\n\n" + "x" * 25
+    chunks = split_text(text, max_chars=20)
+    assert chunks[0] == "first paragraph\n\n"
+    assert chunks[1] == "second paragraph\n\n"
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks) == text
+
+def test_split_text_repeats_table_header():
+    text = "| a | b |\n|---|---|\n" + "".join(f"| {i} | {i} |\n" for i in range(20))
+    question = [document("table", text, fmt="md")]
+    chunks = get_chunks(question, chunk_tokens=20)
+    assert len(chunks) > 1
+    assert all(chunk.text.startswith("| a | b |\n|---|---|\n") for chunk in chunks)
+    assert chunks[-1].index == chunks[-1].total - 1
+
+def test_get_question_text():
+    assert get_question_text([document("a", "x"), {"text": "What?"}]) == "What?"
+
+@pytest.mark.asyncio
+async def test_map_reduce_caps_concurrency_and_streams_answer():
+    text = "\n\n".join(f"paragraph {i} " + "lorem " * 30 for i in range(40)) + "\n\nthe needle is here"
+    question = [document("report", text), {"text": "Where is the needle?"}]
+    progress = []
+
+    async def on_progress(done, total):
+        progress.append((done, total))
+
+    events = [e async for e in map_reduce(
+        question, agent_factory=FakeAgent, chunk_tokens=100, max_concurrency=3, on_progress=on_progress)]
+
+    assert [e["data"] for e in events if "data" in e] == ["The ", "answer"]
+    assert FakeAgent.max_running == 3
+    assert progress[-1][0] == progress[-1][1] > 3
+    system_prompt, reduce_prompt = FakeAgent.prompts[-1]
+    assert system_prompt == REDUCE_SYSTEM_PROMPT
+    assert "found the needle" in reduce_prompt
+    assert NO_RELEVANT_INFORMATION not in reduce_prompt
+
+@pytest.mark.asyncio
+async def test_map_reduce_admits_every_sub_agent():
+    text = "\n\n".join(f"paragraph {i} " + "lorem " * 30 for i in range(40)) + "\n\nthe needle is here"
+    question = [document("report", text), {"text": "Where is the needle?"}]
+    scheduler = AdmissionScheduler(max_streams=2, max_bytes=1024 * 1024)
+    sizes = []
+
+    @asynccontextmanager
+    async def admit(size):
+        async with scheduler.admit("user", size):
+            sizes.append(size)
+            yield
+
+    events = [e async for e in map_reduce(
+        question, agent_factory=FakeAgent, chunk_tokens=100, max_concurrency=3, admit=admit)]
+
+    assert events[-1]["message"]["content"] == [{"text": "The answer"}]
+    # The worker streams bound the fan-out below max_concurrency
+    assert FakeAgent.max_running == 2
+    assert len(sizes) == len(FakeAgent.prompts) and all(size > 0 for size in sizes)
+    assert scheduler.stats()["active"] == 0
+
+@pytest.mark.asyncio
+async def test_reduce_notes_until_they_fit():
+    notes = [f"note {i} " + "detail " * 40 for i in range(10)]
+    reduced = await reduce_notes("question", notes, FakeAgent, chunk_tokens=200, max_concurrency=2)
+    assert len(reduced) < len(notes)
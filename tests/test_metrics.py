@@ -0,0 +1,47 @@
+import sys
+import os
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.metrics import Histogram, MetricsRegistry
+
+def test_histogram_buckets():
+    histogram = Histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value)
+
+    assert histogram.snapshot() == {"count": 4, "sum": 3.65, "counts": [2, 1, 1]}
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+def test_histogram_labels_and_time():
+    histogram = Histogram("tool_seconds", "Tools", buckets=(1,), labels=("tool",))
+    with histogram.time(tool="calculator"):
+        pass
+    histogram.observe(2, tool='we"ather')
+
+    assert histogram.snapshot(tool="calculator")["count"] == 1
+    assert histogram.snapshot(tool="think")["count"] == 0
+    assert 'tool_seconds_count{tool="calculator"} 1' in histogram.render()
+    assert 'tool_seconds_bucket{tool="we\\"ather",le="+Inf"} 1' in histogram.render()
+
+def test_registry_render():
+    registry = MetricsRegistry(prefix="app")
+    registry.histogram("turn_seconds", "Turns", buckets=(1,)).observe(0.5)
+    registry.add_stats("cache", lambda: {"hits": 3, "hit_ratio": 0.75, "enabled": True, "name": "lru"})
+
+    text = registry.render()
+
+    assert 'app_turn_seconds_bucket{le="1"} 1' in text
+    assert "app_cache_hits 3\n" in text
+    assert "app_cache_hit_ratio 0.75\n" in text
+    assert "enabled" not in text and "lru" not in text
+    assert text.endswith("\n")
@@ -0,0 +1,176 @@
+import sys
+import os
+import re
+import zlib
+from unittest.mock import MagicMock, patch
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.cache import DocumentCache
+from modules.ingestion import get_question_from_message_async
+from modules.pdf import PdfDocument, PdfError, build_pdf_preview
+from modules.store import DocumentStore, read_source
+from tools.documents.tools import read_pages
+
+def make_pdf(pages, outline=(), compressed=False, trailer=b""):
+    """
+    One line of text per page, fonts and media box inherited from the page tree, an outline of (title, page).
+    compressed puts the objects in an object stream indexed by a PNG predicted xref stream, like most writers.
+    """
+    objects = {3: b"<</Type /Font /Subtype /Type1 /BaseFont /Helvetica>>"}
+    page_numbers, number = [], 4
+    for i in range(pages):
+        content = zlib.compress(f"BT /F1 24 Tf 72 720 Td (Page {i + 1}) Tj ET".encode())
+        objects[number] = b"<</Length %d /Filter /FlateDecode>>\nstream\n%s\nendstream" % (len(content), content)
+        objects[number + 1] = b"<</Type /Page /Parent 2 0 R /Contents %d 0 R>>" % number
+        page_numbers.append(number + 1)
+        number += 2
+    objects[2] = (b"<</Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 612 792] /Resources <</Font <</F1 3 0 R>>>>>>"
+                  % (b" ".join(b"%d 0 R" % n for n in page_numbers), pages))
+    objects[1] = b"<</Type /Catalog /Pages 2 0 R"
+    if outline:
+        items = list(range(number + 1, number + 1 + len(outline)))
+        for k, (title, page) in enumerate(outline):
+            following = b" /Next %d 0 R" % items[k + 1] if k + 1 < len(items) else b""
+            objects[items[k]] = b"<</Title (%s) /Parent %d 0 R /Dest [%d 0 R /Fit]%s>>" % (
+                title.encode(), number, page_numbers[page], following)
+        objects[number] = b"<</Type /Outlines /First %d 0 R /Last %d 0 R>>" % (items[0], items[-1])
+        objects[1] += b" /Outlines %d 0 R" % number
+    objects[1] += b">>"
+
+    out, offsets = bytearray(b"%PDF-1.5\n"), {}
+    inside = [n for n in sorted(objects) if b"stream" not in objects[n]] if compressed else []
+    container = max(objects) + 1
+    if inside:
+        header = b" ".join(b"%d %d" % (n, sum(len(objects[m]) + 1 for m in inside[:k])) for k, n in enumerate(inside))
+        data = zlib.compress(header + b"\n" + b"".join(objects.pop(n) + b"\n" for n in inside))
+        objects[container] = (b"<</Type /ObjStm /N %d /First %d /Length %d /Filter /FlateDecode>>\nstream\n%s\nendstream"
+                              % (len(inside), len(header) + 1, len(data), data))
+    for n in sorted(objects):
+        offsets[n] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (n, objects[n])
+
+    size = container + 2
+    if not compressed:
+        xref = len(out)
+        out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+        out += b"".join(b"%010d 00000 n \n" % offsets[n] if n in offsets else b"0000000000 65535 f \n"
+                        for n in range(1, size))
+        out += b"trailer\n<</Size %d /Root 1 0 R%s>>\nstartxref\n%d\n%%%%EOF\n" % (size, trailer, xref)
+        return bytes(out)
+
+    offsets[container + 1] = len(out)
+    rows = [bytes([2]) + container.to_bytes(4, "big") + inside.index(n).to_bytes(2, "big") if n in inside else
+            bytes([1]) + offsets[n].to_bytes(4, "big") + bytes(2) if n in offsets else bytes(5) + b"\xff\xff"
+            for n in range(size)]
+    predicted = b"".join(b"\x02" + bytes((a - b) & 0xFF for a, b in zip(row, previous))
+                         for row, previous in zip(rows, [bytes(7)] + rows))
+    data = zlib.compress(predicted)
+    out += (b"%d 0 obj\n<</Type /XRef /Size %d /W [1 4 2] /Root 1 0 R /Length %d /Filter /FlateDecode "
+            b"/DecodeParms <</Columns 7 /Predictor 12>>%s>>\nstream\n%s\nendstream\nendobj\n"
+            % (container + 1, size, len(data), trailer, data))
+    out += b"startxref\n%d\n%%%%EOF\n" % offsets[container + 1]
+    return bytes(out)
+
+def get_page_text(document, index):
+    return document.reader.pages[index].extract_text()
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_load_pages_and_outline(compressed):
+    document = PdfDocument.load(make_pdf(30, outline=[("Intro", 0), ("Results (final)", 19)], compressed=compressed))
+
+    assert document.page_count == 30
+    assert [(entry.title, entry.level, entry.page) for entry in document.outline] == [
+        ("Intro", 0, 0), ("Results (final)", 0, 19)]
+    assert get_page_text(document, 19) == "Page 20"
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_load_recovers_from_a_broken_xref(compressed):
+    data = make_pdf(12, outline=[("Intro", 0)], compressed=compressed)
+    data = re.sub(rb"startxref\n\d+", b"startxref\n99999999", data)
+
+    document = PdfDocument.load(data)
+
+    assert document.page_count == 12 and document.outline[0].page == 0
+
+def test_load_rejects_encrypted_and_invalid_documents():
+    with pytest.raises(PdfError):
+        PdfDocument.load(make_pdf(2, trailer=b" /Encrypt <</Filter /Standard>>"))
+    with pytest.raises(PdfError):
+        PdfDocument.load(b"not a pdf")
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_write_pages_is_a_standalone_pdf(compressed):
+    document = PdfDocument.load(make_pdf(30, outline=[("Results", 19)], compressed=compressed))
+
+    pages = PdfDocument.load(document.write_pages(20, 22))
+
+    assert pages.page_count == 3
+    assert [get_page_text(pages, i) for i in range(3)] == ["Page 20", "Page 21", "Page 22"]
+    # Inherited from the page tree of the whole document
+    page = pages.reader.pages[0]
+    assert list(page.mediabox) == [0, 0, 612, 792]
+    assert page["/Resources"]["/Font"]["/F1"]["/BaseFont"] == "/Helvetica"
+    assert pages.outline == []
+
+def test_open_maps_the_file(tmp_path):
+    path = tmp_path / "report.pdf"
+    path.write_bytes(make_pdf(30, outline=[("Results", 19)]))
+
+    document = PdfDocument.open(path)
+    pages = PdfDocument.load(document.write_pages(20, 20))
+    document.close()
+
+    assert get_page_text(pages, 0) == "Page 20"
+    assert document._file.closed
+    (tmp_path / "empty.pdf").write_bytes(b"")
+    with pytest.raises(PdfError):
+        PdfDocument.open(tmp_path / "empty.pdf")
+
+def test_preview_size_does_not_grow_with_the_document():
+    short, long = make_pdf(60), make_pdf(600)
+
+    assert build_pdf_preview(make_pdf(40), min_pages=50, preview_pages=10) is None
+    previews = [build_pdf_preview(data, min_pages=50, preview_pages=10) for data in (short, long)]
+
+    assert [PdfDocument.load(preview).page_count for preview in previews] == [10, 10]
+    assert len(previews[0]) == len(previews[1]) < len(short) / 4
+
+@pytest.mark.asyncio
+@patch('tools.documents.tools.cl.user_session')
+@patch('modules.ingestion.cl.user_session')
+@patch('modules.cl.extraction_executor', None)
+@patch('modules.cl.document_cache', DocumentCache(max_bytes=1024 * 1024))
+@patch('tools.documents.tools.PDF_READ_MAX_PAGES', 5)
+async def test_long_pdf_is_sent_as_a_preview_read_by_the_tool(mock_session, mock_tool_session, tmp_path):
+    session = {}
+    for mock in (mock_session, mock_tool_session):
+        mock.get.side_effect = session.get
+        mock.set.side_effect = session.__setitem__
+    (tmp_path / "upload").mkdir()
+    file = tmp_path / "upload" / "book.pdf"
+    file.write_bytes(make_pdf(120, outline=[("Intro", 0), ("Appendix", 99)], compressed=True))
+    element = MagicMock(type="file", mime="application/pdf", path=str(file))
+    element.name = "book.pdf"
+    message = MagicMock(elements=[element], content="What is in the appendix?")
+
+    with patch('modules.cl.document_store', DocumentStore(root=tmp_path / "store", max_bytes=1024 * 1024)):
+        question = await get_question_from_message_async(message)
+
+    preview = PdfDocument.load(bytes(read_source(question[0]["document"]["source"]["bytes"])))
+    assert preview.page_count == 10
+    assert question[1]["text"].startswith("The document book pdf has 120 pages: only pages 1 to 10 are attached")
+    assert "- Appendix (page 100)" in question[1]["text"]
+    assert question[2] == {"text": "What is in the appendix?"}
+
+    result = read_pages(document="book pdf", start=100, end=120)
+    assert result["content"][0] == {"text": "Pages 100 to 104 of the 120 pages of book pdf"}
+    pages = PdfDocument.load(result["content"][1]["document"]["source"]["bytes"])
+    assert get_page_text(pages, 0) == "Page 100" and pages.page_count == 5
+
+    assert read_pages(document="book pdf", start=130, end=140).startswith("Invalid page range")
+    assert read_pages(document="other", start=1, end=2) == (
+        "Unknown document other. The documents with pages to read are: book pdf.")
+    session["pdf_documents"]["book pdf"].close()
@@ -0,0 +1,125 @@
+import sys
+import os
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from strands import Agent
+from strands.models import Model
+
+from modules.prompt_cache import (
+    CACHE_POINT, PromptCacheHooks, PromptCacheStats, get_cache_point_positions, get_system_prompt_blocks,
+    place_cache_points)
+
+def document(name):
+    return {"document": {"name": name, "format": "txt", "source": {"bytes": b"text"}}}
+
+class StubModel(Model):
+    """Answers "ok" and reports the given cache usage, recording the requests it receives."""
+
+    def __init__(self, cache_read=0, cache_write=0):
+        self.cache_read = cache_read
+        self.cache_write = cache_write
+        self.requests = []
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {"model_id": "stub"}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.requests.append({
+            "messages": [dict(message, content=list(message["content"])) for message in messages],
+            "system_prompt_content": kwargs.get("system_prompt_content"),
+        })
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"contentBlockDelta": {"delta": {"text": "ok"}}}
+        yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {
+            "usage": {"inputTokens": 10, "outputTokens": 1, "totalTokens": 11,
+                      "cacheReadInputTokens": self.cache_read, "cacheWriteInputTokens": self.cache_write},
+            "metrics": {"latencyMs": 1}}}
+
+def test_positions_tail_and_documents():
+    messages = [
+        {"role": "user", "content": [document("a"), {"text": "question"}]},
+        {"role": "assistant", "content": [{"text": "answer"}]},
+        {"role": "user", "content": [document("b"), document("c"), {"text": "question"}]},
+    ]
+
+    assert get_cache_point_positions(messages, 3) == [(0, 1), (2, 2), (2, 3)]
+    assert get_cache_point_positions(messages, 2) == [(2, 2), (2, 3)]
+    assert get_cache_point_positions(messages, 1) == [(2, 3)]
+    assert get_cache_point_positions(messages, 0) == []
+    assert get_cache_point_positions([], 3) == []
+
+def test_place_cache_points_moves_existing_points():
+    question = [document("a"), {"text": "question"}]
+    messages = [{"role": "user", "content": question}]
+
+    assert place_cache_points(messages, 3) == 2
+    assert messages[0]["content"] == [document("a"), CACHE_POINT, {"text": "question"}, CACHE_POINT]
+    # The original content list, shared with the chat history, is left untouched
+    assert question == [document("a"), {"text": "question"}]
+
+    messages += [{"role": "assistant", "content": [{"text": "answer"}]}, {"role": "user", "content": [{"text": "more"}]}]
+    place_cache_points(messages, 3)
+
+    assert messages[0]["content"] == [document("a"), CACHE_POINT, {"text": "question"}]
+    assert messages[1]["content"] == [{"text": "answer"}]
+    assert messages[2]["content"] == [{"text": "more"}, CACHE_POINT]
+
+def test_place_cache_points_without_budget_removes_points():
+    messages = [{"role": "user", "content": [{"text": "question"}, CACHE_POINT]}]
+
+    assert place_cache_points(messages, 0) == 0
+    assert messages[0]["content"] == [{"text": "question"}]
+
+def test_prompt_cache_stats():
+    stats = PromptCacheStats()
+    stats.record(input_tokens=100, cache_read_tokens=300, cache_write_tokens=0)
+    stats.record(input_tokens=50, cache_read_tokens=0, cache_write_tokens=50)
+
+    assert stats.stats() == {
+        "invocations": 2,
+        "input_tokens": 150,
+        "cache_read_tokens": 300,
+        "cache_write_tokens": 50,
+        "hit_ratio": 0.6,
+    }
+    stats.clear()
+    assert stats.stats()["hit_ratio"] == 0.0
+
+@pytest.mark.asyncio
+async def test_hooks_with_stubbed_model():
+    model = StubModel(cache_read=200, cache_write=20)
+    stats = PromptCacheStats()
+    agent = Agent(
+        model=model,
+        system_prompt=get_system_prompt_blocks("system"),
+        hooks=[PromptCacheHooks(max_points=3, stats=stats)],
+        callback_handler=None)
+
+    await agent.invoke_async([document("a"), {"text": "question"}])
+    await agent.invoke_async("follow up")
+
+    assert model.requests[0]["system_prompt_content"] == [{"text": "system"}, CACHE_POINT]
+    assert model.requests[0]["messages"][0]["content"] == [
+        document("a"), CACHE_POINT, {"text": "question"}, CACHE_POINT]
+    second = model.requests[1]["messages"]
+    assert second[0]["content"] == [document("a"), CACHE_POINT, {"text": "question"}]
+    assert second[-1]["content"] == [{"text": "follow up"}, CACHE_POINT]
+    assert stats.stats() == {
+        "invocations": 2,
+        "input_tokens": 20,
+        "cache_read_tokens": 400,
+        "cache_write_tokens": 40,
+        "hit_ratio": 400 / 460,
+    }
@@ -0,0 +1,166 @@
+import sys
+import os
+import asyncio
+import time
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from botocore.exceptions import ClientError, ReadTimeoutError
+from strands.models import Model
+from strands.types.exceptions import ModelThrottledException
+
+from modules.ratelimit import AdaptiveRateLimiter, RateLimitedModel
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FakeBedrockModel(Model):
+    """Throttles the first requests and delays the first event of the slow ones, like a busy Bedrock."""
+
+    def __init__(self, throttles=0, slow_starts=(), slow_start=1.0, errors=()):
+        self.throttles = throttles
+        self.errors = list(errors)
+        self.slow_starts = set(slow_starts)
+        self.slow_start = slow_start
+        self.calls = 0
+        self.cancelled = 0
+        self.closed = 0
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {"model_id": "fake"}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.calls += 1
+        call = self.calls
+        if call <= self.throttles:
+            raise ModelThrottledException("Too many requests")
+        if self.errors:
+            raise self.errors.pop(0)
+        try:
+            if call in self.slow_starts:
+                await asyncio.sleep(self.slow_start)
+            yield {"messageStart": {"role": "assistant"}}
+            yield {"contentBlockDelta": {"delta": {"text": f"answer {call}"}}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.closed += 1
+
+async def collect(model):
+    return [event async for event in model.stream([{"role": "user", "content": [{"text": "hi"}]}])]
+
+def make_limiter(**kwargs):
+    return AdaptiveRateLimiter(**{"max_rate": 100, "min_rate": 1, "burst": 100, **kwargs})
+
+def test_limiter_shrinks_on_throttle_and_recovers():
+    clock = FakeClock()
+    limiter = AdaptiveRateLimiter(max_rate=10, min_rate=1, burst=5, increase=1, cooldown=1, clock=clock)
+
+    assert all(limiter.try_acquire() for _ in range(5))
+    assert not limiter.try_acquire()
+
+    limiter.on_throttle()
+    limiter.on_throttle()
+    # The throttles of one burst count once
+    assert limiter.rate == 5 and limiter.stats()["throttles"] == 2 and limiter.stats()["decreases"] == 1
+
+    clock.now = 2
+    limiter.on_throttle()
+    clock.now = 4
+    limiter.on_throttle()
+    limiter.on_throttle()
+    assert limiter.rate == 1.25
+
+    clock.now = 4.5
+    assert not limiter.try_acquire()
+    clock.now = 5
+    assert limiter.try_acquire()
+
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.rate == 10
+
+@pytest.mark.asyncio
+async def test_limiter_paces_requests():
+    limiter = AdaptiveRateLimiter(max_rate=50, min_rate=1, burst=1)
+    started = time.perf_counter()
+    for _ in range(6):
+        await limiter.acquire()
+
+    assert time.perf_counter() - started >= 0.09
+    assert limiter.stats()["waits"] >= 5
+
+@pytest.mark.asyncio
+async def test_throttled_requests_are_retried_through_the_limiter():
+    limiter = make_limiter()
+    model = RateLimitedModel(FakeBedrockModel(throttles=2), limiter=limiter, max_attempts=3, hedge_after=0)
+
+    events = await collect(model)
+
+    assert events[1] == {"contentBlockDelta": {"delta": {"text": "answer 3"}}}
+    assert limiter.stats()["throttles"] == 2 and limiter.rate < 100
+
+    failing = RateLimitedModel(FakeBedrockModel(throttles=5), limiter=make_limiter(), max_attempts=3, hedge_after=0)
+    with pytest.raises(ModelThrottledException):
+        await collect(failing)
+    assert failing.model.calls == 3
+
+def bedrock_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "ConverseStream")
+
+@pytest.mark.asyncio
+async def test_transient_errors_are_retried_with_backoff():
+    errors = [bedrock_error("ServiceUnavailableException"), ReadTimeoutError(endpoint_url="https://bedrock")]
+    limiter = make_limiter()
+    model = RateLimitedModel(FakeBedrockModel(errors=errors), limiter=limiter, hedge_after=0, retry_delay=0.01)
+
+    events = await collect(model)
+
+    assert events[1] == {"contentBlockDelta": {"delta": {"text": "answer 3"}}}
+    # Server errors do not slow the worker down like throttles
+    assert limiter.stats()["throttles"] == 0 and limiter.rate == 100
+
+    invalid = RateLimitedModel(FakeBedrockModel(errors=[bedrock_error("ValidationException")]),
+                               limiter=make_limiter(), hedge_after=0, retry_delay=0.01)
+    with pytest.raises(ClientError):
+        await collect(invalid)
+    assert invalid.model.calls == 1
+
+@pytest.mark.asyncio
+async def test_slow_start_is_hedged():
+    fake = FakeBedrockModel(slow_starts={1}, slow_start=5)
+    model = RateLimitedModel(fake, limiter=make_limiter(), hedge_after=0.05)
+
+    started = time.perf_counter()
+    events = await collect(model)
+
+    assert time.perf_counter() - started < 1
+    assert events[1] == {"contentBlockDelta": {"delta": {"text": "answer 2"}}}
+    assert (model.limiter.hedges, model.limiter.hedge_wins) == (1, 1)
+    # The losing request is closed right away, not when it is garbage collected
+    assert fake.cancelled == 1 and fake.closed == 2
+
+@pytest.mark.asyncio
+async def test_hedge_needs_a_spare_token():
+    limiter = make_limiter(max_rate=1, burst=1)
+    model = RateLimitedModel(FakeBedrockModel(slow_starts={1}, slow_start=0.2), limiter=limiter, hedge_after=0.05)
+
+    events = await collect(model)
+
+    assert events[1] == {"contentBlockDelta": {"delta": {"text": "answer 1"}}}
+    assert limiter.hedges == 0
@@ -0,0 +1,136 @@
+import sys
+import os
+import time
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pydantic import BaseModel
+from strands import Agent, tool
+from strands.models import Model
+
+from modules.replay import (
+    Cassette, RecordingModel, RecordingNotFoundError, ReplayModel, ToolRecordingHooks, ToolReplayHooks,
+    get_request_key)
+
+class StubModel(Model):
+    """Asks for the lookup tool on the first call, then answers with the text of the tool result."""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def update_config(self, **model_config):
+        pass
+
+    def get_config(self):
+        return {"model_id": "stub"}
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        self.calls += 1
+        yield {"messageStart": {"role": "assistant"}}
+        yield {"output": output_model(city="Paris", forecast=f"Sunny ({self.calls})")}
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        self.calls += 1
+        time.sleep(self.delay)
+        yield {"messageStart": {"role": "assistant"}}
+        last = messages[-1]["content"][0]
+        if "toolResult" in last:
+            yield {"contentBlockDelta": {"delta": {"text": last["toolResult"]["content"][0]["text"]}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+        else:
+            yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": f"t{self.calls}", "name": "lookup"}}}}
+            yield {"contentBlockDelta": {"delta": {"toolUse": {"input": '{"city": "Paris"}'}}}}
+            yield {"contentBlockStop": {}}
+            yield {"messageStop": {"stopReason": "tool_use"}}
+        yield {"metadata": {"usage": {"inputTokens": 10, "outputTokens": 2, "totalTokens": 12},
+                            "metrics": {"latencyMs": 1}}}
+
+class Weather(BaseModel):
+    city: str
+    forecast: str
+
+lookups = []
+
+@tool
+def lookup(city: str) -> str:
+    """Looks up the weather of a city."""
+    lookups.append(city)
+    return f"Sunny in {city} ({len(lookups)})"
+
+def get_text(result):
+    return "".join(block.get("text", "") for block in result.message["content"])
+
+@pytest.fixture
+def cassette(tmp_path):
+    return Cassette(tmp_path / "recordings.jsonl.gz")
+
+def test_request_key_ignores_bytes_and_cache_points():
+    document = {"document": {"name": "a", "format": "txt", "source": {"bytes": b"text"}}}
+    messages = [{"role": "user", "content": [document, {"text": "question"}]}]
+    cached = [{"role": "user", "content": [document, {"cachePoint": {"type": "default"}}, {"text": "question"}]}]
+    other = [{"role": "user", "content": [document, {"text": "other"}]}]
+
+    assert get_request_key("system", [], messages) == get_request_key("system", [], cached)
+    assert get_request_key("system", [], messages) != get_request_key("system", [], other)
+    assert get_request_key("system", [], messages) != get_request_key("prompt", [], messages)
+
+def test_record_and_replay_tool_turn(cassette):
+    lookups.clear()
+    recorded = Agent(model=RecordingModel(StubModel(), cassette), system_prompt="system", tools=[lookup],
+                     hooks=[ToolRecordingHooks(cassette, tools=["lookup"])], callback_handler=None)
+    assert get_text(recorded("Weather in Paris?")) == "Sunny in Paris (1)"
+
+    replayed = Agent(model=ReplayModel(Cassette(cassette.path), model_id="stub", speed=0), system_prompt="system",
+                     tools=[lookup], hooks=[ToolReplayHooks(Cassette(cassette.path), tools=["lookup"])],
+                     callback_handler=None)
+    assert get_text(replayed("Weather in Paris?")) == "Sunny in Paris (1)"
+    # The tool result came from the recording
+    assert lookups == ["Paris"]
+    assert replayed.messages[1]["content"][0]["toolUse"]["name"] == "lookup"
+
+@pytest.mark.asyncio
+async def test_record_and_replay_structured_output(cassette):
+    async def get_output(model, system_prompt="system"):
+        prompt = [{"role": "user", "content": [{"text": "Weather in Paris?"}]}]
+        events = [event async for event in model.structured_output(Weather, prompt, system_prompt=system_prompt)]
+        return events[-1]["output"]
+
+    assert await get_output(RecordingModel(StubModel(), cassette)) == Weather(city="Paris", forecast="Sunny (1)")
+
+    model = ReplayModel(Cassette(cassette.path), model_id="stub", speed=0)
+    assert await get_output(model) == Weather(city="Paris", forecast="Sunny (1)")
+    assert model.cassette.stats()["hits"] == 1
+    with pytest.raises(RecordingNotFoundError):
+        await get_output(model, system_prompt="other")
+
+def test_replay_timing(cassette):
+    agent = Agent(model=RecordingModel(StubModel(delay=0.1), cassette), system_prompt="system",
+                  tools=[lookup], callback_handler=None)
+    agent("Weather in Paris?")
+
+    for speed, minimum, maximum in ((1, 0.2, 1.0), (0, 0, 0.1)):
+        agent = Agent(model=ReplayModel(Cassette(cassette.path), model_id="stub", speed=speed),
+                      system_prompt="system", tools=[lookup], callback_handler=None)
+        started = time.perf_counter()
+        agent("Weather in Paris?")
+        assert minimum <= time.perf_counter() - started < maximum
+
+@pytest.mark.asyncio
+async def test_replay_falls_back_to_order_of_the_agent(cassette):
+    cassette.append({"kind": "model", "key": "a", "group": "g", "events": [[0, {"first": 1}]]})
+    cassette.append({"kind": "model", "key": "b", "group": "g", "events": [[0, {"second": 2}]]})
+
+    assert cassette.find("model", "b", "g")["key"] == "b"
+    assert cassette.find("model", "b", "g")["key"] == "b"
+    assert cassette.find("model", "changed", "g")["key"] == "a"
+    assert cassette.find("model", "changed", "g") is None
+    assert cassette.stats() == {"entries": 2, "hits": 2, "fallbacks": 1, "misses": 1}
+
+    model = ReplayModel(Cassette(cassette.path), model_id="stub", speed=0)
+    with pytest.raises(RecordingNotFoundError):
+        async for _ in model.stream([{"role": "user", "content": [{"text": "hi"}]}], system_prompt="other"):
+            pass
@@ -0,0 +1,98 @@
+import sys
+import os
+import random
+import time
+from unittest.mock import patch
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.retrieval import BM25Index, format_results, get_passages, index_content_blocks, tokenize
+from tools.documents.tools import search_documents
+
+WORDS = ["revenue", "growth", "market", "customer", "product", "quarter", "region", "cost", "margin", "team",
+         "strategy", "risk", "supply", "chain", "forecast", "budget", "sales", "service", "contract", "policy"]
+
+def make_document(pages, words_per_page=500, seed=42):
+    rng = random.Random(seed)
+    return "\n\n".join(
+        f"Page {page}. " + " ".join(rng.choice(WORDS) for _ in range(words_per_page)) for page in range(pages))
+
+def test_tokenize():
+    assert tokenize("Revenue grew 12%, NOT costs!") == ["revenue", "grew", "12", "not", "costs"]
+
+def test_bm25_ranks_relevant_passage_first():
+    index = BM25Index()
+    index.add("report", [
+        "The weather was sunny all week.",
+        "Quarterly revenue grew in the northern region thanks to new customers.",
+        "Revenue is mentioned here once among many other unrelated words about gardening and cooking.",
+    ])
+
+    results = index.search("northern region revenue", top_k=2)
+
+    assert results[0][1].index == 1
+    assert results[0][0] > results[1][0]
+    assert index.search("unknownterm") == []
+
+def test_bm25_incremental_add():
+    index = BM25Index()
+    index.add("a", ["alpha beta"])
+    index.add("b", ["gamma delta"])
+
+    assert len(index) == 2
+    assert index.documents == {"a": 1, "b": 1}
+    assert index.search("gamma")[0][1].document == "b"
+
+def test_get_passages_splits_text():
+    passages = get_passages(make_document(10), "txt", passage_chars=1000)
+    assert len(passages) > 10
+    assert all(len(p) <= 1000 for p in passages)
+
+def test_index_content_blocks_only_text_documents():
+    index = BM25Index()
+    blocks = [
+        {"document": {"name": "notes", "format": "txt", "source": {"bytes": b"alpha beta\n\ngamma"}}},
+        {"document": {"name": "scan", "format": "pdf", "source": {"bytes": b"%PDF"}}},
+        {"text": "question"},
+    ]
+
+    assert index_content_blocks(index, blocks) == 1
+    assert index_content_blocks(index, blocks) == 0
+    assert list(index.documents) == ["notes"]
+
+def test_format_results():
+    index = BM25Index()
+    index.add("notes", ["alpha beta"])
+    assert format_results(index.search("alpha")).startswith("[notes, passage 1, score ")
+
+@patch('tools.documents.tools.cl.user_session')
+def test_search_documents_tool(mock_session):
+    index = BM25Index()
+    index.add("contract", ["The termination clause requires 30 days notice.", "Payment is due monthly."])
+    mock_session.get.return_value = index
+
+    result = search_documents(query="termination notice")
+
+    assert "30 days notice" in result.splitlines()[1]
+
+@patch('tools.documents.tools.cl.user_session')
+def test_search_documents_tool_without_documents(mock_session):
+    mock_session.get.return_value = None
+    assert "No documents" in search_documents(query="anything")
+
+def test_bm25_on_large_document_is_fast():
+    text = make_document(pages=150)
+    index = BM25Index()
+
+    started = time.perf_counter()
+    index.add("large", get_passages(text, "txt"))
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(10):
+        index.search("supply chain risk forecast", top_k=5)
+    query_time = (time.perf_counter() - started) / 10
+
+    assert build_time < 2
+    assert query_time < 0.05
@@ -0,0 +1,112 @@
+import sys
+import os
+import mmap
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.store import DocumentRef, DocumentStore, read_source
+
+def test_put_and_read(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=1024)
+
+    ref = store.put("abcdef", "txt", b"hello")
+
+    assert ref == DocumentRef(path=tmp_path / "ab" / "abcdef.txt", size=5)
+    assert len(ref) == 5
+    assert ref.read() == b"hello"
+    with ref.open() as data:
+        assert isinstance(data, mmap.mmap)
+        assert data[:] == b"hello"
+    assert data.closed
+    assert store.get("abcdef", "txt") == ref
+    assert store.get("abcdef", "md") is None
+    assert read_source(ref)[:] == b"hello"
+    assert read_source(b"bytes") == b"bytes"
+
+def test_put_existing_document_is_not_written_again(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=1024)
+
+    store.put("abcdef", "txt", b"hello")
+    store.put("abcdef", "txt", b"hello")
+
+    assert store.stats() == {"size_bytes": 5, "max_bytes": 1024, "writes": 1, "evictions": 0}
+
+def test_empty_document(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=1024)
+
+    assert store.put("abcdef", "txt", b"").read() == b""
+
+def test_evicts_least_recently_read(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=25)
+    first = store.put("aa1", "txt", b"1" * 10)
+    second = store.put("aa2", "txt", b"2" * 10)
+    os.utime(first.path, (time.time() - 60, time.time() - 60))
+    os.utime(second.path, (time.time() - 30, time.time() - 30))
+    first.read()
+
+    third = store.put("aa3", "txt", b"3" * 10)
+
+    assert first.exists()
+    assert not second.exists()
+    assert third.exists()
+    assert store.stats()["evictions"] == 1
+    assert store.stats()["size_bytes"] == 20
+
+def test_evicts_documents_written_by_other_workers(tmp_path):
+    worker = DocumentStore(root=tmp_path, max_bytes=25)
+    other = DocumentStore(root=tmp_path, max_bytes=25)
+    first = worker.put("aa1", "txt", b"1" * 10)
+    os.utime(first.path, (time.time() - 60, time.time() - 60))
+    other.put("aa2", "txt", b"2" * 10)
+
+    worker.put("aa3", "txt", b"3" * 10)
+
+    assert not first.exists()
+    assert worker.stats()["size_bytes"] == 20
+
+def test_keeps_pinned_documents(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=25)
+    first = store.put("aa1", "txt", b"1" * 10)
+    second = store.put("aa2", "txt", b"2" * 10)
+    os.utime(first.path, (time.time() - 60, time.time() - 60))
+    os.utime(second.path, (time.time() - 30, time.time() - 30))
+    assert store.pin("session", [first])
+
+    store.put("aa3", "txt", b"3" * 10)
+
+    assert first.exists()
+    assert not second.exists()
+
+    store.unpin("session")
+    store.put("aa4", "txt", b"4" * 10)
+
+    assert not first.exists()
+    assert not store.pin("session", [second])
+
+def test_removes_pins_of_gone_workers(tmp_path):
+    ref = DocumentStore(root=tmp_path, max_bytes=1024).put("aa1", "txt", b"hello")
+    stale = tmp_path / ".pins" / "999999999"
+    stale.mkdir(parents=True)
+    os.link(ref.path, stale / ref.path.name)
+
+    DocumentStore(root=tmp_path, max_bytes=1024)
+
+    assert not stale.exists()
+    assert os.stat(ref.path).st_nlink == 1
+
+def test_keeps_document_bigger_than_the_store(tmp_path):
+    store = DocumentStore(root=tmp_path, max_bytes=5)
+
+    ref = store.put("aa1", "txt", b"x" * 10)
+
+    assert ref.exists()
+
+def test_scans_existing_documents(tmp_path):
+    DocumentStore(root=tmp_path, max_bytes=1024).put("abcdef", "txt", b"hello")
+
+    store = DocumentStore(root=tmp_path, max_bytes=1024)
+
+    assert store.stats()["size_bytes"] == 5
+    assert store.get("abcdef", "txt").read()[:] == b"hello"
@@ -0,0 +1,90 @@
+import sys
+import os
+import asyncio
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.streaming import TokenBuffer
+
+class Recorder:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, text):
+        self.sent.append(text)
+
+@pytest.mark.asyncio
+async def test_flushes_when_max_bytes_are_buffered():
+    recorder = Recorder()
+    buffer = TokenBuffer(recorder.send, interval=60, max_bytes=8)
+
+    for token in ["abc", "def", "ghi", "j"]:
+        await buffer.write(token)
+
+    assert recorder.sent == ["abcdefghi"]
+    await buffer.close()
+    assert recorder.sent == ["abcdefghi", "j"]
+
+@pytest.mark.asyncio
+async def test_flushes_after_interval():
+    recorder = Recorder()
+    async with TokenBuffer(recorder.send, interval=0.01, max_bytes=1024) as buffer:
+        await buffer.write("a")
+        await buffer.write("b")
+        assert recorder.sent == []
+        await asyncio.sleep(0.05)
+        assert recorder.sent == ["ab"]
+        await buffer.write("c")
+
+    assert recorder.sent == ["ab", "c"]
+
+@pytest.mark.asyncio
+async def test_zero_interval_sends_every_token():
+    recorder = Recorder()
+    async with TokenBuffer(recorder.send, interval=0) as buffer:
+        await buffer.write("a")
+        await buffer.write("")
+        await buffer.write("b")
+
+    assert recorder.sent == ["a", "b"]
+
+@pytest.mark.asyncio
+async def test_flush_on_exit_after_error():
+    recorder = Recorder()
+    with pytest.raises(RuntimeError):
+        async with TokenBuffer(recorder.send, interval=60) as buffer:
+            await buffer.write("partial")
+            raise RuntimeError()
+
+    assert recorder.sent == ["partial"]
+
+@pytest.mark.asyncio
+async def test_failed_timed_flush_is_raised():
+    async def send(text):
+        raise ConnectionError("disconnected")
+
+    buffer = TokenBuffer(send, interval=0.01, max_bytes=1024)
+    await buffer.write("a")
+    await asyncio.sleep(0.05)
+    with pytest.raises(ConnectionError):
+        await buffer.close()
+
+    buffer = TokenBuffer(send, interval=0.01, max_bytes=1024)
+    await buffer.write("a")
+    await asyncio.sleep(0.05)
+    with pytest.raises(ConnectionError):
+        await buffer.write("b")
+
+@pytest.mark.asyncio
+async def test_coalesces_many_tokens():
+    recorder = Recorder()
+    async with TokenBuffer(recorder.send, interval=60, max_bytes=256) as buffer:
+        for _ in range(1000):
+            await buffer.write("tok ")
+
+    assert "".join(recorder.sent) == "tok " * 1000
+    assert len(recorder.sent) == 16
+    assert buffer.writes == 1000
+    assert buffer.flushes == 16
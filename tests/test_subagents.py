@@ -0,0 +1,114 @@
+import sys
+import os
+import asyncio
+from unittest.mock import MagicMock, patch
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.cancellation import cancellation_stats
+from modules.subagents import SubAgentPool, close_session_pools, get_session_pool
+
+def make_factory():
+    created = []
+
+    def factory():
+        agent, resource = MagicMock(), MagicMock()
+        created.append((agent, resource))
+        return agent, [resource]
+
+    return factory, created
+
+@pytest.mark.asyncio
+async def test_pool_reuses_agent():
+    factory, created = make_factory()
+    pool = SubAgentPool("weather", factory, idle_timeout=60)
+
+    async with pool.acquire() as first:
+        pass
+    async with pool.acquire() as second:
+        pass
+
+    assert first is second
+    assert len(created) == 1
+    assert pool.reused == 1
+
+@pytest.mark.asyncio
+async def test_pool_creates_agent_per_concurrent_call():
+    factory, created = make_factory()
+    pool = SubAgentPool("weather", factory, idle_timeout=60)
+
+    async def call():
+        async with pool.acquire() as agent:
+            await asyncio.sleep(0.01)
+            return agent
+
+    first, second = await asyncio.gather(call(), call())
+
+    assert first is not second
+    assert len(pool) == 2
+
+@pytest.mark.asyncio
+async def test_pool_evicts_idle_agents():
+    factory, created = make_factory()
+    pool = SubAgentPool("weather", factory, idle_timeout=0)
+
+    async with pool.acquire():
+        pass
+    await asyncio.sleep(0.01)
+    async with pool.acquire():
+        pass
+
+    assert len(created) == 2
+    created[0][1].cleanup_platform.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_pool_discards_agent_on_error():
+    factory, created = make_factory()
+    pool = SubAgentPool("weather", factory, idle_timeout=60)
+
+    with pytest.raises(ValueError):
+        async with pool.acquire():
+            raise ValueError("boom")
+
+    assert len(pool) == 0
+    created[0][1].cleanup_platform.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_pool_releases_resources_of_cancelled_call():
+    factory, created = make_factory()
+    pool = SubAgentPool("weather", factory, idle_timeout=60)
+    released = cancellation_stats.stats()["resources"]
+
+    async def call():
+        async with pool.acquire():
+            await asyncio.sleep(60)
+
+    task = asyncio.create_task(call())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert len(pool) == 0
+    created[0][1].cleanup_platform.assert_called_once()
+    assert cancellation_stats.stats()["resources"] == released + 1
+
+@pytest.mark.asyncio
+@patch('modules.subagents.cl.user_session')
+async def test_session_pools_are_closed(mock_session):
+    store = {}
+    mock_session.get.side_effect = store.get
+    mock_session.set.side_effect = store.__setitem__
+    factory, created = make_factory()
+
+    pool = get_session_pool("weather", factory, idle_timeout=60)
+    assert get_session_pool("weather", factory, idle_timeout=60) is pool
+    async with pool.acquire():
+        pass
+
+    await close_session_pools()
+
+    created[0][1].cleanup_platform.assert_called_once()
+    assert store["sub_agent_pools"] == {}
@@ -0,0 +1,137 @@
+import sys
+import os
+import io
+import sqlite3
+import zipfile
+from unittest.mock import MagicMock, patch
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.cache import DocumentCache
+from modules.ingestion import get_question_from_message_async
+from modules.store import DocumentStore, read_source
+from modules.tables import TableCatalog, build_table_database, get_identifier
+from tools.documents.tools import query_tables
+
+SALES = b"Region,Product,Units,Price\nNorth,Widget,10,2.5\nSouth,Widget,,3\nNorth,Gadget,7,4.25\nEast,Gadget,3,1e1\n"
+
+def make_workbook(sheets):
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    files = {
+        "xl/workbook.xml": f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>' + "".join(
+            f'<sheet name="{name}" sheetId="{i}" r:id="rId{i}"/>' for i, name in enumerate(sheets, 1))
+            + '</sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">' + "".join(
+                f'<Relationship Id="rId{i}" Target="worksheets/sheet{i}.xml"/>' for i in range(1, len(sheets) + 1))
+            + '</Relationships>'),
+    }
+    for i, rows in enumerate(sheets.values(), 1):
+        files[f"xl/worksheets/sheet{i}.xml"] = f'<worksheet xmlns="{main}"><sheetData>' + "".join(
+            "<row>" + "".join(f'<c t="inlineStr"><is><t>{value}</t></is></c>' for value in row) + "</row>"
+            for row in rows) + "</sheetData></worksheet>"
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def make_catalog(tmp_path, fmt="csv", data=SALES, name="sales"):
+    database, description = build_table_database(fmt, data, name, sample_rows=2)
+    path = tmp_path / f"{name}.sqlite"
+    path.write_bytes(database)
+    catalog = TableCatalog()
+    catalog.add(path)
+    return catalog, description
+
+def test_get_identifier():
+    used = set()
+    assert get_identifier("Unit Price ($)", "column", used) == "unit_price"
+    assert get_identifier("unit price", "column", used) == "unit_price_2"
+    assert get_identifier("2024", "column", used) == "column_2024"
+    assert get_identifier("  ", "column_3", used) == "column_3"
+
+def test_build_table_database_types_and_description(tmp_path):
+    catalog, description = make_catalog(tmp_path)
+
+    assert "## Table sales (4 rows)" in description
+    assert "| units | INTEGER | Units |" in description and "| price | REAL | Price |" in description
+    assert "First 2 rows:" in description and "Gadget" not in description
+    assert "query_tables" in description
+
+    columns, rows, truncated = catalog.query(
+        "SELECT region, SUM(units), MAX(price) FROM sales GROUP BY region ORDER BY region", max_rows=10, timeout=1)
+    assert columns == ["region", "SUM(units)", "MAX(price)"]
+    assert rows == [("East", 3, 10.0), ("North", 17, 4.25), ("South", None, 3.0)]
+    assert not truncated
+
+def test_build_table_database_one_table_per_sheet(tmp_path):
+    workbook = make_workbook({"Q1": [["Item", "Total"], ["a", "1"]], "Q2": [["Item", "Total"]], "Empty": []})
+
+    catalog, description = make_catalog(tmp_path, "xlsx", workbook, "budget")
+
+    assert catalog.tables == {"budget_q1": 1, "budget_q2": 0}
+    assert "empty" not in description
+    assert build_table_database("csv", b"\n , \n", "blank", sample_rows=2) is None
+
+def test_catalog_queries_are_read_only_and_bounded(tmp_path):
+    catalog, _ = make_catalog(tmp_path)
+
+    for sql in ["DELETE FROM sales", "DROP TABLE sales", "ATTACH DATABASE ':memory:' AS other",
+                "PRAGMA table_info(sales)"]:
+        with pytest.raises(sqlite3.DatabaseError, match="not authorized"):
+            catalog.query(sql, max_rows=10, timeout=1)
+    assert catalog.query("SELECT COUNT(*) FROM sales", max_rows=10, timeout=1)[1] == [(4,)]
+
+    columns, rows, truncated = catalog.query("SELECT * FROM sales", max_rows=2, timeout=1)
+    assert len(rows) == 2 and truncated
+
+    with pytest.raises(sqlite3.OperationalError, match="interrupted"):
+        catalog.query("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT MAX(i) FROM n",
+                      max_rows=1, timeout=0.1)
+
+def test_catalog_add_replaces_tables(tmp_path):
+    catalog, _ = make_catalog(tmp_path)
+    database, _ = build_table_database("csv", b"Region,Units\nWest,1\n", "sales", sample_rows=2)
+    (tmp_path / "update.sqlite").write_bytes(database)
+
+    assert catalog.add(tmp_path / "update.sqlite") == ["sales"]
+    assert catalog.describe() == "sales (1 rows)"
+
+@pytest.mark.asyncio
+@patch('tools.documents.tools.cl.user_session')
+@patch('modules.ingestion.cl.user_session')
+@patch('modules.cl.extraction_executor', None)
+@patch('modules.cl.document_cache', DocumentCache(max_bytes=1024))
+async def test_uploaded_csv_is_queried_by_the_tool(mock_session, mock_tool_session, tmp_path):
+    session = {}
+    for mock in (mock_session, mock_tool_session):
+        mock.get.side_effect = session.get
+        mock.set.side_effect = session.__setitem__
+    (tmp_path / "upload").mkdir()
+    file = tmp_path / "upload" / "sales.csv"
+    file.write_bytes(SALES)
+    element = MagicMock(type="file", mime="text/csv", path=str(file))
+    element.name = "sales.csv"
+    message = MagicMock(elements=[element], content="Total units?")
+
+    with patch('modules.cl.document_store', DocumentStore(root=tmp_path / "store", max_bytes=1024 * 1024)):
+        question = await get_question_from_message_async(message)
+
+    document = question[0]["document"]
+    assert document["format"] == "md"
+    assert read_source(document["source"]["bytes"])[:].decode().startswith("# sales csv")
+    assert session["table_catalog"].tables == {"sales_csv": 4}
+
+    assert query_tables(sql="SELECT SUM(units) AS units FROM sales_csv") == "| units |\n|---|\n| 20 |"
+    assert "only the first 1 rows" in query_tables(sql="SELECT * FROM sales_csv", max_rows=1).lower()
+    assert query_tables(sql="SELECT * FROM missing").startswith(
+        "The query failed: no such table: missing. The tables are sales_csv (4 rows)")
+
+@patch('tools.documents.tools.cl.user_session')
+def test_query_tables_without_tables(mock_session):
+    mock_session.get.return_value = None
+    assert "No tables" in query_tables(sql="SELECT 1")
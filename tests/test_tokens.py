@@ -0,0 +1,130 @@
+import sys
+import os
+import io
+import re
+import time
+import zipfile
+from unittest.mock import MagicMock
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.extractors import extract_docx, extract_html, extract_xlsx
+from modules.tokens import (
+    count_pdf_pages, estimate_agent_request, estimate_content_tokens, estimate_document_tokens, estimate_request,
+    PDF_TOKENS_PER_PAGE)
+from settings import Models
+
+PARAGRAPH = ("The quarterly report shows that revenue in the northern region grew by 12% compared to last year, "
+             "while operating costs remained stable. Management expects similar results next quarter, "
+             "provided that supply chain disruptions do not return. ")
+
+def reference_tokens(text):
+    # Words, numbers and punctuation marks: a tokenizer independent approximation of BPE token counts.
+    return len(re.findall(r"\w+|[^\w\s]", text))
+
+def make_pdf(pages):
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", b"<< /Type /Pages /Count %d >>" % pages]
+    objects += [b"<< /Type /Page /Parent 2 0 R >>" for _ in range(pages)]
+    return b"%PDF-1.4\n" + b"".join(b"%d 0 obj\n%s\nendobj\n" % (i + 1, o) for i, o in enumerate(objects))
+
+def make_zip(files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def make_corpus():
+    text = PARAGRAPH * 200
+    rows = [["region", "month", "revenue", "cost"]] + [
+        [f"region {i % 7}", f"2024-{i % 12 + 1:02d}", str(1000 + i * 37), str(500 + i * 11)] for i in range(1500)]
+    csv_data = "\n".join(",".join(row) for row in rows)
+    html = "".join(
+        f"<div class='c{i}' style='margin:0'><script>track({i})</script><p>{PARAGRAPH}</p></div>" for i in range(100))
+    w = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    docx = make_zip({"word/document.xml": f'<w:document xmlns:w="{w}"><w:body>' + "".join(
+        f'<w:p><w:pPr><w:rPr><w:lang w:val="en-US"/></w:rPr></w:pPr><w:r><w:rPr><w:sz w:val="22"/></w:rPr>'
+        f'<w:t xml:space="preserve">{PARAGRAPH}</w:t></w:r></w:p>' for _ in range(150)) + '</w:body></w:document>'})
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    rel = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+    sheet_rows = "".join(
+        f'<row r="{r + 1}">' + "".join(
+            f'<c r="{chr(65 + c)}{r + 1}" t="inlineStr" s="3"><is><t>{value}</t></is></c>' for c, value in enumerate(row))
+        + '</row>' for r, row in enumerate(rows))
+    xlsx = make_zip({
+        "xl/workbook.xml": f'<workbook xmlns="{main}" xmlns:r="{rel}"><sheets>'
+                           f'<sheet name="Data" sheetId="1" r:id="rId1"/></sheets></workbook>',
+        "xl/_rels/workbook.xml.rels": '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                                      '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>',
+        "xl/worksheets/sheet1.xml": f'<worksheet xmlns="{main}"><sheetData>{sheet_rows}</sheetData></worksheet>',
+    })
+    return {
+        "txt": (text.encode(), text),
+        "md": (("# Report\n\n" + text).encode(), "# Report\n\n" + text),
+        "csv": (csv_data.encode(), csv_data),
+        "html": (html.encode(), extract_html(html.encode())),
+        "docx": (docx, extract_docx(docx)),
+        "xlsx": (xlsx, extract_xlsx(xlsx)),
+    }
+
+def test_estimate_document_tokens_corpus():
+    for fmt, (data, text) in make_corpus().items():
+        estimate = estimate_document_tokens(fmt, data)
+        reference = reference_tokens(text)
+        assert 0.5 * reference <= estimate <= 2 * reference, f"{fmt}: {estimate} vs {reference}"
+
+def test_count_pdf_pages():
+    assert count_pdf_pages(make_pdf(12)) == 12
+    assert estimate_document_tokens("pdf", make_pdf(12)) >= 12 * PDF_TOKENS_PER_PAGE
+
+def test_estimate_pdf_without_page_objects_uses_size():
+    assert estimate_document_tokens("pdf", b"%PDF-1.7" + b"x" * 20000) > 0
+
+def test_estimate_content_tokens():
+    content = [
+        {"document": {"format": "txt", "source": {"bytes": b"x" * 4000}}},
+        {"text": "y" * 400},
+        {"toolUse": {"input": {"query": "z" * 40}}},
+        {"toolResult": {"content": [{"json": {"a": 1}}, {"text": "w" * 40}]}},
+    ]
+    assert estimate_content_tokens(content) > 1100
+    assert estimate_content_tokens("hello world") == 3
+
+def test_estimate_request_fits():
+    small = estimate_request(question="Hello", system_prompt="You are helpful")
+    assert small.fits
+    assert small.context_window == 200_000
+
+    big = estimate_request(question=[{"document": {"format": "txt", "source": {"bytes": b"x" * 1_000_000}}}])
+    assert not big.fits
+    assert "input tokens" in big.summary()
+
+def test_estimate_fits_without_history():
+    estimate = estimate_request(question="Hello", messages=[{"role": "user", "content": [{"text": "x" * 1_000_000}]}])
+    assert not estimate.fits
+    assert estimate.fits_without_history
+
+def test_estimate_agent_request():
+    agent = MagicMock()
+    agent.system_prompt = "system " * 100
+    agent.tool_registry.get_all_tool_specs.return_value = [{"name": "calculator", "description": "math " * 50}]
+    agent.messages = [{"role": "user", "content": [{"text": "previous " * 100}]}]
+    agent.model.config = {"model_id": Models.CLAUDE_45}
+
+    estimate = estimate_agent_request(agent, "question")
+
+    assert estimate.system_prompt > 0
+    assert estimate.tools > 0
+    assert estimate.history > 0
+    assert estimate.question > 0
+
+def test_estimate_is_fast_on_large_documents():
+    pdf = make_pdf(400) + b"0" * 50 * 1024 * 1024
+    text = b"x" * 100 * 1024 * 1024
+    started = time.perf_counter()
+    estimate_content_tokens([
+        {"document": {"format": "pdf", "source": {"bytes": pdf}}},
+        {"document": {"format": "txt", "source": {"bytes": text}}},
+    ])
+    assert time.perf_counter() - started < 1
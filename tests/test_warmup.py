@@ -0,0 +1,35 @@
+import sys
+import os
+import subprocess
+from unittest.mock import MagicMock, patch
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from modules.warmup import warm_up
+
+SRC_DIR = os.path.join(os.path.dirname(__file__), '..', 'src')
+
+def test_heavy_tool_modules_are_imported_lazily():
+    code = ("import sys, main; "
+            "print(' '.join(m for m in ('sympy', 'strands_tools.code_interpreter', 'tools.weather.tools') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=SRC_DIR, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip() == ""
+
+@patch('modules.warmup.extraction_executor')
+@patch('modules.warmup.get_agent')
+def test_warm_up(mock_get_agent, mock_executor):
+    timings = warm_up()
+
+    assert set(timings) == {"imports", "agent", "extraction_pool"}
+    assert "sympy" in sys.modules and "tools.weather.tools" in sys.modules
+    assert mock_get_agent.call_args.kwargs["tools"][-1].tool_name == "read_pages"
+    mock_get_agent.return_value.tool_registry.get_all_tool_specs.assert_called_once()
+    assert mock_executor.submit.call_count == 2
+    mock_executor.submit.return_value.result.assert_called()
+
+@patch('modules.warmup.extraction_executor', None)
+@patch('modules.warmup.get_agent', MagicMock(side_effect=ValueError("no credentials")))
+def test_warm_up_survives_failed_steps():
+    assert set(warm_up()) == {"imports", "agent"}
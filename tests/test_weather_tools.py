@@ -0,0 +1,162 @@
+import sys
+import os
+import json
+import threading
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from math import isnan
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from tools.weather.models import MeteoData, MeteoSeries
+from tools.weather.cache import WeatherCache
+from tools.weather.tools import WeatherTools, get_http_session, get_missing_ranges
+
+def make_hourly(hours=3):
+    return {
+        "time": [f"2025-01-01T{h:02d}:00" for h in range(hours)],
+        "temperature_2m": [10.5 + h for h in range(hours)],
+        "relative_humidity_2m": [80 + h for h in range(hours)],
+        "apparent_temperature": [9.0 + h for h in range(hours)],
+        "precipitation": [0.0] * hours,
+        "evapotranspiration": [0.01] * hours,
+        "surface_pressure": [1013.2] * hours,
+    }
+
+def test_meteo_series_from_open_meteo():
+    series = MeteoSeries.from_open_meteo(make_hourly())
+
+    assert len(series) == 3
+    assert series.time[1] == datetime(2025, 1, 1, 1)
+    assert list(series.columns["temperature"]) == [10.5, 11.5, 12.5]
+    assert series._meteo_data is None
+
+def test_meteo_series_handles_missing_values():
+    hourly = make_hourly()
+    hourly["temperature_2m"][1] = None
+
+    series = MeteoSeries.from_open_meteo(hourly)
+
+    assert isnan(series.columns["temperature"][1])
+    assert len(series.meteo_data.temperature) == 2
+    assert series.to_csv().splitlines()[2] == "2025-01-01T01:00,,81,10,0,0.01,1013.2"
+
+def test_meteo_series_pydantic_view_is_lazy_and_cached():
+    series = MeteoSeries.from_open_meteo(make_hourly())
+
+    meteo = series.meteo_data
+
+    assert isinstance(meteo, MeteoData)
+    assert meteo is series.meteo_data
+    assert meteo.humidity[2].value == 82
+    assert meteo.surface_pressure[0].time == datetime(2025, 1, 1, 0)
+
+def test_meteo_series_str_is_csv():
+    lines = str(MeteoSeries.from_open_meteo(make_hourly())).splitlines()
+    assert lines[0] == "time,temperature,humidity,apparent_temperature,precipitation,evapotranspiration,surface_pressure"
+    assert lines[1] == "2025-01-01T00:00,10.5,80,9,0,0.01,1013.2"
+    assert len(lines) == 4
+
+@pytest.fixture
+def open_meteo_server():
+    requests_received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = parse_qs(urlparse(self.path).query)
+            requests_received.append(params)
+            start = date.fromisoformat(params["start_date"][0])
+            end = date.fromisoformat(params["end_date"][0])
+            hours = [datetime.combine(start, datetime.min.time()) + timedelta(hours=h)
+                     for h in range(((end - start).days + 1) * 24)]
+            hourly = {"time": [h.isoformat(timespec='minutes') for h in hours]}
+            for variable in ("temperature_2m", "relative_humidity_2m", "apparent_temperature", "precipitation",
+                             "evapotranspiration", "surface_pressure"):
+                hourly[variable] = [float(h.day) for h in hours]
+            body = json.dumps({"hourly": hourly}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/v1/forecast", requests_received
+    server.shutdown()
+
+def make_weather_tools(url, cache=None):
+    cache = cache or WeatherCache(past_ttl=3600, forecast_ttl=60, max_days=100)
+    return WeatherTools(latitude=43.3, longitude=-1.98, url=url, cache=cache, session=get_http_session(2))
+
+def test_meteo_series_concat_and_split_days():
+    hourly = make_hourly(3)
+    hourly["time"] = ["2025-01-01T22:00", "2025-01-01T23:00", "2025-01-02T00:00"]
+    series = MeteoSeries.from_open_meteo(hourly)
+
+    days = series.split_days()
+
+    assert list(days) == [date(2025, 1, 1), date(2025, 1, 2)]
+    assert len(days[date(2025, 1, 1)]) == 2
+    assert list(days[date(2025, 1, 2)].columns["temperature"]) == [12.5]
+    assert str(MeteoSeries.concat(list(days.values()))) == str(series)
+
+def test_get_missing_ranges():
+    days = [date(2025, 1, 1), date(2025, 1, 2), date(2025, 1, 5), date(2025, 1, 6), date(2025, 1, 8)]
+    assert get_missing_ranges(days) == [
+        (date(2025, 1, 1), date(2025, 1, 2)), (date(2025, 1, 5), date(2025, 1, 6)), (date(2025, 1, 8), date(2025, 1, 8))]
+
+def test_get_hourly_weather_data(open_meteo_server):
+    url, received = open_meteo_server
+    tool = make_weather_tools(url).get_tools()[0]
+
+    series = tool(from_date=date(2025, 1, 1), to_date=date(2025, 1, 2))
+
+    assert len(series) == 48
+    assert received[0]["latitude"] == ["43.3"]
+    assert received[0]["start_date"] == ["2025-01-01"]
+    assert received[0]["end_date"] == ["2025-01-02"]
+
+def test_get_hourly_series_only_fetches_missing_days(open_meteo_server):
+    url, received = open_meteo_server
+    weather = make_weather_tools(url)
+
+    weather.get_hourly_series(date(2025, 1, 3), date(2025, 1, 4))
+    series = weather.get_hourly_series(date(2025, 1, 1), date(2025, 1, 6))
+
+    assert len(received) == 3
+    assert (received[1]["start_date"], received[1]["end_date"]) == (["2025-01-01"], ["2025-01-02"])
+    assert (received[2]["start_date"], received[2]["end_date"]) == (["2025-01-05"], ["2025-01-06"])
+    assert len(series) == 6 * 24
+    assert [t.day for t in series.time[::24]] == [1, 2, 3, 4, 5, 6]
+
+    weather.get_hourly_series(date(2025, 1, 2), date(2025, 1, 5))
+    assert len(received) == 3
+
+def test_weather_cache_ttl():
+    cache = WeatherCache(past_ttl=3600, forecast_ttl=0, max_days=100)
+    series = MeteoSeries.from_open_meteo(make_hourly(1))
+    past, future = date(2000, 1, 1), date(2999, 1, 1)
+
+    cache.put(1.0, 2.0, past, series)
+    cache.put(1.0, 2.0, future, series)
+
+    assert cache.get(1.0, 2.0, past) is series
+    assert cache.get(1.0, 2.0, future) is None
+    assert cache.get(9.0, 2.0, past) is None
+
+def test_weather_cache_max_days():
+    cache = WeatherCache(past_ttl=3600, forecast_ttl=3600, max_days=2)
+    series = MeteoSeries.from_open_meteo(make_hourly(1))
+    for day in range(1, 4):
+        cache.put(1.0, 2.0, date(2025, 1, day), series)
+
+    assert len(cache) == 2
+    assert cache.get(1.0, 2.0, date(2025, 1, 1)) is None